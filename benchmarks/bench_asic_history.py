@@ -0,0 +1,85 @@
+"""Память истории доходности ASIC: массивы ProfitabilitySeries против словаря на каждую точку.
+
+Запуск: BOT_TOKEN=1:x python benchmarks/bench_asic_history.py [моделей] [дней]
+Каждый час записывается снимок всех моделей, как после слияния списка
+ASIC. Для словарей хранятся те же точки, что и в массивах (сырые за
+последние ASIC_HISTORY_RAW_RETENTION и средние за сутки до этого), в виде
+{'timestamp': ..., 'profitability': ...} в списке на модель. Память
+считается tracemalloc, выборка - /trend за 30 дней по всем моделям.
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('BOT_TOKEN', '123456:BENCH')
+
+from mining_bot import AsicMiner, Config, ProfitabilityHistory  # noqa: E402
+
+HOUR = 3600
+DAY = 86400
+START = 20000 * DAY
+
+
+def build_history(models: int, days: int) -> ProfitabilityHistory:
+    history = ProfitabilityHistory(':memory:')
+    miners = [AsicMiner(f"Antminer S{i} Pro {100 + i}Th", 1.0 + i % 50) for i in range(models)]
+    for hour in range(days * 24):
+        for miner in miners:
+            miner.profitability += 0.01
+        history.record(miners, now=START + hour * HOUR)
+    return history
+
+
+def as_dicts(history: ProfitabilityHistory) -> dict:
+    """Те же точки в прежнем виде: список словарей на модель."""
+    result = {}
+    for key, series in history.series.items():
+        points = []
+        for times, values in ((series.daily_times, series.daily_values), (series.raw_times, series.raw_values)):
+            points.extend({'timestamp': t, 'profitability': v} for t, v in zip(times, values))
+        result[key] = points
+    return result
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    value = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return value, size
+
+
+def main():
+    models = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    history = build_history(models, days)
+    now = START + days * DAY
+    points = sum(len(series) for series in history.series.values())
+
+    _, array_size = measure(lambda: {k: s for k, s in build_history(models, days).series.items()})
+    dicts, dict_size = measure(lambda: as_dicts(history))
+
+    started = time.perf_counter()
+    for series in history.series.values():
+        series.range(now - 30 * DAY, now)
+    array_query = time.perf_counter() - started
+    started = time.perf_counter()
+    for points_list in dicts.values():
+        [p for p in points_list if now - 30 * DAY <= p['timestamp'] <= now]
+    dict_query = time.perf_counter() - started
+
+    print(f"{models} моделей, {days} дней снимков раз в час, сырые точки за "
+          f"{Config.ASIC_HISTORY_RAW_RETENTION // DAY} дн.: {points} точек")
+    print(f"{'хранение':<10} {'память, КБ':>11} {'байт/точку':>11} {'/trend x' + str(models) + ', мс':>16}")
+    for title, size, query in (('массивы', array_size, array_query), ('словари', dict_size, dict_query)):
+        print(f"{title:<10} {size / 1024:11.0f} {size / points:11.1f} {query * 1000:16.1f}")
+
+
+if __name__ == '__main__':
+    main()
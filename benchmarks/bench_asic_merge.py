@@ -0,0 +1,71 @@
+"""Время слияния ASIC-майнеров: блоки AsicDeduplicator против прежнего process.extractOne.
+
+Запуск: BOT_TOKEN=1:x python benchmarks/bench_asic_merge.py [10000]
+Прежний алгоритм квадратичный, поэтому он измеряется только до 2000 майнеров.
+Он сравнивает названия из разных блоков (другой хешрейт, другое
+семейство), поэтому число уникальных моделей у него меньше. "сравнений" -
+вызовы token_set_ratio внутри блоков.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('BOT_TOKEN', '123456:BENCH')
+
+from mining_bot import AsicDeduplicator, AsicMiner, merge_asic_miners  # noqa: E402
+from test_asic_merge import reference_merge  # noqa: E402
+
+VENDORS = [('Bitmain Antminer', 'Antminer'), ('MicroBT Whatsminer', 'Whatsminer'), ('Canaan Avalon', 'Avalon'),
+           ('Goldshell', 'Goldshell'), ('Iceriver', 'IceRiver'), ('Jasminer', 'Jasminer'), ('Elphapex', 'ElphaPex')]
+SUFFIXES = ['', ' Pro', ' XP', ' Hyd', '+', '++', ' Pro+', ' Mini', 'j Pro', 'k Pro']
+REFERENCE_LIMIT = 2000
+
+
+def synthetic_miners(count: int, seed: int = 1):
+    """count майнеров; около 40% моделей есть в обоих источниках в разном написании."""
+    rnd = random.Random(seed)
+    miners = []
+    while len(miners) < count:
+        vendor, short_vendor = rnd.choice(VENDORS)
+        model = f"{rnd.choice('STLKMAEDX')}{rnd.randint(1, 999)}{rnd.choice(SUFFIXES)}"
+        hashrate = f"{rnd.randint(1, 500)}{rnd.choice(['Th', 'Gh'])}"
+        miners.append(AsicMiner(f"{vendor} {model} ({hashrate})", round(rnd.uniform(0.1, 30), 2), source='AsicMinerValue'))
+        if rnd.random() < 0.4:
+            miners.append(AsicMiner(f"{short_vendor} {model} {hashrate}", round(rnd.uniform(0.1, 30), 2), source='WhatToMine'))
+    return miners[:count]
+
+
+def timed(merge, miners):
+    started = time.perf_counter()
+    result = merge(miners)
+    return time.perf_counter() - started, len(result)
+
+
+def count_comparisons(miners) -> int:
+    dedup = AsicDeduplicator()
+    for miner in sorted(miners, key=lambda m: m.name):
+        if dedup.find(miner.name) is None:
+            dedup.add(miner.name)
+    return dedup.comparisons
+
+
+def main():
+    largest = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    sizes = [n for n in (100, 500, 1000, 2000, 5000, 10000, 20000) if n <= largest]
+    print(f"{'майнеров':>9} {'extractOne, с':>14} {'уникальных':>11} {'блоки, с':>9} {'уникальных':>11} {'сравнений':>10}")
+    for size in sizes:
+        miners = synthetic_miners(size)
+        new_time, unique = timed(merge_asic_miners, miners)
+        if size <= REFERENCE_LIMIT:
+            old_time, old_unique = timed(lambda m: reference_merge(m, blocked=False), miners)
+            old = f"{old_time:14.3f} {old_unique:>11}"
+        else:
+            old = f"{'-':>14} {'-':>11}"
+        print(f"{size:>9} {old} {new_time:9.3f} {unique:>11} {count_comparisons(miners):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Новая aiohttp.ClientSession на каждый запрос против общего пула (create_http_session).
+
+Запуск: BOT_TOKEN=1:x python benchmarks/bench_http_session.py [запросов]
+Локальный сервер считает принятые TCP-соединения. TLS и DNS здесь нет, поэтому
+в продакшене разница больше: каждый новый сеанс платит и за рукопожатие TLS.
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('BOT_TOKEN', '123456:BENCH')
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+import mining_bot  # noqa: E402
+
+
+class CountingServer:
+    """Считает соединения по адресам клиентов: у каждого TCP-соединения свой порт."""
+
+    def __init__(self):
+        self.peers = set()
+
+    @property
+    def connections(self):
+        return len(self.peers)
+
+    async def handle(self, request):
+        self.peers.add(request.transport.get_extra_info('peername'))
+        return web.json_response({'bitcoin': {'usd': 100000}})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/price', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/price"
+
+
+async def per_call_session(url):
+    """Как было: сеанс и соединение на каждый запрос."""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            return await response.json()
+
+
+async def shared_session(url):
+    async with mining_bot.get_http_session().get(url) as response:
+        return await response.json()
+
+
+def percentile(values, q):
+    return sorted(values)[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run(name, fetch, url, server, requests, concurrency):
+    before = server.connections
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await fetch(url)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    total = time.perf_counter() - started
+    print(f"{name:<22} {concurrency:>3} {statistics.median(latencies) * 1000:8.2f} {percentile(latencies, 0.99) * 1000:8.2f}"
+          f" {requests / total:9.0f} {server.connections - before:>11}")
+
+
+async def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    server = CountingServer()
+    url = await server.start()
+    mining_bot.create_http_session()
+    print(f"{'клиент':<22} {'пар':>3} {'p50, мс':>8} {'p99, мс':>8} {'запр./с':>9} {'соединений':>11}")
+    for concurrency in (1, 20):
+        await run("сеанс на запрос", per_call_session, url, server, requests, concurrency)
+        await run("общий пул", shared_session, url, server, requests, concurrency)
+    await mining_bot.close_http_session()
+    await server.runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
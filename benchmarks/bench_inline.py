@@ -0,0 +1,120 @@
+"""Задержка ответа на inline-запрос (p50/p99) и число запросов к CoinGecko при наборе.
+
+Запуск: BOT_TOKEN=1:x python benchmarks/bench_inline.py [пользователей] [монет в индексе]
+Каждый пользователь набирает тикер или название монеты по символу с
+паузами 50-250 мс, и на каждый символ приходит inline-запрос, как от
+Telegram. /coins/markets заменен заглушкой с задержкой сети 300 мс,
+индекс монет построен заранее. Задержка считается от прихода запроса до
+answer(); запросы, которые заменил следующий символ, ответа не получают.
+Сценарии: пустой кэш цен без debounce и с ним, затем тот же набор еще
+раз с кэшем цен, оставшимся от предыдущего прогона (price_cache на 100
+монет, как в боте, поэтому часть цен успевает вытесниться).
+"""
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('BOT_TOKEN', '123456:BENCH')
+
+import mining_bot  # noqa: E402
+from mining_bot import CoinIndex, Config, InlineDebouncer, PriceBatcher  # noqa: E402
+
+NETWORK_LATENCY = 0.3
+
+
+def build_index(coins: int) -> CoinIndex:
+    rnd = random.Random(0)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    listing = [{'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin'},
+               {'id': 'ethereum', 'symbol': 'eth', 'name': 'Ethereum'},
+               {'id': 'the-open-network', 'symbol': 'ton', 'name': 'Toncoin'}]
+    for i in range(coins - len(listing)):
+        name = ''.join(rnd.choice(letters) for _ in range(rnd.randint(4, 10)))
+        listing.append({'id': f"{name}-{i}", 'symbol': name[:rnd.randint(3, 4)], 'name': name.title()})
+    ranks = {coin['id']: rank for rank, coin in enumerate(listing[:1000], start=1)}
+    return CoinIndex(listing, ranks)
+
+
+def typing_plan(index: CoinIndex, users: int) -> list:
+    """(время прихода, пользователь, текст) для каждого набранного символа."""
+    rnd = random.Random(1)
+    popular = sorted(index.ranks, key=index.ranks.get)[:200]
+    plan = []
+    for user_id in range(users):
+        coin_id = rnd.choice(popular)
+        word = rnd.choice([index.symbols[coin_id], index.names[coin_id]]).lower()
+        at = rnd.uniform(0, 1.0)
+        for length in range(1, len(word) + 1):
+            plan.append((at, user_id, word[:length]))
+            at += rnd.uniform(0.05, 0.25)
+    return sorted(plan)
+
+
+async def run(plan: list, debounce: float, warm: bool) -> dict:
+    calls = []
+
+    async def fetch_coin_markets(coin_ids):
+        calls.append(len(coin_ids))
+        await asyncio.sleep(NETWORK_LATENCY)
+        return {coin_id: {'id': coin_id, 'symbol': coin_id[:3], 'name': coin_id, 'current_price': 1.0,
+                          'price_change_percentage_24h': 0.0} for coin_id in coin_ids}
+
+    mining_bot.fetch_coin_markets = fetch_coin_markets
+    mining_bot.price_batcher = PriceBatcher()
+    mining_bot.inline_debouncer = InlineDebouncer(delay=debounce)
+    if not warm:
+        mining_bot.price_cache.clear()
+
+    latencies = []
+
+    async def query(at: float, user_id: int, text: str):
+        await asyncio.sleep(max(0.0, at - (loop.time() - started)))
+        arrived = time.perf_counter()
+
+        async def answer(results, **kwargs):
+            latencies.append(time.perf_counter() - arrived)
+
+        inline_query = SimpleNamespace(id=f"{user_id}:{text}", query=text, from_user=SimpleNamespace(id=user_id),
+                                       answer=answer)
+        await mining_bot.handle_inline_query(inline_query)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await asyncio.gather(*(query(*item) for item in plan))
+    latencies.sort()
+    return {'answered': len(latencies), 'calls': len(calls), 'ids': sum(calls),
+            'p50': statistics.median(latencies), 'p99': latencies[int(len(latencies) * 0.99) - 1]}
+
+
+async def main():
+    logging.disable(logging.WARNING)
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    coins = int(sys.argv[2]) if len(sys.argv) > 2 else 15_000
+    index = build_index(coins)
+    plan = typing_plan(index, users)
+
+    async def get_coin_list():
+        return {}
+
+    mining_bot.get_coin_index = SimpleNamespace(peek=lambda: index)
+    mining_bot.get_coin_list = get_coin_list
+    print(f"{users} пользователей, {len(plan)} запросов, {len(index)} монет в индексе, "
+          f"сеть {NETWORK_LATENCY * 1000:.0f} мс, срок ответа {Config.INLINE_FETCH_DEADLINE:.0f} с")
+    print(f"{'сценарий':<22} {'ответов':>8} {'к CoinGecko':>12} {'монет':>6} {'p50, мс':>8} {'p99, мс':>8}")
+    for title, debounce, warm in (("пустой кэш, без", 0.0, False),
+                                  ("пустой кэш, debounce", Config.INLINE_DEBOUNCE, False),
+                                  ("повтор, кэш заполнен", Config.INLINE_DEBOUNCE, True)):
+        result = await run(plan, debounce, warm)
+        print(f"{title:<22} {result['answered']:8} {result['calls']:12} {result['ids']:6} "
+              f"{result['p50'] * 1000:8.1f} {result['p99'] * 1000:8.1f}")
+    await mining_bot.cancel_background_tasks()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""Задержка event loop при разборе HTML/RSS и рисовании шкалы: прямо в loop против пула CPU-задач.
+
+Запуск: BOT_TOKEN=1:x python benchmarks/bench_loop_lag.py [повторов]
+«До» повторяет прежний код: полный BeautifulSoup(html, 'lxml') по всей странице,
+feedparser и matplotlib прямо в обработчике. «После» идет через run_cpu_bound
+с SoupStrainer, в пуле потоков и в пуле процессов.
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('BOT_TOKEN', '123456:BENCH')
+
+import mining_bot  # noqa: E402
+from mining_bot import (Config, bs4, parse_asicminervalue_html, parse_rss_feed, parse_power,  # noqa: E402
+                        parse_profitability, render_fear_greed_gauge, run_cpu_bound, shutdown_cpu_executor)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'fixtures')
+SAMPLE_INTERVAL = 0.002
+
+
+def build_page(copies: int = 20) -> str:
+    """Страница размером с настоящую: таблица из fixture, размноженная, и много постороннего HTML."""
+    with open(os.path.join(FIXTURES, 'asicminervalue.html'), encoding='utf-8') as f:
+        html = f.read()
+    head, rest = html.split('<tbody>', 1)
+    rows, tail = rest.split('</tbody>', 1)
+    filler = ''.join(f'<div class="card"><a href="/n/{i}">Новость {i}</a><p>{"текст " * 40}</p></div>'
+                     for i in range(3000))
+    return f"{head}<tbody>{rows * copies}</tbody>{tail}".replace('</body>', filler + '</body>')
+
+
+def build_feed(items: int = 400) -> str:
+    entries = ''.join(
+        f'<item><title>Bitcoin news {i}</title><link>https://example.com/{i}</link><guid>{i}</guid>'
+        f'<pubDate>Mon, 06 Oct 2025 10:{i % 60:02d}:00 GMT</pubDate><description>{"text " * 80}</description></item>'
+        for i in range(items))
+    return f'<?xml version="1.0"?><rss version="2.0"><channel><title>bench</title>{entries}</channel></rss>'
+
+
+def parse_full_page(html: str):
+    """Прежний разбор: дерево строится по всей странице."""
+    soup = bs4.BeautifulSoup(html, 'lxml')
+    table = soup.find('table', {'id': 'datatable'})
+    miners = []
+    for row in table.find('tbody').find_all('tr'):
+        cols = row.find_all('td')
+        if len(cols) > 4 and cols[1].find('a'):
+            miners.append((cols[1].find('a').text.strip(), parse_profitability(cols[3].text), parse_power(cols[4].text)))
+    return miners
+
+
+async def sample_lag(stop: asyncio.Event, samples: list):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(SAMPLE_INTERVAL)
+        samples.append(max(0.0, loop.time() - started - SAMPLE_INTERVAL))
+
+
+async def measure(work, repeats: int):
+    samples, stop = [], asyncio.Event()
+    sampler = asyncio.create_task(sample_lag(stop, samples))
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        await work()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+    samples.sort()
+    return (elapsed, max(samples), samples[int(len(samples) * 0.99)], statistics.median(samples))
+
+
+async def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    page, feed = build_page(), build_feed()
+    print(f"страница {len(page) / 1e6:.1f} МБ, лента {len(feed) / 1e6:.1f} МБ, повторов {repeats}")
+
+    async def inline():
+        parse_full_page(page)
+        parse_rss_feed(feed)
+        render_fear_greed_gauge(42, 'Fear')
+
+    async def offloaded():
+        await run_cpu_bound(parse_asicminervalue_html, page)
+        await run_cpu_bound(parse_rss_feed, feed)
+        await run_cpu_bound(render_fear_greed_gauge, 42, 'Fear')
+
+    print(f"{'вариант':<22} {'всего, с':>9} {'max, мс':>8} {'p99, мс':>8} {'p50, мс':>8}")
+    variants = [('в event loop (до)', None, inline), ('пул потоков', 'thread', offloaded),
+                ('пул процессов', 'process', offloaded)]
+    for title, kind, work in variants:
+        if kind:
+            shutdown_cpu_executor()
+            Config.CPU_POOL_KIND = kind
+            await work()  # прогрев: запуск воркеров и импорт модулей в них
+        elapsed, worst, p99, p50 = await measure(work, repeats)
+        print(f"{title:<22} {elapsed:9.2f} {worst * 1000:8.1f} {p99 * 1000:8.1f} {p50 * 1000:8.1f}")
+    shutdown_cpu_executor()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""Объединение новостей в сюжеты на синтетическом корпусе: MinHash/LSH против попарного сравнения.
+
+Запуск: BOT_TOKEN=1:x python benchmarks/bench_news_dedup.py [заголовков]
+Корпус описан в synthetic_corpus. Попарное сравнение квадратичное,
+поэтому меряется до 5000 заголовков.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('BOT_TOKEN', '123456:BENCH')
+
+from mining_bot import (Config, NewsDeduplicator, cluster_news, news_title_signatures,  # noqa: E402
+                        signature_similarity)
+
+SYLLABLES = ['ба', 'ве', 'го', 'ди', 'ку', 'ла', 'мо', 'не', 'ро', 'си', 'та', 'фе', 'хо', 'че', 'шу', 'ер', 'ин', 'ок']
+TERMS = ['биткоин', 'биткоина', 'эфир', 'ETF', 'SEC', 'BTC', 'USDT', 'майнеры', 'хешрейт', 'биржа', 'курс', 'млн',
+         'Binance', 'Tether', 'токен', 'стейкинг', 'регулятор', 'халвинг', 'кошелек', 'Solana']
+ENDINGS = ['а', 'у', 'ом', 'е', 'ы', 'ов']
+
+
+def synthetic_corpus(count: int, seed: int = 1):
+    """count заголовков; truth - номер исходного сюжета для проверки качества.
+
+    Сюжет - 6-10 слов из словаря в ~20 тыс. слов и частых терминов. У сюжета
+    1-4 копии из разных лент: другое окончание слова, лишнее или пропущенное
+    слово, перестановка, пунктуация.
+    """
+    rnd = random.Random(seed)
+    vocabulary = list({''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))) for _ in range(25000)})
+    items, story = [], 0
+    while len(items) < count:
+        words = [rnd.choice(TERMS) if rnd.random() < 0.25 else rnd.choice(vocabulary)
+                 for _ in range(rnd.randint(6, 10))]
+        for copy in range(rnd.randint(1, 4)):
+            variant = list(words)
+            if copy:
+                position = rnd.randrange(len(variant))
+                edit = rnd.choice(['ending', 'insert', 'drop', 'swap'])
+                if edit == 'ending':
+                    variant[position] += rnd.choice(ENDINGS)
+                elif edit == 'insert':
+                    variant.insert(position, rnd.choice(TERMS))
+                elif edit == 'drop':
+                    del variant[position]
+                else:
+                    variant[0], variant[-1] = variant[-1], variant[0]
+            title = ' '.join(variant).capitalize() + rnd.choice(['', '', '!', ' — СМИ', ': главное'])
+            items.append({'id': f'{story}-{copy}', 'title': title, 'published': rnd.randint(0, 10 ** 6),
+                          'source': Config.NEWS_RSS_FEEDS[copy % len(Config.NEWS_RSS_FEEDS)], 'truth': story})
+        story += 1
+    return items[:count]
+
+
+def pairwise_clusters(items, signatures):
+    """Прежний подход: каждый заголовок сравнивается со всеми главными новостями сюжетов."""
+    heads, story_of = [], {}
+    for item, signature in zip(items, signatures):
+        best, best_score = None, Config.NEWS_DUPLICATE_SIMILARITY
+        for head_id, head_signature in heads:
+            score = signature_similarity(signature, head_signature)
+            if score >= best_score:
+                best, best_score = head_id, score
+        if best is None:
+            heads.append((item['id'], signature))
+            best = item['id']
+        story_of[item['id']] = best
+    return len(heads)
+
+
+def quality(items):
+    """Доля пар-копий одного сюжета, попавших в один кластер, и доля «чистых» кластеров."""
+    by_truth, by_story = {}, {}
+    for item in items:
+        by_truth.setdefault(item['truth'], set()).add(item['story'])
+        by_story.setdefault(item['story'], set()).add(item['truth'])
+    merged = sum(len(stories) == 1 for stories in by_truth.values()) / len(by_truth)
+    pure = sum(len(truths) == 1 for truths in by_story.values()) / len(by_story)
+    return merged, pure
+
+
+def main():
+    largest = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    sizes = [n for n in (1000, 5000, 20000, 50000) if n <= largest]
+    print(f"{'заголовков':>10} {'сигнатуры, с':>13} {'LSH, с':>8} {'попарно, с':>11} "
+          f"{'сюжетов':>8} {'склеено':>8} {'чистых':>7}")
+    for size in sizes:
+        items = synthetic_corpus(size)
+        started = time.perf_counter()
+        signatures = news_title_signatures([item['title'] for item in items])
+        signed = time.perf_counter() - started
+        started = time.perf_counter()
+        stories = cluster_news(items, signatures, NewsDeduplicator())
+        lsh = time.perf_counter() - started
+        if size <= 5000:
+            started = time.perf_counter()
+            pairwise_clusters(items, signatures)
+            pairwise = f"{time.perf_counter() - started:11.2f}"
+        else:
+            pairwise = f"{'-':>11}"
+        merged, pure = quality(items)
+        print(f"{size:>10} {signed:13.2f} {lsh:8.2f} {pairwise} {len(stories):>8} {merged:8.1%} {pure:7.1%}")
+
+
+if __name__ == '__main__':
+    main()
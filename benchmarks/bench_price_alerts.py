@@ -0,0 +1,77 @@
+"""Время тика PriceAlertManager на 100 тыс. оповещений.
+
+Запуск: BOT_TOKEN=1:x python benchmarks/bench_price_alerts.py [оповещений] [монет]
+Оповещения распределены по монетам, пороги - от половины до двойной
+цены (равномерно в логарифмической шкале), направление - по цене при
+создании. Цены всех монет за тик сдвигаются на заданный процент вверх
+или вниз; /coins/markets заменен заглушкой, так что измеряется только
+проверка без сети. Для каждого сдвига база создается заново, время -
+медиана нескольких повторов.
+"""
+import asyncio
+import logging
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('BOT_TOKEN', '123456:BENCH')
+
+import mining_bot  # noqa: E402
+from mining_bot import Config, PriceAlertManager  # noqa: E402
+
+REPEATS = 5
+
+
+def build_manager(alerts: int, prices: dict, seed: int) -> PriceAlertManager:
+    rnd = random.Random(seed)
+    coins = list(prices)
+    manager = PriceAlertManager(':memory:')
+    manager.open()
+    rows = []
+    for _ in range(alerts):
+        coin_id = rnd.choice(coins)
+        threshold = prices[coin_id] * math.exp(rnd.uniform(-math.log(2), math.log(2)))
+        direction = 1 if threshold > prices[coin_id] else -1
+        rows.append((rnd.randrange(1, alerts // 5), coin_id, coin_id.upper(), threshold, time.time(), direction))
+    manager._db.executemany(
+        "INSERT INTO alerts (chat_id, coin_id, symbol, threshold, created_at, direction) VALUES (?, ?, ?, ?, ?, ?)", rows)
+    manager._db.commit()
+    manager._load(manager._read())
+    return manager
+
+
+async def timed_tick(alerts: int, prices: dict, move: float, seed: int):
+    manager = build_manager(alerts, prices, seed)
+    rnd = random.Random(seed)
+    moved = {coin_id: price * (1 + move * rnd.choice((-1, 1))) for coin_id, price in prices.items()}
+
+    async def fetch_coin_markets(coin_ids):
+        return {coin_id: {'id': coin_id, 'current_price': moved[coin_id]} for coin_id in coin_ids}
+
+    mining_bot.fetch_coin_markets = fetch_coin_markets
+    started = time.perf_counter()
+    fired = await manager.tick()
+    elapsed = time.perf_counter() - started
+    manager.close()
+    return elapsed, len(fired)
+
+
+async def main():
+    logging.disable(logging.INFO)
+    alerts = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    coins = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    prices = {f"coin-{i}": 10 ** random.Random(i).uniform(-3, 5) for i in range(coins)}
+    print(f"{alerts} оповещений по {coins} монетам, бюджет тика {Config.ALERT_TICK_BUDGET * 1000:.0f} мс")
+    print(f"{'сдвиг цены':>11} {'сработало':>10} {'тик, мс':>8}")
+    for move in (0.001, 0.01, 0.1):
+        results = [await timed_tick(alerts, prices, move, seed) for seed in range(REPEATS)]
+        print(f"{move * 100:10.1f}% {statistics.median(f for _, f in results):10.0f} "
+              f"{statistics.median(t for t, _ in results) * 1000:8.1f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""Время от запуска процесса до первого ответа /asic: холодный старт против теплого (PersistentCache)
+и отложенный импорт тяжелых библиотек (LazyModule) против обычного.
+
+Запуск: BOT_TOKEN=1:x python benchmarks/bench_startup.py [повторов]
+Каждый замер - отдельный процесс Python. Источники ASIC заменены
+заглушками, которые отдают сохраненные страницы из tests/fixtures с
+задержкой сети (AsicMinerValue 2 с, WhatToMine 1 с). Холодный старт - с
+пустым каталогом данных, теплый - с постоянным кэшем, который оставил
+предыдущий процесс. Время считается от начала процесса до готового
+списка get_profitable_asics(), как для первого /asic после перезапуска.
+В режиме "сразу" процесс до mining_bot импортирует все модули, которые
+загружаются через LazyModule, как было до отложенного импорта.
+"""
+import asyncio
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+STARTED = time.perf_counter()
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures')
+LATENCY = {'AsicMinerValue': 2.0, 'WhatToMine': 1.0}
+EAGER_MODULES = ['bleach', 'bs4', 'feedparser', 'fuzzywuzzy.fuzz', 'fuzzywuzzy.process', 'fuzzywuzzy.utils',
+                 'matplotlib.backends.backend_agg', 'matplotlib.figure', 'numpy', 'openai', 'redis.asyncio']
+
+
+async def child(eager: bool):
+    sys.path.insert(0, ROOT)
+    if eager:
+        for name in EAGER_MODULES:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+    import mining_bot
+    imported = time.perf_counter()
+
+    with open(os.path.join(FIXTURES, 'asicminervalue.html'), encoding='utf-8') as f:
+        pages = {'AsicMinerValue': f.read()}
+    with open(os.path.join(FIXTURES, 'whattomine.json'), encoding='utf-8') as f:
+        pages['WhatToMine'] = json.load(f)
+
+    def stub(name):
+        async def fetch():
+            await asyncio.sleep(LATENCY[name])
+            return pages[name]
+        return fetch
+
+    for name, source in mining_bot.asic_aggregator.sources.items():
+        source.fetch = stub(name)
+
+    mining_bot.open_persistent_cache()
+    restored = mining_bot.restore_persistent_caches()
+    miners = await mining_bot.get_profitable_asics()
+    answered = time.perf_counter()
+    await mining_bot.cancel_background_tasks()
+    await mining_bot.close_persistent_cache()
+    print(json.dumps({'import': imported - STARTED, 'first_answer': answered - STARTED,
+                      'restored': restored, 'miners': len(miners)}))
+
+
+def run(data_dir: str, eager: bool) -> dict:
+    env = dict(os.environ, DATA_DIR=data_dir, BOT_TOKEN=os.environ.get('BOT_TOKEN', '123456:BENCH'))
+    for name in ('REDIS_URL', 'WEBHOOK_URL', 'METRICS_PORT', 'STARTUP_PROFILE', 'OPENAI_API_KEY'):
+        env.pop(name, None)
+    started = time.perf_counter()
+    command = [sys.executable, os.path.abspath(__file__), '--child'] + (['--eager'] if eager else [])
+    output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process'] = time.perf_counter() - started
+    return result
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'старт':<10} {'импорт':<9} {'импорт, с':>10} {'первый /asic, с':>16} {'процесс, с':>11}")
+    for eager in (False, True):
+        cold, warm = [], []
+        for _ in range(repeats):
+            with tempfile.TemporaryDirectory(prefix='bench_startup_') as data_dir:
+                cold.append(run(data_dir, eager))
+                warm.append(run(data_dir, eager))
+                assert warm[-1]['restored'] > 0 and warm[-1]['miners'] == cold[-1]['miners']
+        for title, results in (('холодный', cold), ('теплый', warm)):
+            print(f"{title:<10} {'сразу' if eager else 'отложен':<9} "
+                  f"{statistics.median(r['import'] for r in results):10.2f} "
+                  f"{statistics.median(r['first_answer'] for r in results):16.2f} "
+                  f"{statistics.median(r['process'] for r in results):11.2f}")
+
+
+if __name__ == '__main__':
+    if '--child' in sys.argv:
+        asyncio.run(child('--eager' in sys.argv))
+    else:
+        main()
@@ -0,0 +1,148 @@
+"""Задержка доставки обновления до обработчика: вебхук (WebhookServer) против long polling.
+
+Запуск: BOT_TOKEN=1:x python benchmarks/bench_webhook.py [обновлений]
+Локальная заглушка Bot API отдает getUpdates с длинным ожиданием; сеть до
+Telegram имитируется задержкой RTT/2 в каждую сторону. В режиме вебхука
+«Telegram» отправляет POST через те же RTT/2. Обновления приходят с
+интервалом 20 мс, задержка считается от появления обновления до вызова
+обработчика.
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('BOT_TOKEN', '123456:BENCH')
+
+import aiohttp  # noqa: E402
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.types import Message  # noqa: E402
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+from mining_bot import Config, WebhookServer  # noqa: E402
+
+TOKEN = '123456:BENCH'
+INTERVAL = 0.02
+
+
+def make_update(update_id: int) -> dict:
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 1760700000, 'text': 'btc',
+        'chat': {'id': 1, 'type': 'private'}, 'from': {'id': 1, 'is_bot': False, 'first_name': 'Bench'}}}
+
+
+class FakeBotApi:
+    """getMe и getUpdates с длинным ожиданием, как у api.telegram.org."""
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.pending = []
+        self.arrived = asyncio.Event()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.rtt / 2)  # запрос идет до Telegram
+        method = request.match_info['method']
+        if method == 'getMe':
+            result = {'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        elif method == 'getUpdates':
+            form = await request.post()
+            offset, timeout = int(form.get('offset') or 0), float(form.get('timeout') or 0)
+            self.pending = [u for u in self.pending if u['update_id'] >= offset]
+            if not self.pending:
+                self.arrived.clear()
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            result = list(self.pending)
+        else:
+            result = True
+        await asyncio.sleep(self.rtt / 2)  # ответ идет обратно
+        return web.json_response({'ok': True, 'result': result})
+
+    def push(self, update: dict):
+        self.pending.append(update)
+        self.arrived.set()
+
+
+def recording_dispatcher(injected: dict, latencies: list, expected: int, done: asyncio.Event) -> Dispatcher:
+    dispatcher = Dispatcher()
+
+    @dispatcher.message()
+    async def on_message(message: Message):
+        latencies.append(time.perf_counter() - injected[message.message_id])
+        if len(latencies) == expected:
+            done.set()
+
+    return dispatcher
+
+
+async def run_polling(count: int, rtt: float) -> list:
+    api = FakeBotApi(rtt)
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', api.handle)
+    server = TestServer(app, host='127.0.0.1')
+    await server.start_server()
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(str(server.make_url('')).rstrip('/'))))
+    injected, latencies, done = {}, [], asyncio.Event()
+    dispatcher = recording_dispatcher(injected, latencies, count, done)
+    polling = asyncio.create_task(dispatcher.start_polling(bot, handle_signals=False, polling_timeout=10))
+    await asyncio.sleep(0.3 + rtt)
+    for update_id in range(1, count + 1):
+        injected[update_id] = time.perf_counter()
+        api.push(make_update(update_id))
+        await asyncio.sleep(INTERVAL)
+    await asyncio.wait_for(done.wait(), 30)
+    await dispatcher.stop_polling()
+    await asyncio.gather(polling, return_exceptions=True)
+    await bot.session.close()
+    await server.close()
+    return latencies
+
+
+async def run_webhook(count: int, rtt: float) -> list:
+    bot = Bot(TOKEN)
+    injected, latencies, done = {}, [], asyncio.Event()
+    webhook = WebhookServer(bot, recording_dispatcher(injected, latencies, count, done), secret_token='bench')
+    server = TestServer(webhook.create_app(), host='127.0.0.1')
+    await server.start_server()
+    url = str(server.make_url(Config.WEBHOOK_PATH))
+    async with aiohttp.ClientSession() as telegram:
+
+        async def deliver(update_id: int):
+            injected[update_id] = time.perf_counter()
+            await asyncio.sleep(rtt / 2)  # POST идет от Telegram
+            async with telegram.post(url, json=make_update(update_id),
+                                     headers={'X-Telegram-Bot-Api-Secret-Token': 'bench'}) as response:
+                assert response.status == 200
+
+        deliveries = []
+        for update_id in range(1, count + 1):
+            deliveries.append(asyncio.create_task(deliver(update_id)))
+            await asyncio.sleep(INTERVAL)
+        await asyncio.gather(*deliveries)
+        await asyncio.wait_for(done.wait(), 30)
+    await webhook.drain()
+    await server.close()
+    await bot.session.close()
+    return latencies
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"{'режим':<10} {'RTT, мс':>8} {'p50, мс':>8} {'p99, мс':>8} {'max, мс':>8}")
+    for rtt in (0.0, 0.1):
+        for title, run in (('polling', run_polling), ('webhook', run_webhook)):
+            latencies = sorted(await run(count, rtt))
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"{title:<10} {rtt * 1000:8.0f} {statistics.median(latencies) * 1000:8.1f} "
+                  f"{p99 * 1000:8.1f} {latencies[-1] * 1000:8.1f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -4,34 +4,161 @@
 # 1. ИМПОРТЫ И НАЧАЛЬНАЯ НАСТРОЙКА
 # ==============================================================================
 import asyncio
+import builtins
+import importlib
 import logging
 import os
+import sys
 import random
 import re
 import json
 import io
-from datetime import datetime, timedelta
-from dataclasses import dataclass, field
-from typing import List, Dict, Optional, Any, Tuple
+import functools
+import time
+import threading
+import bisect
+import itertools
+import pickle
+import sqlite3
+import signal
+import socket
+import calendar
+import hmac
+import hashlib
+import operator
+import struct
+from abc import ABC, abstractmethod
+from array import array
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import List, Dict, Optional, Any, Tuple, Callable, Hashable, Iterable, Set, Mapping
+from urllib.parse import urlsplit
+from email.utils import parsedate_to_datetime
+
+PROCESS_STARTED_AT = time.monotonic()  # Для замера времени до первого обработанного обновления
+
+
+class ImportProfiler:
+    """Замер времени импорта модулей для режима STARTUP_PROFILE=1.
+
+    Подменяет builtins.__import__ и засекает каждый впервые импортируемый
+    модуль верхнего уровня (вложенные импорты входят в его время). Модули,
+    загружаемые через LazyModule, записываются отдельно при первом
+    обращении.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.times: Dict[str, float] = {}
+        self._original_import = builtins.__import__
+        self._local = threading.local()
+
+    def install(self):
+        self.enabled = True
+        builtins.__import__ = self._import
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules or getattr(self._local, 'active', False):
+            return self._original_import(name, globals, locals, fromlist, level)
+        return self._timed(name, self._original_import, name, globals, locals, fromlist, level)
+
+    def import_module(self, name: str):
+        """importlib.import_module с замером времени (для LazyModule)."""
+        if not self.enabled or getattr(self._local, 'active', False):
+            return importlib.import_module(name)
+        return self._timed(name, importlib.import_module, name)
+
+    def _timed(self, name: str, func: Callable, *args):
+        self._local.active = True
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self._local.active = False
+            elapsed = time.perf_counter() - started
+            self.times[name] = self.times.get(name, 0.0) + elapsed
+
+    def report(self, limit: int = 15) -> str:
+        slowest = sorted(self.times.items(), key=lambda item: item[1], reverse=True)[:limit]
+        lines = [f"Профиль запуска: импорт модулей занял {sum(self.times.values()) * 1000:.0f} мс"]
+        lines += [f"  {name}: {seconds * 1000:.1f} мс" for name, seconds in slowest]
+        return "\n".join(lines)
+
+
+import_profiler = ImportProfiler()
+if os.getenv("STARTUP_PROFILE") == "1":
+    import_profiler.install()
+
+
+class LazyModule:
+    """Модуль, который импортируется при первом обращении к его атрибуту.
+
+    После загрузки атрибуты модуля копируются в объект, и дальнейшие
+    обращения не отличаются по скорости от обычного модуля.
+    """
+
+    def __init__(self, name: str):
+        self.__dict__['_name'] = name
+
+    def _load(self):
+        module = sys.modules.get(self._name)
+        if module is None:
+            module = import_profiler.import_module(self._name)
+            if import_profiler.enabled:
+                logging.getLogger(__name__).info(f"Модуль {self._name} загружен по требованию за "
+                                                 f"{import_profiler.times.get(self._name, 0.0) * 1000:.1f} мс.")
+        self.__dict__.update(module.__dict__)
+        return module
+
+    def __getattr__(self, attr: str):
+        # Вызывается, только пока атрибута нет в __dict__, то есть до загрузки
+        return getattr(self._load(), attr)
+
+
+def preload_modules(*modules: LazyModule):
+    """Загружает отложенные модули заранее, например в фоновом потоке."""
+    for module in modules:
+        try:
+            module._load()
+        except ImportError as e:
+            logging.getLogger(__name__).warning(f"Не удалось загрузить модуль {module._name}: {e}")
+
 
 # Сторонние библиотеки
 import aiohttp
-import feedparser
-import bleach
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import CommandStart, Command
-from aiogram.types import Message, CallbackQuery, ForceReply
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot, Dispatcher, types, F
+from aiogram.filters import CommandStart, Command, CommandObject
+from aiogram.types import Message, CallbackQuery, ForceReply, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramMigrateToChat, TelegramNetworkError,
+    TelegramNotFound, TelegramRetryAfter, TelegramServerError,
+)
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from bs4 import BeautifulSoup
-from cachetools import TTLCache, AIOK, async_cached
+from cachetools import Cache, TTLCache, LRUCache
+from cachetools.keys import hashkey
 from dotenv import load_dotenv
-from fuzzywuzzy import process, fuzz
-from openai import AsyncOpenAI
+
+# Тяжелые библиотеки загружаются при первом использовании, а не при старте
+bleach = LazyModule('bleach')
+bs4 = LazyModule('bs4')
+feedparser = LazyModule('feedparser')
+fuzz = LazyModule('fuzzywuzzy.fuzz')
+process = LazyModule('fuzzywuzzy.process')
+fuzz_utils = LazyModule('fuzzywuzzy.utils')
+mpl_agg = LazyModule('matplotlib.backends.backend_agg')
+mpl_figure = LazyModule('matplotlib.figure')
+np = LazyModule('numpy')
+openai = LazyModule('openai')
+# Необязательная зависимость: нужна только при заданном REDIS_URL
+aioredis = LazyModule('redis.asyncio')
+redis_exceptions = LazyModule('redis.exceptions')
 
 # ==============================================================================
 # 2. КОНФИГУРАЦИЯ И КОНСТАНТЫ
@@ -43,7 +170,13 @@ from openai import AsyncOpenAI
 # OPENAI_API_KEY="sk-..."
 # ADMIN_CHAT_ID="12345678"
 # NEWS_CHAT_ID="-10012345678"
+# NETWORK_ALERTS_CHAT_ID="-10012345679"
 # WEBHOOK_URL="https://your-app-name.onrender.com"
+# WEBHOOK_SECRET="длинная-случайная-строка"
+# PORT="8080"
+# Несколько реплик за одним вебхуком:
+# REDIS_URL="redis://localhost:6379/0"
+# SHARED_DATA_DIR="1"  # DATA_DIR - общий том всех реплик (оповещения, подписчики, викторина)
 
 load_dotenv()
 
@@ -65,6 +198,7 @@ class AsicMiner:
     hashrate: Optional[str] = None
     power: Optional[int] = None  # в Ваттах
     source: Optional[str] = None
+    price: Optional[float] = None  # Цена устройства в USD, если источник ее сообщает
 
 @dataclass
 class CryptoCoin:
@@ -76,6 +210,36 @@ class CryptoCoin:
     algorithm: Optional[str] = None
     price_change_24h: Optional[float] = None
 
+@dataclass
+class PriceAlert:
+    """Оповещение о пересечении ценой порога (в USD)."""
+    id: int
+    chat_id: int
+    coin_id: str
+    symbol: str
+    threshold: float
+    created_at: float
+    direction: int  # 1 - ждем роста цены до порога, -1 - падения; по цене на момент создания
+
+@dataclass
+class QuizPoll:
+    """Отправленный опрос викторины: чат, правильный ответ и кто уже ответил."""
+    chat_id: int
+    correct_option: int
+    answered: Set[int] = field(default_factory=set)
+
+@dataclass
+class HostPolicy:
+    """Политика запросов к одному внешнему хосту."""
+    rate: Optional[float] = None  # Запросов в секунду (None — без ограничения)
+    burst: int = 5  # Емкость корзины токенов
+    timeout: float = 15  # секунды на одну попытку
+    retries: int = 2  # Повторы при 429, 5xx, тайм-аутах и сетевых ошибках
+    backoff_base: float = 0.5  # секунды
+    backoff_max: float = 8  # Более долгий Retry-After не ждем, а сразу отказываем
+    breaker_threshold: int = 5  # Подряд неудачных запросов до размыкания
+    breaker_reset: float = 60  # Сколько секунд хост считается недоступным
+
 
 # --- Основной класс конфигурации ---
 class Config:
@@ -83,10 +247,20 @@ class Config:
     # --- Ключи API и токены ---
     BOT_TOKEN = os.getenv("BOT_TOKEN")
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # Другой сервер OpenAI API, например локальная заглушка
     ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID")
     NEWS_CHAT_ID = os.getenv("NEWS_CHAT_ID")
+    NETWORK_ALERTS_CHAT_ID = os.getenv("NETWORK_ALERTS_CHAT_ID")  # Новые блоки и всплески комиссий BTC
+    BOT_API_URL = os.getenv("BOT_API_URL")  # Свой сервер Bot API, например локальный для проверки рассылки
     WEBHOOK_URL = os.getenv("WEBHOOK_URL")
 
+    # --- Настройки вебхука ---
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+    WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+    WEBAPP_PORT = int(os.getenv("PORT", "8080"))
+    WEBHOOK_SHUTDOWN_TIMEOUT = 10  # Сколько ждать обработки уже принятых обновлений при остановке, с
+
     # --- Настройки планировщика и новостей ---
     NEWS_RSS_FEEDS = [
         "https://forklog.com/feed",
@@ -96,11 +270,201 @@ class Config:
         "https://cointelegraph.com/rss/tag/russia"
     ]
     NEWS_INTERVAL_HOURS = 3
+    NEWS_TOP_COUNT = 5  # Сколько новостей показывать и отправлять за раз
+    NEWS_SEEN_LIMIT = 5000  # Сколько GUID/ссылок помнить для отсева уже обработанных
+    NEWS_RECENT_LIMIT = 200  # Сколько последних новостей хранить
+    NEWS_STATE_FILE = "news_state.json"
+    NEWS_STEM_LENGTH = 6  # До скольких символов обрезать слова заголовка при сравнении
+    NEWS_MINHASH_PERMUTATIONS = 64
+    NEWS_LSH_BANDS = 16  # 16 полос по 4 значения: кандидатами становятся заголовки с сходством от ~0.5
+    NEWS_DUPLICATE_SIMILARITY = 0.5  # Минимальная оценка сходства для одного сюжета
+
+    # --- Настройки HTTP-клиента ---
+    # Один пул соединений на всё время жизни приложения: keep-alive и DNS-кэш
+    # избавляют повторные запросы от лишних рукопожатий TCP/TLS.
+    HTTP_DEFAULT_TIMEOUT = 15  # секунды
+    HTTP_LIMIT = int(os.getenv("HTTP_LIMIT", "100"))
+    HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "10"))
+    HTTP_DNS_CACHE_TTL = 300  # секунды
+    HTTP_KEEPALIVE_TIMEOUT = 60  # секунды
+    HTTP_ENABLE_BROTLI = os.getenv("HTTP_ENABLE_BROTLI", "1") == "1"
+
+    # --- Политики внешних хостов: лимит запросов, повторы, автомат отключения ---
+    # Пока хост недоступен, запросы к нему сразу отклоняются, а обработчики
+    # получают последнее удачное значение из кэша.
+    HOST_POLICIES: Dict[str, HostPolicy] = {
+        'api.coingecko.com': HostPolicy(rate=0.5, burst=5, timeout=10),  # Бесплатный тариф: ~30 запросов/мин
+        'mempool.space': HostPolicy(rate=5, burst=10, timeout=10),  # Только запасной HTTP-путь, основной — WebSocket
+        'api.alternative.me': HostPolicy(rate=1, timeout=10),
+        'www.asicminervalue.com': HostPolicy(rate=0.2, burst=2, timeout=20, retries=1),
+        'whattomine.com': HostPolicy(rate=0.5, burst=2, timeout=15, retries=1),
+        'api.minerstat.com': HostPolicy(rate=0.5, burst=2, timeout=15),
+        'www.cbr-xml-daily.ru': HostPolicy(rate=0.5, burst=2, timeout=10),
+    }
+    DEFAULT_HOST_POLICY = HostPolicy(timeout=HTTP_DEFAULT_TIMEOUT)
+
+    # --- Настройки кэша (stale-while-revalidate) ---
+    ASIC_CACHE_REFRESH = 3600  # секунды; у каждого источника ASIC может быть свое расписание
+    ASIC_CACHE_MAX_STALE = 6 * 3600
+    ASIC_SOURCE_DEADLINE = 8  # Сколько ждать источник без готового снимка, прежде чем собрать список без него
+    # Производитель модели по серии или бренду; источники пишут то "Bitmain Antminer", то просто "Antminer"
+    ASIC_VENDOR_ALIASES = {
+        'bitmain': 'bitmain', 'antminer': 'bitmain', 'microbt': 'microbt', 'whatsminer': 'microbt',
+        'canaan': 'canaan', 'avalon': 'canaan', 'avalonminer': 'canaan', 'goldshell': 'goldshell',
+        'iceriver': 'iceriver', 'jasminer': 'jasminer', 'elphapex': 'elphapex', 'auradine': 'auradine',
+        'teraflux': 'auradine', 'innosilicon': 'innosilicon', 'bombax': 'bombax', 'ipollo': 'ipollo',
+    }
+    COIN_LIST_CACHE_REFRESH = 86400
+    COIN_LIST_CACHE_MAX_STALE = 3 * 86400
+    PRICE_CACHE_REFRESH = 300
+    PRICE_CACHE_MAX_STALE = 900
+    CACHE_REFRESH_INTERVAL = 60  # Как часто планировщик проверяет устаревающие записи
+
+    # --- Поток состояния сети Bitcoin (mempool.space WebSocket) ---
+    MEMPOOL_WS_URL = os.getenv("MEMPOOL_WS_URL", "wss://mempool.space/api/v1/ws")
+    MEMPOOL_API_URL = os.getenv("MEMPOOL_API_URL", "https://mempool.space/api")  # Запасной путь, пока поток недоступен
+    MEMPOOL_WS_IDLE_TIMEOUT = 90  # Без сообщений дольше этого соединение считается зависшим, с
+    MEMPOOL_WS_PING_INTERVAL = 30  # секунды
+    MEMPOOL_WS_BACKOFF_BASE = 1  # секунды
+    MEMPOOL_WS_BACKOFF_MAX = 120
+    NETWORK_STATE_MAX_STALE = 60  # Сколько отдавать данные, полученные по HTTP, без повторного запроса, с
+    BTC_HALVING_INTERVAL = 210_000  # блоков
+    FEE_SPIKE_RATIO = 2.0  # Во сколько раз быстрая комиссия должна превысить среднюю
+    FEE_SPIKE_MIN = 20  # sat/vB; ниже этого всплески не интересны
+    FEE_SPIKE_COOLDOWN = 3600  # Не чаще одного оповещения о комиссиях в час
+    FEE_BASELINE_ALPHA = 0.01  # Сглаживание средней комиссии (обновления приходят раз в несколько секунд)
+
+    # --- Общий кэш и координация реплик ---
+    # Без REDIS_URL кэш, блокировки и лидерство остаются в памяти процесса (одна реплика)
+    REDIS_URL = os.getenv("REDIS_URL")
+    # Оповещения, подписчики и опросы викторины хранятся в SQLite в DATA_DIR. С REDIS_URL бот
+    # запускается, только если DATA_DIR общий для всех реплик: один том на одном хосте
+    # (блокировки SQLite по сети, например на NFS, ненадежны). Изменения других реплик
+    # подхватываются по PRAGMA data_version.
+    SHARED_DATA_DIR = os.getenv("SHARED_DATA_DIR", "0") == "1"
+    REDIS_KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "mining_bot:")
+    REDIS_TIMEOUT = 5  # секунды
+    REPLICA_ID = os.getenv("REPLICA_ID") or f"{socket.gethostname()}:{os.getpid()}"
+    SHARED_LOCK_TTL = 60  # Блокировка упавшей реплики освобождается сама
+    SHARED_LOCK_WAIT = 30  # Дольше ждать другую реплику нет смысла: запрашиваем источник сами
+    SHARED_LOCK_POLL = 0.2  # секунды
+    LEADER_LEASE_TTL = 30  # секунды
+    LEADER_RENEW_INTERVAL = 10  # Должно быть заметно меньше LEADER_LEASE_TTL
+
+    # --- Хранение данных на диске ---
+    DATA_DIR = os.getenv("DATA_DIR", "data")
+    # Постоянный кэш: после перезапуска бот сразу отвечает данными с диска и обновляет их в фоне
+    PERSISTENT_CACHE_ENABLED = os.getenv("PERSISTENT_CACHE", "1") == "1"
+    PERSISTENT_CACHE_FILE = "cache.sqlite3"
+    PERSISTENT_CACHE_FLUSH_INTERVAL = 5  # секунды
+    PERSISTENT_CACHE_RETENTION = 30 * 86400  # Более старые записи удаляются при открытии
+
+    # --- Вынос CPU-нагрузки из event loop ---
+    # Парсинг HTML/RSS, слияние ASIC и отрисовка графиков выполняются в пуле,
+    # чтобы не задерживать обработку обновлений других пользователей.
+    CPU_POOL_KIND = os.getenv("CPU_POOL_KIND", "thread")  # "thread" или "process"
+    CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", "2"))
+    LOOP_LAG_CHECK_INTERVAL = 0.5  # секунды
+    LOOP_LAG_WARNING = 0.2  # Задержка event loop, о которой стоит предупредить
+
+    # --- Метрики Prometheus ---
+    # Локальный эндпоинт /metrics; 0 — выключен
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+    METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # секунды
+    METRICS_JOB_BUCKETS = (0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+    METRICS_LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+    # --- Кэш изображений индекса страха и жадности ---
+    # Индекс принимает одно из 101 значений, поэтому готовые PNG почти всегда в кэше
+    FEAR_GREED_IMAGE_CACHE_SIZE = 128
 
     # --- Алиасы и популярные тикеры ---
-    TICKER_ALIASES = {'бтк': 'BTC', 'биткоин': 'BTC', 'биток': 'BTC', 'eth': 'ETH', 'эфир': 'ETH', 'эфириум': 'ETH'}
+    TICKER_ALIASES = {
+        'бтк': 'BTC', 'биткоин': 'BTC', 'биток': 'BTC', 'eth': 'ETH', 'эфир': 'ETH', 'эфириум': 'ETH',
+        'солана': 'SOL', 'тон': 'TON', 'тонкоин': 'TON', 'каспа': 'KAS', 'лайткоин': 'LTC', 'лайт': 'LTC',
+        'догикоин': 'DOGE', 'доги': 'DOGE', 'рипл': 'XRP', 'тезер': 'USDT', 'монеро': 'XMR',
+    }
     POPULAR_TICKERS = ['BTC', 'ETH', 'SOL', 'TON', 'KAS']
 
+    # --- Локальный индекс монет ---
+    # Запросы к курсу разрешаются в id CoinGecko без обращения к /search
+    COIN_INDEX_REFRESH = 6 * 3600  # секунды
+    COIN_INDEX_MAX_STALE = 7 * 86400
+    COIN_INDEX_RANKED_PAGES = 2  # Страниц по 250 монет с рейтингом капитализации для выбора среди одинаковых тикеров
+    COIN_QUERY_MAX_LENGTH = 40  # Более длинный текст не считается запросом курса
+    # Обычное сообщение в чате считается запросом курса, только если это алиас, тикер монеты
+    # из первых N по капитализации или тикер с префиксом $: в полном списке есть "ok", "hi", "cat"...
+    COIN_CHAT_MAX_RANK = 100
+    COIN_FUZZY_SCORE = 85
+
+    # --- Inline-режим (@bot btc) ---
+    # Запросы приходят на каждое нажатие клавиши: ответы из кэша цен сразу,
+    # а запрос к сети — только если пользователь перестал печатать
+    INLINE_RESULTS_LIMIT = 8
+    INLINE_DEBOUNCE = 0.4  # секунды
+    INLINE_FETCH_DEADLINE = 2.0  # Сколько ждать недостающие цены; Telegram ждет ответ не дольше 10 с
+    INLINE_CACHE_TIME = 60  # Сколько Telegram кэширует ответ, если все цены были в кэше, с
+    INLINE_PARTIAL_CACHE_TIME = 5  # ... если часть цен не успела загрузиться
+
+    # --- Пакетные запросы цен ---
+    # Одновременные запросы цен собираются за короткое окно в один вызов /coins/markets
+    PRICE_BATCH_WINDOW = 0.05  # секунды
+    PRICE_BATCH_MAX_IDS = 250  # Максимум ids в одном запросе CoinGecko
+    PRICE_PREFETCH_INTERVAL = 240  # секунды; меньше PRICE_CACHE_REFRESH, чтобы кнопки не ждали сеть
+
+    # --- История доходности ASIC ---
+    ASIC_HISTORY_FILE = "asic_history.sqlite3"
+    ASIC_HISTORY_MIN_INTERVAL = 1800  # Точки записываются не чаще, секунды
+    ASIC_HISTORY_RAW_RETENTION = 7 * 86400  # Столько хранятся все точки, дальше - среднее за сутки
+    ASIC_HISTORY_RETENTION = 365 * 86400
+    ASIC_HISTORY_DEFAULT_DAYS = 30
+    ASIC_HISTORY_MATCH_SCORE = 80
+
+    # --- Рассылка подписчикам ---
+    # Лимиты Telegram: около 30 сообщений в секунду на бота и 20 в минуту в одну группу
+    BROADCAST_FILE = "broadcast.sqlite3"
+    BROADCAST_GLOBAL_RATE = 25  # сообщений в секунду, с запасом до лимита
+    BROADCAST_GLOBAL_BURST = 25
+    BROADCAST_GROUP_RATE = (20 / 60, 3)  # (сообщений в секунду, запас) для групп и каналов
+    BROADCAST_PRIVATE_RATE = (1, 1)  # для личных чатов
+    BROADCAST_CHAT_BUCKETS = 100_000  # Корзины скольких чатов держать в памяти
+    BROADCAST_CONCURRENCY = 20
+    BROADCAST_MAX_ATTEMPTS = 3  # Для временных ошибок сети и сервера
+    BROADCAST_MAX_RETRY_AFTER = 5  # Сколько раз ждать по RetryAfter одно сообщение, прежде чем отказаться
+    BROADCAST_BACKOFF_BASE = 0.5  # секунды
+    BROADCAST_BACKOFF_MAX = 8
+    BROADCAST_CHECKPOINT_EVERY = 100  # Доставок между сохранениями прогресса
+
+    # --- Ценовые оповещения ---
+    ALERTS_FILE = "alerts.sqlite3"
+    ALERT_CHECK_INTERVAL = 60  # секунды между тиками проверки
+    ALERT_TICK_BUDGET = 0.05  # секунды на проверку без учета сети; дольше - предупреждение в лог
+    ALERTS_PER_CHAT = 20
+
+    # --- Викторина ---
+    QUIZ_MODEL = "gpt-4o"
+    QUIZ_POOL_FILE = "quiz_pool.json"
+    QUIZ_POOL_TARGET = 30  # До скольких вопросов пополнять пул
+    QUIZ_POOL_LOW_WATER = 10  # При меньшем числе вопросов пул пополняется в фоне
+    QUIZ_BATCH_SIZE = 10  # Вопросов за один запрос к OpenAI
+    QUIZ_AVOID_IN_PROMPT = 20  # Сколько вопросов из пула перечислить в запросе, чтобы GPT их не повторял
+    QUIZ_SEEN_LIMIT = 2000  # Сколько выданных вопросов помнить для отсева повторов
+    QUIZ_RESULTS_FILE = "quiz_results.sqlite3"
+    QUIZ_POLLS_CACHE_SIZE = 10_000  # Сколько отправленных опросов помнить для проверки ответов
+    QUIZ_POLL_TTL = 7 * 86400  # Ответы на более старые опросы не засчитываются
+    QUIZ_FLUSH_INTERVAL = 5  # секунды между сбросами ответов в SQLite
+    QUIZ_FLUSH_BATCH = 500  # Ответов в буфере, при которых сброс выполняется сразу
+    QUIZ_TOP_COUNT = 10
+
+    # --- Калькулятор доходности ---
+    USD_RUB_RATE_URL = "https://www.cbr-xml-daily.ru/daily_json.js"  # Официальный курс ЦБ РФ
+    USD_RUB_CACHE_REFRESH = 3600  # секунды
+    USD_RUB_CACHE_MAX_STALE = 3 * 86400
+    USD_RUB_FALLBACK_RATE = 90.0  # Используется, только если курс ни разу не удалось получить
+    CALCULATOR_TOP_COUNT = 10
+    CALCULATOR_RANGE_STEPS = 6  # Сколько тарифов показывать для диапазона "3-6"
+
     # --- Аварийный список ASIC ---
     # Используется, если ни один источник данных не доступен
     FALLBACK_ASICS: List[Dict[str, Any]] = [
@@ -115,21 +479,777 @@ class Config:
 if not Config.BOT_TOKEN:
     logger.critical("Критическая ошибка: BOT_TOKEN не установлен. Проверьте ваш .env файл.")
     exit()
+if Config.REDIS_URL and not Config.SHARED_DATA_DIR:
+    # Оповещения, подписчики и опросы в SQLite отдельной реплики не видны остальным
+    logger.critical("Критическая ошибка: с REDIS_URL (несколько реплик) DATA_DIR должен быть общим томом "
+                    "всех реплик. Подключите его и задайте SHARED_DATA_DIR=1.")
+    exit()
 
-bot = Bot(token=Config.BOT_TOKEN, parse_mode='HTML')
+bot_session = AiohttpSession(api=TelegramAPIServer.from_base(Config.BOT_API_URL)) if Config.BOT_API_URL else None
+bot = Bot(token=Config.BOT_TOKEN, session=bot_session, default=DefaultBotProperties(parse_mode='HTML'))
 dp = Dispatcher()
 scheduler = AsyncIOScheduler(timezone="UTC")
-openai_client = AsyncOpenAI(api_key=Config.OPENAI_API_KEY) if Config.OPENAI_API_KEY else None
+openai_client = None  # Создается при первом запросе к OpenAI (get_openai_client)
+http_session: Optional[aiohttp.ClientSession] = None  # Общий HTTP-клиент, создается в main()
+cpu_executor: Optional[Executor] = None  # Пул для CPU-нагрузки, создается в main()
+
+def get_openai_client():
+    """Клиент OpenAI или None без ключа. Библиотека openai импортируется при первом вызове."""
+    global openai_client
+    if openai_client is None and Config.OPENAI_API_KEY:
+        openai_client = openai.AsyncOpenAI(api_key=Config.OPENAI_API_KEY, base_url=Config.OPENAI_BASE_URL)
+    return openai_client
+
+
+# --- Метрики в формате Prometheus ---
+# Запись метрики — одно обращение к словарю, поэтому ее можно вызывать на
+# горячем пути; текст для Prometheus собирается только при запросе /metrics.
+metrics_registry: List['Metric'] = []
+# Функции, которые обновляют вычисляемые метрики (размеры кэшей, лидерство) перед выдачей
+metrics_collectors: List[Callable[[], None]] = []
+
+
+def escape_label_value(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metric:
+    """Метрика с набором меток; значения хранятся по кортежу значений меток."""
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        metrics_registry.append(self)
+
+    def _labels(self, values: tuple, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{escape_label_value(v)}"' for k, v in pairs) + '}'
+
+    def samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[tuple, float] = defaultdict(float)
+
+    def inc(self, *labels, amount: float = 1.0):
+        self.values[labels] += amount
+
+    def samples(self) -> Iterable[str]:
+        return (f"{self.name}{self._labels(labels)} {value}" for labels, value in list(self.values.items()))
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[tuple, float] = {}
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    def samples(self) -> Iterable[str]:
+        return (f"{self.name}{self._labels(labels)} {value}" for labels, value in list(self.values.items()))
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными границами: observe — bisect и два сложения."""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = Config.METRICS_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts: Dict[tuple, List[int]] = {}
+        self.sums: Dict[tuple, float] = defaultdict(float)
+
+    def observe(self, value: float, *labels):
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def samples(self) -> Iterable[str]:
+        for labels, counts in list(self.counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket{self._labels(labels, (('le', repr(float(bound))),))} {cumulative}"
+            cumulative += counts[-1]
+            yield f"{self.name}_bucket{self._labels(labels, (('le', '+Inf'),))} {cumulative}"
+            yield f"{self.name}_sum{self._labels(labels)} {self.sums[labels]}"
+            yield f"{self.name}_count{self._labels(labels)} {cumulative}"
+
+
+def render_metrics() -> str:
+    """Все метрики в текстовом формате Prometheus 0.0.4."""
+    for collect in metrics_collectors:
+        try:
+            collect()
+        except Exception as e:
+            logger.error(f"Ошибка сбора метрик: {e}", exc_info=True)
+    lines = []
+    for metric in metrics_registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+handler_latency = Histogram('mining_bot_handler_seconds', 'Время обработки обновления Telegram', ('handler', 'status'))
+upstream_latency = Histogram('mining_bot_upstream_request_seconds', 'Время одной попытки запроса к внешнему API',
+                             ('host', 'status'))
+upstream_rejected = Counter('mining_bot_upstream_rejected_total', 'Запросы, отклоненные без обращения к хосту',
+                            ('host', 'reason'))
+cache_requests = Counter('mining_bot_cache_requests_total', 'Обращения к кэшу: hit, stale (отдано и обновляется) или miss',
+                         ('cache', 'result'))
+cache_evictions = Counter('mining_bot_cache_evictions_total', 'Записи, удаленные из кэша по размеру или по TTL',
+                          ('cache', 'reason'))
+cache_entries = Gauge('mining_bot_cache_entries', 'Записей в кэше', ('cache',))
+job_duration = Histogram('mining_bot_job_seconds', 'Время выполнения задачи планировщика', ('job', 'status'),
+                         buckets=Config.METRICS_JOB_BUCKETS)
+event_loop_lag = Histogram('mining_bot_event_loop_lag_seconds', 'Задержка event loop', buckets=Config.METRICS_LOOP_LAG_BUCKETS)
+uptime_seconds = Gauge('mining_bot_uptime_seconds', 'Время с запуска процесса')
+is_leader_gauge = Gauge('mining_bot_is_leader', '1, если реплика выполняет задачи планировщика')
+mempool_feed_live = Gauge('mining_bot_mempool_feed_live', '1, если поток mempool.space подключен и присылает данные')
+asic_source_age = Gauge('mining_bot_asic_source_age_seconds', 'Возраст снимка источника ASIC', ('source',))
 
 # ==============================================================================
 # 4. НАСТРОЙКА КЭШИРОВАНИЯ
 # ==============================================================================
-# TTLs: ASIC=1 час, Price=5 минут, F&G=4 часа, News=30 минут
-asic_cache = TTLCache(maxsize=5, ttl=3600)
-price_cache = TTLCache(maxsize=100, ttl=300)
-fear_greed_cache = TTLCache(maxsize=2, ttl=14400)
-news_cache = TTLCache(maxsize=5, ttl=1800)
-coin_list_cache = TTLCache(maxsize=1, ttl=86400) # Кэш для списка всех монет и их алгоритмов
+# TTL кэша — жесткий предел устаревания записи. Для кэшей с фоновым обновлением
+# (stale-while-revalidate) запись старше refresh_after продолжает отдаваться
+# мгновенно, пока планировщик или фоновая задача получают свежие данные.
+# Кэши с именем считают вытеснения для метрик (см. mining_bot_cache_evictions_total)
+metered_caches: List[Any] = []
+
+class MeteredCacheMixin:
+    """Считает записи, вытесненные из кэша по размеру."""
+
+    def _register(self, name: str):
+        self.name = name
+        metered_caches.append(self)
+
+    def popitem(self):
+        item = super().popitem()
+        cache_evictions.inc(self.name, 'size')
+        return item
+
+
+class MeteredTTLCache(MeteredCacheMixin, TTLCache):
+    def __init__(self, name: str, maxsize: int, ttl: float, timer: Callable[[], float] = time.monotonic):
+        super().__init__(maxsize=maxsize, ttl=ttl, timer=timer)
+        self._register(name)
+
+    def expire(self, time=None):
+        # TTLCache.__len__ сам вызывает expire(), поэтому размер берется без очистки
+        before = Cache.__len__(self)
+        result = super().expire(time)
+        expired = before - Cache.__len__(self)
+        if expired:
+            cache_evictions.inc(self.name, 'ttl', amount=expired)
+        return result
+
+
+class MeteredLRUCache(MeteredCacheMixin, LRUCache):
+    def __init__(self, name: str, maxsize: int):
+        super().__init__(maxsize=maxsize)
+        self._register(name)
+
+
+# Обновление: ASIC — у каждого источника свое (см. AsicSource), Price=5 минут, F&G=4 часа, News=30 минут, монеты=сутки
+price_cache = MeteredTTLCache('price', maxsize=100, ttl=Config.PRICE_CACHE_MAX_STALE)
+fear_greed_cache = MeteredTTLCache('fear_greed', maxsize=2, ttl=14400)
+news_cache = MeteredTTLCache('news', maxsize=5, ttl=1800)
+coin_list_cache = MeteredTTLCache('coin_list', maxsize=1, ttl=Config.COIN_LIST_CACHE_MAX_STALE) # Кэш для списка всех монет и их алгоритмов
+coin_index_cache = MeteredTTLCache('coin_index', maxsize=1, ttl=Config.COIN_INDEX_MAX_STALE)
+usd_rub_cache = MeteredTTLCache('usd_rub', maxsize=1, ttl=Config.USD_RUB_CACHE_MAX_STALE)
+network_state_cache = MeteredTTLCache('network_state', maxsize=1, ttl=Config.NETWORK_STATE_MAX_STALE)  # Только пока поток mempool.space недоступен
+# Картинки индекса: PNG по (значение, классификация) и file_id уже загруженных в Telegram
+fear_greed_image_cache = MeteredLRUCache('fear_greed_image', maxsize=Config.FEAR_GREED_IMAGE_CACHE_SIZE)
+fear_greed_file_id_cache = MeteredLRUCache('fear_greed_file_id', maxsize=Config.FEAR_GREED_IMAGE_CACHE_SIZE)
+
+
+@dataclass
+class CacheEntry:
+    """Запись кэша: значение, время получения (UNIX) и аргументы для повторного запроса."""
+    value: Any
+    fetched_at: float
+    args: tuple = ()
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+# Типы значений общего кэша, которые восстанавливаются из JSON (см. encode_cache_entry)
+CACHE_VALUE_TYPES = {cls.__name__: cls for cls in (AsicMiner, CryptoCoin)}
+
+def _to_json(value: Any) -> Any:
+    """Приводит значение к виду для json; кортежи и известные dataclass помечаются, чтобы восстановить тип."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, tuple):
+        return {'__tuple__': [_to_json(item) for item in value]}
+    if isinstance(value, list):
+        return [_to_json(item) for item in value]
+    if isinstance(value, dict) and all(isinstance(k, str) for k in value):
+        return {k: _to_json(v) for k, v in value.items()}
+    if CACHE_VALUE_TYPES.get(type(value).__name__) is type(value):
+        return {'__type__': type(value).__name__, 'fields': {k: _to_json(v) for k, v in vars(value).items()}}
+    raise TypeError(f"значение типа {type(value).__name__} не сохраняется в кэше")
+
+def _from_json(obj: Dict[str, Any]) -> Any:
+    if '__tuple__' in obj:
+        return tuple(obj['__tuple__'])
+    if '__type__' in obj:
+        cls = CACHE_VALUE_TYPES.get(obj['__type__'])
+        if cls is None:
+            raise ValueError(f"неизвестный тип значения кэша: {obj['__type__']}")
+        return cls(**obj['fields'])
+    return obj
+
+def encode_cache_entry(entry: CacheEntry) -> bytes:
+    """Сериализует запись для общего кэша в JSON.
+
+    Общий кэш доступен по сети всем репликам, поэтому в нем не используется
+    pickle: чтение подложенной записи не должно выполнять код. Постоянный кэш
+    на локальном диске остается в pickle - в нем хранятся и объекты вроде
+    CoinIndex, которые в JSON не сохраняются.
+    """
+    return json.dumps(_to_json({'value': entry.value, 'fetched_at': entry.fetched_at, 'args': tuple(entry.args),
+                                'kwargs': entry.kwargs}), ensure_ascii=False).encode()
+
+def decode_cache_entry(blob: bytes) -> CacheEntry:
+    data = json.loads(blob, object_hook=_from_json)
+    return CacheEntry(data['value'], data['fetched_at'], data['args'], data['kwargs'])
+
+
+# Функции, чьи устаревающие записи обновляет планировщик (см. refresh_stale_caches_job)
+prefetched_functions: List[Callable] = []
+# Функции, чей кэш сохраняется на диск (см. restore_persistent_caches)
+persisted_functions: List[Callable] = []
+
+
+def open_sqlite(path: str) -> sqlite3.Connection:
+    """Открывает SQLite в режиме WAL: чтения не блокируются фоновой записью."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def sqlite_data_version(conn: sqlite3.Connection) -> int:
+    """Меняется, когда базу изменило другое соединение (например, другая реплика)."""
+    return conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+class PersistentCache:
+    """Постоянный уровень кэша в SQLite с отложенной записью (write-behind).
+
+    Записи кэша копятся в памяти и раз в несколько секунд одной транзакцией
+    сохраняются в фоновом потоке. При старте они загружаются с исходным
+    временем получения, поэтому устаревшие данные сразу отдаются и
+    обновляются в фоне, а записи старше жесткого предела отбрасываются.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, Hashable], CacheEntry] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def open(self):
+        self._conn = open_sqlite(self.path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "namespace TEXT NOT NULL, key BLOB NOT NULL, value BLOB NOT NULL, fetched_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._conn.execute("DELETE FROM cache_entries WHERE fetched_at < ?",
+                               (time.time() - Config.PERSISTENT_CACHE_RETENTION,))
+
+    def schedule_write(self, namespace: str, key: Hashable, entry: CacheEntry):
+        self._pending[(namespace, key)] = entry
+
+    def load(self, namespace: str) -> List[Tuple[Hashable, CacheEntry]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM cache_entries WHERE namespace = ?", (namespace,)).fetchall()
+        entries = []
+        for key_blob, value_blob in rows:
+            try:
+                entries.append((pickle.loads(key_blob), pickle.loads(value_blob)))
+            except Exception as e:
+                logger.warning(f"Не удалось прочитать запись постоянного кэша {namespace}: {e}")
+        return entries
+
+    def _write(self, batch: Dict[Tuple[str, Hashable], CacheEntry]):
+        rows = []
+        for (namespace, key), entry in batch.items():
+            try:
+                rows.append((namespace, pickle.dumps(key), pickle.dumps(entry, pickle.HIGHEST_PROTOCOL), entry.fetched_at))
+            except Exception as e:
+                logger.warning(f"Не удалось сериализовать запись кэша {namespace}: {e}")
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?)", rows)
+
+    async def flush(self):
+        if self._pending:
+            batch, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except BaseException:
+                # Пакет возвращается в очередь; записи, появившиеся во время записи, новее
+                for key, entry in batch.items():
+                    self._pending.setdefault(key, entry)
+                raise
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(Config.PERSISTENT_CACHE_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи постоянного кэша: {e}", exc_info=True)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+persistent_cache: Optional[PersistentCache] = None  # Открывается в main(), если включен
+
+
+class CacheBackendError(Exception):
+    """Общий кэш недоступен; вызывающий продолжает работу без него."""
+
+
+class CacheBackend(ABC):
+    """Общий уровень кэша и координация реплик.
+
+    Локальный TTLCache каждой реплики остается первым уровнем, а бэкенд
+    хранит записи, которые видят все реплики, выдает блокировки для
+    single-flight между процессами и аренду лидерства для фоновых задач.
+    Ошибки хранилища сообщаются исключением CacheBackendError.
+    """
+    shared = True
+
+    @abstractmethod
+    async def get(self, namespace: str, key: Hashable) -> Optional[CacheEntry]:
+        ...
+
+    @abstractmethod
+    async def set(self, namespace: str, key: Hashable, entry: CacheEntry, ttl: float):
+        ...
+
+    @abstractmethod
+    async def acquire_lock(self, namespace: str, key: Hashable, ttl: float) -> Optional[str]:
+        """Возвращает токен блокировки или None, если ее держит другая реплика."""
+
+    @abstractmethod
+    async def release_lock(self, namespace: str, key: Hashable, token: str):
+        ...
+
+    @abstractmethod
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Берет или продлевает аренду; False, если она у другого владельца."""
+
+    @abstractmethod
+    async def release_lease(self, name: str, owner: str):
+        ...
+
+    async def close(self):
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Бэкенд по умолчанию для одной реплики.
+
+    Ничего не разделяет: данные живут только в TTLCache процесса,
+    single-flight обеспечивает async_cached, а блокировки и лидерство всегда
+    достаются этому процессу.
+    """
+    shared = False
+
+    async def get(self, namespace: str, key: Hashable) -> Optional[CacheEntry]:
+        return None
+
+    async def set(self, namespace: str, key: Hashable, entry: CacheEntry, ttl: float):
+        pass
+
+    async def acquire_lock(self, namespace: str, key: Hashable, ttl: float) -> Optional[str]:
+        return Config.REPLICA_ID
+
+    async def release_lock(self, namespace: str, key: Hashable, token: str):
+        pass
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        return True
+
+    async def release_lease(self, name: str, owner: str):
+        pass
+
+
+class RedisCacheBackend(CacheBackend):
+    """Общий кэш в Redis или совместимом хранилище (Valkey, KeyDB, Dragonfly).
+
+    Записи хранятся в JSON (encode_cache_entry) с TTL, равным жесткому
+    пределу устаревания. Блокировка — SET NX PX со случайным токеном, снимается
+    скриптом только владельцем; аренда лидерства продлевается тем же
+    владельцем и истекает сама, если реплика упала.
+    """
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+    LEASE_SCRIPT = (
+        "local owner = redis.call('get', KEYS[1]) "
+        "if owner == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end "
+        "if not owner then redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2]) return 1 end "
+        "return 0"
+    )
+
+    def __init__(self, url: str, prefix: str = Config.REDIS_KEY_PREFIX):
+        self.prefix = prefix
+        self._redis = aioredis.from_url(url, socket_timeout=Config.REDIS_TIMEOUT,
+                                        socket_connect_timeout=Config.REDIS_TIMEOUT)
+        self._release = self._redis.register_script(self.RELEASE_SCRIPT)
+        self._lease = self._redis.register_script(self.LEASE_SCRIPT)
+
+    def _key(self, kind: str, namespace: str, key: Hashable) -> str:
+        # Ключи кэша — кортежи строк и чисел, их repr одинаков во всех процессах
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return f"{self.prefix}{kind}:{namespace}:{digest}"
+
+    async def _call(self, coro) -> Any:
+        try:
+            return await coro
+        except (redis_exceptions.RedisError, OSError, asyncio.TimeoutError) as e:
+            raise CacheBackendError(str(e)) from e
+
+    async def get(self, namespace: str, key: Hashable) -> Optional[CacheEntry]:
+        blob = await self._call(self._redis.get(self._key('cache', namespace, key)))
+        if blob is None:
+            return None
+        try:
+            return decode_cache_entry(blob)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Не удалось прочитать запись общего кэша {namespace}: {e}")
+            return None
+
+    async def set(self, namespace: str, key: Hashable, entry: CacheEntry, ttl: float):
+        try:
+            blob = encode_cache_entry(entry)
+        except (TypeError, ValueError) as e:
+            raise CacheBackendError(f"запись {namespace} не сериализуется: {e}") from e
+        ttl_ms = max(1, int((ttl - entry.age) * 1000))
+        await self._call(self._redis.set(self._key('cache', namespace, key), blob, px=ttl_ms))
+
+    async def acquire_lock(self, namespace: str, key: Hashable, ttl: float) -> Optional[str]:
+        token = f"{Config.REPLICA_ID}:{random.getrandbits(64):x}"
+        acquired = await self._call(self._redis.set(self._key('lock', namespace, key), token, nx=True, px=int(ttl * 1000)))
+        return token if acquired else None
+
+    async def release_lock(self, namespace: str, key: Hashable, token: str):
+        await self._call(self._release(keys=[self._key('lock', namespace, key)], args=[token]))
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        return bool(await self._call(self._lease(keys=[f"{self.prefix}lease:{name}"], args=[owner, int(ttl * 1000)])))
+
+    async def release_lease(self, name: str, owner: str):
+        await self._call(self._release(keys=[f"{self.prefix}lease:{name}"], args=[owner]))
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+cache_backend: CacheBackend = MemoryCacheBackend()  # Заменяется в main(), если задан REDIS_URL
+
+
+class LeaderElector:
+    """Выбор лидера через аренду в общем кэше.
+
+    Задачи с побочными эффектами (рассылки, оповещения) выполняет только
+    реплика, держащая аренду. Аренда продлевается каждые
+    Config.LEADER_RENEW_INTERVAL секунд; лидерство считается потерянным,
+    как только продление не удалось или локально истек срок аренды, поэтому
+    две реплики не могут одновременно считать себя лидерами дольше сдвига часов.
+    """
+
+    def __init__(self, name: str, owner: str = Config.REPLICA_ID):
+        self.name = name
+        self.owner = owner
+        self.on_elected: List[Callable[[], Any]] = []  # Вызываются при каждом получении лидерства
+        self._lease_until = 0.0  # time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._lease_until
+
+    async def _renew(self):
+        was_leader = self.is_leader
+        started = time.monotonic()
+        try:
+            acquired = await cache_backend.acquire_lease(self.name, self.owner, Config.LEADER_LEASE_TTL)
+        except CacheBackendError as e:
+            logger.warning(f"Не удалось продлить аренду лидерства: {e}")
+            acquired = False
+        self._lease_until = started + Config.LEADER_LEASE_TTL if acquired else 0.0
+        if acquired and not was_leader:
+            logger.info(f"Реплика {self.owner} стала лидером и выполняет фоновые задачи.")
+            for callback in self.on_elected:
+                callback()
+        elif was_leader and not acquired:
+            logger.warning(f"Реплика {self.owner} потеряла лидерство.")
+
+    async def _renew_loop(self):
+        while True:
+            await asyncio.sleep(Config.LEADER_RENEW_INTERVAL)
+            await self._renew()
+
+    async def start(self):
+        """Пытается стать лидером сразу, до запуска планировщика, и дальше продлевает аренду."""
+        if self._task is None:
+            await self._renew()
+            self._task = asyncio.create_task(self._renew_loop())
+
+    async def stop(self):
+        """Отдает аренду, чтобы другая реплика сразу стала лидером."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.is_leader:
+            self._lease_until = 0.0
+            try:
+                await cache_backend.release_lease(self.name, self.owner)
+            except CacheBackendError as e:
+                logger.warning(f"Не удалось отдать аренду лидерства, она истечет сама: {e}")
+
+
+leader_elector = LeaderElector("scheduler")
+
+def leader_only(job: Callable):
+    """Задача планировщика, которая выполняется только на реплике-лидере."""
+    @functools.wraps(job)
+    async def wrapper(*args, **kwargs):
+        if not leader_elector.is_leader:
+            logger.debug(f"Задача {job.__name__} пропущена: реплика не лидер.")
+            return None
+        return await job(*args, **kwargs)
+    return wrapper
+
+
+def metered_job(job: Callable):
+    """Задача планировщика, время выполнения которой попадает в mining_bot_job_seconds."""
+    @functools.wraps(job)
+    async def wrapper(*args, **kwargs):
+        started = time.monotonic()
+        status = 'error'
+        try:
+            result = await job(*args, **kwargs)
+            status = 'ok'
+            return result
+        finally:
+            job_duration.observe(time.monotonic() - started, job.__name__, status)
+    return wrapper
+
+
+def is_cacheable_result(result: Any) -> bool:
+    """Неудачные результаты (None, пустой список или словарь) в кэш не попадают."""
+    return result is not None and not (isinstance(result, (list, dict)) and not result)
+
+def async_cached(cache: TTLCache, key: Callable[..., Hashable] = hashkey,
+                 refresh_after: Optional[float] = None, prefetch: bool = False, persist: bool = False,
+                 shared: bool = False):
+    """Кэширующий декоратор для корутин с объединением одновременных запросов.
+
+    Пока по ключу идет запрос к источнику, остальные вызовы ждут тот же Future
+    (single-flight), поэтому при истечении TTL наружу уходит ровно один запрос.
+    Исключение получают все ожидающие, а неудачный результат не кэшируется.
+
+    Если задан refresh_after, запись старше этого возраста отдается сразу, а
+    обновление запускается в фоне; cache.ttl (если он есть у кэша) остается
+    жестким пределом устаревания.
+    С prefetch=True такие записи заранее обновляет планировщик.
+    Если обновление не удалось, продолжает отдаваться последнее удачное значение.
+    С persist=True записи сохраняются в постоянный кэш и восстанавливаются при старте.
+    С shared=True записи берутся из общего кэша (cache_backend) и кладутся в
+    него, а к источнику по ключу одновременно обращается только одна реплика.
+    """
+    def decorator(func):
+        inflight: Dict[Hashable, asyncio.Future] = {}
+        namespace = func.__qualname__
+        cache_name = getattr(cache, 'name', namespace)
+        max_stale = getattr(cache, 'ttl', float('inf'))
+        fresh_age = refresh_after if refresh_after is not None else max_stale
+
+        def store(k: Hashable, entry: CacheEntry):
+            cache[k] = entry
+            if persist and persistent_cache is not None:
+                persistent_cache.schedule_write(namespace, k, entry)
+
+        async def call_source(args: tuple, kwargs: dict) -> Tuple[Any, Optional[CacheEntry]]:
+            result = await func(*args, **kwargs)
+            entry = CacheEntry(result, time.time(), args, kwargs) if is_cacheable_result(result) else None
+            return result, entry
+
+        async def call_shared(k: Hashable, args: tuple, kwargs: dict, max_age: float) -> Tuple[Any, Optional[CacheEntry]]:
+            """Берет запись не старше max_age из общего кэша или запрашивает источник под блокировкой."""
+            deadline = time.monotonic() + Config.SHARED_LOCK_WAIT
+            while True:
+                entry = await cache_backend.get(namespace, k)
+                if entry is not None and entry.age <= max_age:
+                    return entry.value, entry
+                token = await cache_backend.acquire_lock(namespace, k, Config.SHARED_LOCK_TTL)
+                if token is not None:
+                    break
+                if time.monotonic() > deadline:
+                    logger.warning(f"Не дождались обновления {func.__name__} другой репликой, запрашиваем источник.")
+                    return await call_source(args, kwargs)
+                await asyncio.sleep(Config.SHARED_LOCK_POLL)
+            try:
+                # Пока блокировку держала другая реплика, она могла успеть обновить запись
+                entry = await cache_backend.get(namespace, k)
+                if entry is not None and entry.age <= max_age:
+                    return entry.value, entry
+                result, entry = await call_source(args, kwargs)
+            except BaseException:
+                await release_shared_lock(k, token)
+                raise
+            # Источник уже опрошен: ошибки общего кэша дальше не должны вызвать повторный запрос
+            try:
+                if entry is not None:
+                    await cache_backend.set(namespace, k, entry, max_stale if max_stale != float('inf') else fresh_age)
+            except CacheBackendError as e:
+                logger.warning(f"Не удалось сохранить {func.__name__} в общий кэш: {e}")
+            await release_shared_lock(k, token)
+            return result, entry
+
+        async def release_shared_lock(k: Hashable, token: str):
+            try:
+                await cache_backend.release_lock(namespace, k, token)
+            except CacheBackendError as e:
+                logger.warning(f"Не удалось снять блокировку {func.__name__}, она истечет сама: {e}")
+
+        async def fetch(k: Hashable, args: tuple, kwargs: dict, max_age: float) -> Any:
+            try:
+                if shared and cache_backend.shared:
+                    try:
+                        result, entry = await call_shared(k, args, kwargs, max_age)
+                    except CacheBackendError as e:
+                        logger.warning(f"Общий кэш недоступен ({e}), {func.__name__} запрашивается напрямую.")
+                        result, entry = await call_source(args, kwargs)
+                else:
+                    result, entry = await call_source(args, kwargs)
+                if entry is not None:
+                    store(k, entry)
+                    return entry.value
+                stale = cache.get(k)
+                if stale is not None:
+                    logger.warning(f"Обновление {func.__name__} не удалось, отдаются данные возрастом {stale.age:.0f} с.")
+                    return stale.value
+                return result
+            finally:
+                inflight.pop(k, None)
+
+        def start_fetch(k: Hashable, args: tuple, kwargs: dict, max_age: float = fresh_age) -> asyncio.Future:
+            future = inflight.get(k)
+            if future is None:
+                future = asyncio.ensure_future(fetch(k, args, kwargs, max_age))
+                # Исключение считается полученным, даже если все ожидающие отменены
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                inflight[k] = future
+            return future
+
+        def get_entry(k: Hashable) -> Optional[CacheEntry]:
+            entry = cache.get(k)
+            if entry is None or entry.age > max_stale:
+                return None
+            return entry
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs)
+            entry = get_entry(k)
+            if entry is not None:
+                if refresh_after is not None and entry.age > refresh_after:
+                    cache_requests.inc(cache_name, 'stale')
+                    start_fetch(k, entry.args, entry.kwargs)
+                else:
+                    cache_requests.inc(cache_name, 'hit')
+                return entry.value
+            cache_requests.inc(cache_name, 'miss')
+            # shield: отмена одного вызывающего не прерывает запрос для остальных
+            return await asyncio.shield(start_fetch(k, args, kwargs))
+
+        async def refresh(*args, **kwargs) -> Any:
+            """Принудительно запрашивает свежие данные и кладет их в кэш."""
+            return await asyncio.shield(start_fetch(key(*args, **kwargs), args, kwargs, max_age=0))
+
+        async def refresh_stale(ahead: float = 0) -> int:
+            """Обновляет записи, которые устареют в ближайшие ahead секунд."""
+            if refresh_after is None:
+                return 0
+            max_age = refresh_after - ahead
+            stale = [(k, e) for k, e in list(cache.items()) if e.age > max_age]
+            # Запись, которую уже обновила другая реплика, берется из общего кэша
+            await asyncio.gather(*(start_fetch(k, e.args, e.kwargs, max_age) for k, e in stale), return_exceptions=True)
+            return len(stale)
+
+        def peek(*args, **kwargs) -> Any:
+            """Закэшированное значение без обращения к источнику или None."""
+            entry = get_entry(key(*args, **kwargs))
+            return entry.value if entry else None
+
+        def data_as_of(*args, **kwargs) -> Optional[datetime]:
+            """Время получения закэшированных данных (UTC) или None."""
+            entry = get_entry(key(*args, **kwargs))
+            return datetime.fromtimestamp(entry.fetched_at, tz=timezone.utc) if entry else None
+
+        def restore(entries: List[Tuple[Hashable, CacheEntry]]) -> int:
+            """Кладет в кэш записи с диска, пропуская превысившие жесткий предел."""
+            restored = 0
+            for k, entry in sorted(entries, key=lambda item: item[1].fetched_at):
+                if entry.age <= max_stale:
+                    cache[k] = entry
+                    restored += 1
+            return restored
+
+        wrapper.cache = cache
+        wrapper.cache_key = key
+        wrapper.cache_namespace = namespace
+        wrapper.refresh = refresh
+        wrapper.refresh_stale = refresh_stale
+        wrapper.peek = peek
+        wrapper.data_as_of = data_as_of
+        wrapper.restore = restore
+        if prefetch:
+            prefetched_functions.append(wrapper)
+        if persist:
+            persisted_functions.append(wrapper)
+        return wrapper
+    return decorator
 
 # ==============================================================================
 # 5. ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ И УТИЛИТЫ
@@ -138,307 +1258,2806 @@ def sanitize_html(text: str) -> str:
     """Полностью удаляет все HTML-теги и атрибуты, оставляя только обычный текст."""
     return bleach.clean(text, tags=[], attributes={}, strip=True).strip()
 
-async def make_request(session: aiohttp.ClientSession, url: str, response_type='json', **kwargs) -> Optional[Any]:
-    """Выполняет асинхронный GET-запрос с обработкой ошибок."""
-    try:
-        async with session.get(url, timeout=15, **kwargs) as response:
-            response.raise_for_status()
-            if response_type == 'json':
-                return await response.json()
-            elif response_type == 'text':
-                return await response.text()
-            elif response_type == 'bytes':
-                return await response.read()
-    except aiohttp.ClientError as e:
-        logger.warning(f"Сетевая ошибка при запросе к {url}: {e}")
-    except asyncio.TimeoutError:
-        logger.warning(f"Тайм-аут при запросе к {url}")
-    except json.JSONDecodeError as e:
-        logger.warning(f"Ошибка декодирования JSON с {url}: {e}")
-    return None
+def create_http_session() -> aiohttp.ClientSession:
+    """Создает общий HTTP-клиент с пулом соединений. Вызывается один раз из main()."""
+    global http_session
+    if http_session and not http_session.closed:
+        return http_session
+
+    accept_encoding = "gzip, deflate"
+    if Config.HTTP_ENABLE_BROTLI:
+        try:
+            import brotli  # noqa: F401  # aiohttp распакует br, только если установлен brotli
+            accept_encoding += ", br"
+        except ImportError:
+            pass
+
+    connector = aiohttp.TCPConnector(
+        limit=Config.HTTP_LIMIT,
+        limit_per_host=Config.HTTP_LIMIT_PER_HOST,
+        ttl_dns_cache=Config.HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=Config.HTTP_KEEPALIVE_TIMEOUT,
+        enable_cleanup_closed=True,
+    )
+    http_session = aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=Config.HTTP_DEFAULT_TIMEOUT),
+        headers={"Accept-Encoding": accept_encoding},
+    )
+    logger.info(f"HTTP-клиент создан (limit={Config.HTTP_LIMIT}, limit_per_host={Config.HTTP_LIMIT_PER_HOST}).")
+    return http_session
+
+async def close_http_session():
+    """Закрывает общий HTTP-клиент при остановке бота."""
+    global http_session
+    if http_session and not http_session.closed:
+        await http_session.close()
+    http_session = None
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Возвращает общий HTTP-клиент, создавая его при первом обращении."""
+    if http_session is None or http_session.closed:
+        return create_http_session()
+    return http_session
+
+class TokenBucket:
+    """Асинхронная корзина токенов: не больше rate операций в секунду с запасом capacity."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Ждет, пока освободится токен. Ожидающие обслуживаются по очереди."""
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class CircuitBreaker:
+    """Автомат отключения: после threshold неудач подряд хост считается недоступным.
+
+    В разомкнутом состоянии запросы сразу отклоняются. Через reset_timeout
+    пропускается одна пробная попытка: успех замыкает автомат, неудача
+    снова размыкает его. Если проба не дала ответа (отменена или отклонена
+    до обращения к хосту), ее место освобождается; зависшая проба
+    повторяется через reset_timeout.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0  # Время размыкания или начала последней пробы
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self.opened_at = now
+            return True
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Проба закончилась без ответа хоста: следующий запрос может пробовать сразу."""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic() - self.reset_timeout
+
+
+class HostState:
+    """Состояние политики для одного хоста: корзина токенов, автомат и Retry-After."""
+
+    def __init__(self, policy: HostPolicy):
+        self.policy = policy
+        self.bucket = TokenBucket(policy.rate, policy.burst) if policy.rate else None
+        self.breaker = CircuitBreaker(policy.breaker_threshold, policy.breaker_reset)
+        self.blocked_until = 0.0  # По Retry-After хоста (time.monotonic)
+
+
+host_states: Dict[str, HostState] = {}
+
+def get_host_state(url: str) -> Tuple[str, HostState]:
+    """Возвращает имя хоста и состояние его политики из Config.HOST_POLICIES."""
+    host = urlsplit(url).hostname or ''
+    state = host_states.get(host)
+    if state is None:
+        state = host_states[host] = HostState(Config.HOST_POLICIES.get(host, Config.DEFAULT_HOST_POLICY))
+    return host, state
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбирает заголовок Retry-After (секунды или HTTP-дата) в секунды ожидания."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(policy: HostPolicy, attempt: int) -> float:
+    """Экспоненциальная задержка с полным случайным разбросом (full jitter)."""
+    return random.uniform(0, min(policy.backoff_max, policy.backoff_base * 2 ** attempt))
+
+
+@dataclass
+class HttpResult:
+    """Полный ответ для response_type='full': статус, заголовки и текст."""
+    status: int
+    headers: Mapping[str, str]
+    text: str
+
+
+class RetryableHTTPError(Exception):
+    """Ответ 429 или 5xx, после которого запрос стоит повторить."""
+
+    def __init__(self, status: int, retry_after: Optional[float]):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+async def make_request(url: str, response_type='json', **kwargs) -> Optional[Any]:
+    """Выполняет асинхронный GET-запрос через общий HTTP-клиент с обработкой ошибок.
+
+    Для каждого хоста действует политика из Config.HOST_POLICIES: лимит
+    запросов, повторы с экспоненциальной задержкой и учетом Retry-After и
+    автомат отключения, который сразу возвращает None, пока хост недоступен.
+    """
+    host, state = get_host_state(url)
+    if not state.breaker.allow():
+        upstream_rejected.inc(host, 'breaker_open')
+        logger.debug(f"Хост {host} недоступен (автомат разомкнут), запрос к {url} отклонен.")
+        return None
+    probe = state.breaker.state == CircuitBreaker.HALF_OPEN
+    kwargs.setdefault('timeout', aiohttp.ClientTimeout(total=state.policy.timeout))
+    try:
+        return await request_with_retries(url, host, state, response_type, kwargs)
+    finally:
+        if probe:
+            # Без вердикта (отмена, долгий Retry-After) проба не должна держать автомат
+            state.breaker.release_probe()
+
+async def request_with_retries(url: str, host: str, state: HostState, response_type: str, kwargs: dict) -> Optional[Any]:
+    """Попытки запроса по политике хоста; результат каждой отмечается в автомате отключения."""
+    policy = state.policy
+    for attempt in range(policy.retries + 1):
+        wait = state.blocked_until - time.monotonic()
+        if wait > policy.backoff_max:
+            upstream_rejected.inc(host, 'retry_after')
+            logger.warning(f"Хост {host} просит подождать {wait:.0f} с, запрос к {url} отклонен.")
+            return None
+        if wait > 0:
+            await asyncio.sleep(wait)
+        if state.bucket:
+            await state.bucket.acquire()
+
+        retry_after = None
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            async with get_http_session().get(url, **kwargs) as response:
+                status = str(response.status)
+                if response.status == 429 or response.status >= 500:
+                    raise RetryableHTTPError(response.status, parse_retry_after(response.headers.get('Retry-After')))
+                response.raise_for_status()
+                if response_type == 'json':
+                    result = await response.json()
+                elif response_type == 'text':
+                    result = await response.text()
+                elif response_type == 'bytes':
+                    result = await response.read()
+                elif response_type == 'full':
+                    # Нужен для условных запросов: статус 304 и заголовки ETag/Last-Modified
+                    result = HttpResult(response.status, response.headers, await response.text())
+                else:
+                    result = None
+            state.breaker.record_success()
+            return result
+        except RetryableHTTPError as e:
+            retry_after = e.retry_after
+            logger.warning(f"Хост {host} ответил {e.status} на запрос к {url} (попытка {attempt + 1}).")
+        except aiohttp.ClientResponseError as e:
+            # Остальные 4xx и неверный Content-Type: хост жив, повтор не поможет
+            state.breaker.record_success()
+            logger.warning(f"Сетевая ошибка при запросе к {url}: {e}")
+            return None
+        except aiohttp.ClientError as e:
+            status = 'error'
+            logger.warning(f"Сетевая ошибка при запросе к {url}: {e}")
+        except asyncio.TimeoutError:
+            status = 'timeout'
+            logger.warning(f"Тайм-аут при запросе к {url}")
+        except json.JSONDecodeError as e:
+            status = 'invalid_json'
+            state.breaker.record_success()
+            logger.warning(f"Ошибка декодирования JSON с {url}: {e}")
+            return None
+        finally:
+            upstream_latency.observe(time.perf_counter() - started, host, status)
+
+        if retry_after is not None:
+            state.blocked_until = max(state.blocked_until, time.monotonic() + retry_after)
+        elif attempt < policy.retries:
+            await asyncio.sleep(backoff_delay(policy, attempt))
+
+    state.breaker.record_failure()
+    if state.breaker.state == CircuitBreaker.OPEN:
+        logger.error(f"Хост {host} недоступен, запросы к нему приостановлены на {policy.breaker_reset:.0f} с.")
+    return None
+
+def create_cpu_executor() -> Executor:
+    """Создает ограниченный пул для CPU-нагрузки (потоки или процессы)."""
+    global cpu_executor
+    if cpu_executor is None:
+        if Config.CPU_POOL_KIND == "process":
+            cpu_executor = ProcessPoolExecutor(max_workers=Config.CPU_POOL_WORKERS)
+        else:
+            cpu_executor = ThreadPoolExecutor(max_workers=Config.CPU_POOL_WORKERS, thread_name_prefix="cpu")
+        logger.info(f"Пул CPU-задач создан ({Config.CPU_POOL_KIND}, {Config.CPU_POOL_WORKERS} воркера).")
+    return cpu_executor
+
+def shutdown_cpu_executor():
+    """Останавливает пул CPU-задач."""
+    global cpu_executor
+    if cpu_executor is not None:
+        cpu_executor.shutdown(wait=False, cancel_futures=True)
+        cpu_executor = None
+
+async def run_cpu_bound(func: Callable, *args) -> Any:
+    """Выполняет синхронную CPU-нагрузку в пуле, не блокируя event loop.
+
+    Для пула процессов func и аргументы должны сериализоваться pickle,
+    поэтому сюда передаются только функции уровня модуля.
+    """
+    return await asyncio.get_running_loop().run_in_executor(create_cpu_executor(), func, *args)
+
+
+class LoopLagMonitor:
+    """Измеряет задержку event loop: насколько позже запланированного просыпается sleep."""
+
+    def __init__(self, interval: float = Config.LOOP_LAG_CHECK_INTERVAL):
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - started - self.interval)
+            self.max_lag = max(self.max_lag, self.last_lag)
+            event_loop_lag.observe(self.last_lag)
+            if self.last_lag > Config.LOOP_LAG_WARNING:
+                logger.warning(f"Event loop был заблокирован на {self.last_lag * 1000:.0f} мс.")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+loop_lag_monitor = LoopLagMonitor()
+
+background_tasks: Set[asyncio.Task] = set()
+
+def spawn_background(coro) -> asyncio.Task:
+    """Запускает корутину в фоне, удерживая ссылку на задачу до ее завершения."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def cancel_background_tasks():
+    """Отменяет фоновые задачи и ждет их завершения перед закрытием хранилищ."""
+    for task in list(background_tasks):
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
+def format_data_as_of(as_of: Optional[datetime]) -> str:
+    """Форматирует отметку «данные на ...» для сообщений."""
+    return f"\n🕒 <i>Данные на {as_of:%d.%m %H:%M} UTC</i>" if as_of else ""
+
+def parse_power(power_str: str) -> Optional[int]:
+    """Преобразует строку мощности (e.g., '3400W') в целое число."""
+    cleaned = re.sub(r'[^0-9]', '', str(power_str))
+    return int(cleaned) if cleaned.isdigit() else None
+
+def parse_profitability(profit_str: str) -> float:
+    """Преобразует строку прибыльности (e.g., '$5.12/day') в число."""
+    cleaned = re.sub(r'[^\d.]', '', str(profit_str))
+    return float(cleaned) if cleaned else 0.0
+
+# ==============================================================================
+# 6. ЯДРО ЛОГИКИ: СБОР И ОБРАБОТКА ДАННЫХ
+# ==============================================================================
+
+# --- Агрегатор данных по ASIC-майнерам ---
+
+def parse_asicminervalue_html(html: str) -> List[AsicMiner]:
+    """Разбирает таблицу майнеров AsicMinerValue. Выполняется в пуле CPU-задач."""
+    miners = []
+    # SoupStrainer: lxml строит дерево только для нужной таблицы, а не для всей страницы
+    soup = bs4.BeautifulSoup(html, 'lxml', parse_only=bs4.SoupStrainer('table', id='datatable'))
+    table = soup.find('table', {'id': 'datatable'})
+    if not table or not table.find('tbody'):
+        return miners
+    
+    for row in table.find('tbody').find_all('tr'):
+        cols = row.find_all('td')
+        if len(cols) > 4:
+            try:
+                name = cols[1].find('a').text.strip()
+                profit_str = cols[3].text.strip()
+                profitability = parse_profitability(profit_str)
+                power_str = cols[4].text
+                power = parse_power(power_str)
+                
+                if profitability > 0:
+                    miners.append(AsicMiner(
+                        name=name,
+                        profitability=profitability,
+                        power=power,
+                        source='AsicMinerValue'
+                    ))
+            except Exception:
+                continue
+    return miners
+
+async def fetch_asicminervalue_html() -> Optional[str]:
+    """Загружает страницу AsicMinerValue.com."""
+    return await make_request('https://www.asicminervalue.com/', 'text')
+
+async def fetch_whattomine_json() -> Optional[Dict]:
+    """Загружает список ASIC с WhatToMine.com."""
+    return await make_request('https://whattomine.com/asics.json')
+
+def parse_whattomine_json(data: Dict) -> List[AsicMiner]:
+    """Разбирает ответ WhatToMine: только активные модели с известной доходностью."""
+    miners = []
+    for name, asic_data in (data.get('asics') or {}).items():
+        if asic_data.get('status') == 'Active' and 'revenue' in asic_data:
+            profit = parse_profitability(asic_data['revenue'])
+            if profit > 0:
+                miners.append(AsicMiner(
+                    name=name,
+                    profitability=profit,
+                    algorithm=asic_data.get('algorithm'),
+                    hashrate=str(asic_data.get('hashrate')),
+                    power=parse_power(str(asic_data.get('power', 0))),
+                    source='WhatToMine'
+                ))
+    return miners
+
+# --- Дедупликация ASIC-майнеров ---
+
+def canonical_miner_name(name: str) -> str:
+    """Нормализует название так же, как fuzz.token_set_ratio: full_process, уникальные слова по алфавиту."""
+    return " ".join(sorted(set(fuzz_utils.full_process(name).split())))
+
+HASHRATE_PATTERN = re.compile(r'(?<![\w.,])(\d+(?:[.,]\d+)?)\s*([kmgtp]?)(h|sol)(?:/s)?\b', re.IGNORECASE)
+HASHRATE_MULTIPLIERS = {'': 1, 'k': 1e3, 'm': 1e6, 'g': 1e9, 't': 1e12, 'p': 1e15}
+
+def asic_block_key(name: str) -> Tuple[str, str, str]:
+    """Ключ блока для дедупликации: (производитель, семейство модели, хешрейт).
+
+    Хешрейт берется из последнего "200Th"/"(1.6 TH/s)"/"840ksol" в названии и
+    округляется до трех значащих цифр в базовых единицах, поэтому 16Gh и
+    16000Mh попадают в один блок, а 16Gh и 17Gh - в разные. Производитель
+    определяется по Config.ASIC_VENDOR_ALIASES (Antminer -> bitmain), иначе
+    это первое слово. Семейство - буквы и цифры первого слова модели с
+    цифрой: S21 XP и S21+ -> "s21", M66S -> "m66".
+    """
+    hashrate = ''
+    matches = list(HASHRATE_PATTERN.finditer(name))
+    if matches:
+        match = matches[-1]
+        value = float(match.group(1).replace(',', '.')) * HASHRATE_MULTIPLIERS[match.group(2).lower()]
+        hashrate = f"{value:.3g}{match.group(3).lower()}"
+        name = name[:match.start()] + name[match.end():]
+
+    tokens = fuzz_utils.full_process(name).split()
+    vendor = next((Config.ASIC_VENDOR_ALIASES[t] for t in tokens if t in Config.ASIC_VENDOR_ALIASES),
+                  tokens[0] if tokens else '')
+    family = ''
+    for token in tokens:
+        if token not in Config.ASIC_VENDOR_ALIASES and any(c.isdigit() for c in token):
+            family = re.match(r'[a-z]*\d*', token).group()
+            break
+    return vendor, family, hashrate
+
+
+class AsicDeduplicator:
+    """Поиск дубликатов моделей внутри блоков вместо сравнения со всеми.
+
+    Раньше каждый майнер сравнивался с каждым уже принятым (O(n²)), и даже с
+    отбором кандидатов по индексам время росло почти квадратично. Теперь
+    майнеры раскладываются по блокам asic_block_key (производитель +
+    семейство + хешрейт), и fuzz.token_set_ratio с прежним порогом считается
+    только внутри блока. Блоки маленькие, поэтому сравнений O(n). При равных
+    баллах, как и у process.extractOne, побеждает ранее добавленный.
+
+    Модели из разных блоков больше не сливаются, даже если названия похожи:
+    S21 (200Th) и S21 (234Th) или L9 (16Gh) и L9 (17Gh) - разные устройства.
+    """
+    MATCH_SCORE = 90
+
+    def __init__(self):
+        self.blocks: Dict[Tuple[str, str, str], List[Tuple[str, str]]] = defaultdict(list)
+        self.comparisons = 0  # Число вызовов token_set_ratio, для тестов и бенчмарка
+
+    def find(self, name: str) -> Optional[str]:
+        """Возвращает ключ уже добавленного майнера, совпадающего с name, или None."""
+        canonical = canonical_miner_name(name)
+        if not canonical:
+            return None
+        best_key, best_score = None, 0
+        for key, key_canonical in self.blocks.get(asic_block_key(name), ()):
+            self.comparisons += 1
+            score = fuzz.token_set_ratio(canonical, key_canonical, full_process=False)
+            if score > best_score:
+                best_key, best_score = key, score
+        if best_key is not None and best_score > self.MATCH_SCORE:
+            return best_key
+        return None
+
+    def add(self, name: str):
+        """Добавляет название в его блок."""
+        self.blocks[asic_block_key(name)].append((name, canonical_miner_name(name)))
+
+
+def merge_asic_miners(all_miners: List[AsicMiner]) -> List[AsicMiner]:
+    """Сливает дубликаты моделей из разных источников и сортирует по доходности."""
+    final_miners: Dict[str, AsicMiner] = {}
+    dedup = AsicDeduplicator()
+
+    for miner in sorted(all_miners, key=lambda m: m.name):
+        best_match_key = dedup.find(miner.name)
+        if best_match_key:
+            # Нашли дубликат, обновляем данные
+            existing_miner = final_miners[best_match_key]
+            if miner.profitability > existing_miner.profitability:
+                existing_miner.profitability = miner.profitability
+            existing_miner.algorithm = existing_miner.algorithm or miner.algorithm
+            existing_miner.hashrate = existing_miner.hashrate or miner.hashrate
+            existing_miner.power = existing_miner.power or miner.power
+        else:
+            # Уникальный майнер; копия, чтобы слияние не меняло снимки источников
+            if miner.name not in final_miners:
+                dedup.add(miner.name)
+            final_miners[miner.name] = replace(miner)
+
+    return sorted(final_miners.values(), key=lambda m: m.profitability, reverse=True)
+
+# --- Источники данных по ASIC ---
+@dataclass
+class AsicSourceStats:
+    """Состояние источника для /sources: задержка и ошибки последних загрузок."""
+    latency: Optional[float] = None  # секунды, последняя загрузка этой репликой
+    miners: int = 0
+    failures: int = 0  # Подряд неудачных загрузок
+    last_error: Optional[str] = None
+
+
+class AsicSource:
+    """Источник данных по ASIC: загрузка, разбор и собственное расписание обновления.
+
+    Снимок источника хранится в отдельном кэше async_cached (с фоновым
+    обновлением, постоянным и общим кэшем), поэтому источники обновляются
+    независимо каждый через свои refresh_interval секунд. Агрегатор ждет
+    источник без готового снимка не дольше deadline, а снимок старше
+    max_age в слияние не попадает.
+    """
+
+    def __init__(self, name: str, fetch: Callable[[], Any], parse: Callable[[Any], List[AsicMiner]],
+                 refresh_interval: float = Config.ASIC_CACHE_REFRESH, deadline: float = Config.ASIC_SOURCE_DEADLINE,
+                 max_age: float = Config.ASIC_CACHE_MAX_STALE, cpu_bound: bool = False):
+        self.name = name
+        self.fetch = fetch  # Корутина-функция: сырые данные или None при ошибке
+        self.parse = parse
+        self.refresh_interval = refresh_interval
+        self.deadline = deadline
+        self.max_age = max_age
+        self.cpu_bound = cpu_bound  # Разбирать в пуле CPU-задач
+        self.stats = AsicSourceStats()
+
+        async def load() -> List[AsicMiner]:
+            return await self._load()
+        # Имя задает пространство ключей в постоянном и общем кэше
+        load.__name__ = load.__qualname__ = f"asic_source:{name}"
+        self.load = async_cached(MeteredTTLCache(f"asic_source:{name}", maxsize=1, ttl=max_age), refresh_after=refresh_interval,
+                                 prefetch=True, persist=True, shared=True)(load)
+
+    async def _load(self) -> List[AsicMiner]:
+        started = time.monotonic()
+        miners: List[AsicMiner] = []
+        error = None
+        try:
+            raw = await self.fetch()
+            if raw:
+                miners = await run_cpu_bound(self.parse, raw) if self.cpu_bound else self.parse(raw)
+            else:
+                error = "нет данных"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.error(f"Ошибка источника ASIC {self.name}: {e}", exc_info=True)
+        self.stats.latency = time.monotonic() - started
+        if miners:
+            logger.info(f"Получены данные с {self.name}: {len(miners)} моделей за {self.stats.latency:.1f} с.")
+            self.stats.miners, self.stats.failures, self.stats.last_error = len(miners), 0, None
+        else:
+            self.stats.failures += 1
+            self.stats.last_error = error or "пустой список"
+        return miners
+
+    def fetched_at(self) -> Optional[float]:
+        """UNIX-время текущего снимка или None, если снимка нет."""
+        as_of = self.load.data_as_of()
+        return as_of.timestamp() if as_of else None
+
+    async def snapshot(self) -> Optional[List[AsicMiner]]:
+        """Текущий снимок; без него ждет загрузку не дольше deadline (она продолжится в фоне)."""
+        try:
+            return await asyncio.wait_for(self.load(), self.deadline) or None
+        except asyncio.TimeoutError:
+            logger.warning(f"Источник {self.name} не уложился в {self.deadline} с, список собран без него.")
+        except Exception as e:
+            logger.error(f"Ошибка источника ASIC {self.name}: {e}", exc_info=True)
+        return None
+
+
+class AsicAggregator:
+    """Реестр источников ASIC и слияние их свежих снимков.
+
+    Медленный источник не задерживает ответ дольше своего deadline, а
+    слияние пересчитывается, только когда изменился набор или время
+    получения снимков; до этого возвращается тот же список.
+    """
+
+    def __init__(self):
+        self.sources: Dict[str, AsicSource] = {}
+        self.miners: List[AsicMiner] = []
+        self.as_of: Optional[datetime] = None  # Время самого старого снимка в слиянии (UTC)
+        self._version: Optional[tuple] = None
+        self._lock = asyncio.Lock()
+
+    def register(self, source: AsicSource) -> AsicSource:
+        self.sources[source.name] = source
+        return source
+
+    async def get(self) -> List[AsicMiner]:
+        sources = list(self.sources.values())
+        snapshots = await asyncio.gather(*(source.snapshot() for source in sources))
+        fresh = [(source, miners) for source, miners in zip(sources, snapshots) if miners]
+        if not fresh:
+            logger.warning("Не удалось получить данные по ASIC. Используется аварийный список.")
+            return [AsicMiner(**asic) for asic in Config.FALLBACK_ASICS]
+
+        version = tuple((source.name, source.fetched_at()) for source, _ in fresh)
+        async with self._lock:
+            if version != self._version:
+                all_miners = [miner for _, miners in fresh for miner in miners]
+                self.miners = await run_cpu_bound(merge_asic_miners, all_miners)
+                self._version = version
+                oldest = min((fetched_at for _, fetched_at in version if fetched_at), default=None)
+                self.as_of = datetime.fromtimestamp(oldest, tz=timezone.utc) if oldest else None
+                logger.info(f"Список ASIC собран из {', '.join(source.name for source, _ in fresh)}: "
+                            f"{len(self.miners)} уникальных устройств.")
+                await asic_history.save(asic_history.record(self.miners))
+        return self.miners
+
+    def source_status(self) -> List[Tuple[AsicSource, Optional[float]]]:
+        """Источники и возраст их снимков в секундах (None — снимка нет)."""
+        now = time.time()
+        status = []
+        for source in self.sources.values():
+            fetched_at = source.fetched_at()
+            status.append((source, now - fetched_at if fetched_at else None))
+        return status
+
+
+asic_aggregator = AsicAggregator()
+asic_aggregator.register(AsicSource("AsicMinerValue", fetch_asicminervalue_html, parse_asicminervalue_html,
+                                    refresh_interval=3600, deadline=8, cpu_bound=True))
+asic_aggregator.register(AsicSource("WhatToMine", fetch_whattomine_json, parse_whattomine_json,
+                                    refresh_interval=1800, deadline=5))
+
+async def get_profitable_asics() -> List[AsicMiner]:
+    """Список ASIC, слитый из свежих снимков всех источников и отсортированный по доходности."""
+    return await asic_aggregator.get()
+
+def format_asic_sources(status: List[Tuple[AsicSource, Optional[float]]]) -> str:
+    lines = ["🛰 <b>Источники данных по ASIC:</b>\n"]
+    for source, age in status:
+        stats = source.stats
+        freshness = f"обновлен {age / 60:.0f} мин назад" if age is not None else "нет данных"
+        if age is not None and age > source.refresh_interval * 2:
+            freshness = "⚠️ " + freshness
+        line = f"<b>{source.name}</b>: {freshness}, обновление раз в {source.refresh_interval // 60:.0f} мин"
+        if stats.latency is not None:
+            line += f", загрузка {stats.latency:.1f} с, моделей {stats.miners}"
+        if stats.last_error:
+            line += f"\n  ❌ {sanitize_html(stats.last_error)} (неудач подряд: {stats.failures})"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# --- История доходности ASIC ---
+class ProfitabilitySeries:
+    """Ряд доходности одной модели в компактных массивах.
+
+    Время хранится как UNIX-секунды в array('I'), доходность - как float32
+    в array('f'): 8 байт на точку вместо объекта AsicMiner. Последние
+    Config.ASIC_HISTORY_RAW_RETENTION хранятся все точки (при обновлении
+    раз в час - 24 точки, 192 байта на модель в день), более старые
+    сворачиваются в среднее за сутки (8 байт на модель в день) и удаляются
+    после Config.ASIC_HISTORY_RETENTION. Массивы отсортированы по времени,
+    поэтому выборка диапазона - два bisect на ступень.
+    """
+    __slots__ = ('name', 'raw_times', 'raw_values', 'daily_times', 'daily_values')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.raw_times = array('I')
+        self.raw_values = array('f')
+        self.daily_times = array('I')
+        self.daily_values = array('f')
+
+    def append(self, timestamp: int, value: float):
+        self.raw_times.append(timestamp)
+        self.raw_values.append(value)
+
+    def compact(self, now: int):
+        """Сворачивает целые сутки старше окна сырых точек в средние и удаляет устаревшие."""
+        cutoff = now - Config.ASIC_HISTORY_RAW_RETENTION
+        cutoff -= cutoff % 86400  # Только целые сутки: следующая свертка не захватит тот же день
+        split = bisect.bisect_left(self.raw_times, cutoff)
+        if split:
+            days: Dict[int, List[float]] = {}
+            for timestamp, value in zip(self.raw_times[:split], self.raw_values[:split]):
+                totals = days.setdefault(timestamp - timestamp % 86400, [0.0, 0])
+                totals[0] += value
+                totals[1] += 1
+            for day, (total, count) in days.items():
+                self.daily_times.append(day)
+                self.daily_values.append(total / count)
+            del self.raw_times[:split]
+            del self.raw_values[:split]
+
+        expired = bisect.bisect_left(self.daily_times, now - Config.ASIC_HISTORY_RETENTION)
+        if expired:
+            del self.daily_times[:expired]
+            del self.daily_values[:expired]
+
+    def __len__(self) -> int:
+        return len(self.raw_times) + len(self.daily_times)
+
+    def range(self, start: int, end: int) -> Tuple[array, array]:
+        """Точки в интервале [start, end]: сначала средние за сутки, затем сырые."""
+        times, values = array('I'), array('f')
+        for tier_times, tier_values in ((self.daily_times, self.daily_values), (self.raw_times, self.raw_values)):
+            lo = bisect.bisect_left(tier_times, start)
+            hi = bisect.bisect_right(tier_times, end)
+            times.extend(tier_times[lo:hi])
+            values.extend(tier_values[lo:hi])
+        return times, values
+
+
+class ProfitabilityHistory:
+    """Хранилище истории доходности всех моделей ASIC.
+
+    После каждого слияния списка ASIC добавляет по точке на модель (не чаще
+    Config.ASIC_HISTORY_MIN_INTERVAL). Ряды индексируются каноническим
+    названием модели и сохраняются в SQLite как байты массивов; на диск
+    пишутся только измененные ряды. Если файл открыть не удалось,
+    история копится только в памяти.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.series: Dict[str, ProfitabilitySeries] = {}
+        self.last_recorded = 0
+        self._keys: Dict[str, str] = {}  # Название из источника -> каноническое
+        self._compacted_day = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        self._db = open_sqlite(self.path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS asic_history ("
+            "model TEXT PRIMARY KEY, name TEXT NOT NULL, raw_times BLOB, raw_values BLOB, daily_times BLOB, daily_values BLOB)"
+        )
+        for key, name, *blobs in self._db.execute("SELECT * FROM asic_history"):
+            series = ProfitabilitySeries(name)
+            for attr, blob in zip(ProfitabilitySeries.__slots__[1:], blobs):
+                getattr(series, attr).frombytes(blob)
+            self.series[key] = series
+            if series.raw_times:
+                self.last_recorded = max(self.last_recorded, series.raw_times[-1])
+        logger.info(f"История доходности загружена: {len(self.series)} моделей.")
+
+    def record(self, miners: List[AsicMiner], now: Optional[int] = None) -> List[str]:
+        """Добавляет точки по списку майнеров; возвращает ключи измененных рядов."""
+        now = int(time.time()) if now is None else now
+        if now - self.last_recorded < Config.ASIC_HISTORY_MIN_INTERVAL:
+            return []
+        self.last_recorded = now
+        changed = []
+        for miner in miners:
+            key = self._keys.get(miner.name)
+            if key is None:
+                key = self._keys[miner.name] = canonical_miner_name(miner.name)
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = ProfitabilitySeries(miner.name)
+            elif series.raw_times and series.raw_times[-1] == now:
+                continue  # Дубликат модели в одном снимке
+            series.append(now, miner.profitability)
+            changed.append(key)
+        # Свертка выполняется раз в сутки и нужна и рядам моделей, которые пропали из источников
+        if now // 86400 == self._compacted_day:
+            return changed
+        self._compacted_day = now // 86400
+        removed = []
+        for key, series in list(self.series.items()):
+            series.compact(now)
+            if not series:
+                del self.series[key]
+                removed.append(key)
+        return list(self.series) + removed
+
+    def _write(self, upserts: List[Tuple], deletes: List[Tuple[str]]):
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.executemany("INSERT OR REPLACE INTO asic_history VALUES (?, ?, ?, ?, ?, ?)", upserts)
+            self._db.executemany("DELETE FROM asic_history WHERE model = ?", deletes)
+            self._db.commit()
+
+    async def save(self, keys: List[str]):
+        if self._db is None or not keys:
+            return
+        upserts, deletes = [], []
+        for key in keys:
+            series = self.series.get(key)
+            if series is None:
+                deletes.append((key,))
+            else:
+                upserts.append((key, series.name, *(getattr(series, attr).tobytes() for attr in ProfitabilitySeries.__slots__[1:])))
+        try:
+            await asyncio.to_thread(self._write, upserts, deletes)
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось сохранить историю доходности: {e}")
+
+    def find(self, query: str) -> Optional[ProfitabilitySeries]:
+        """Ищет ряд по названию модели: точное совпадение или нечеткий поиск."""
+        series = self.series.get(canonical_miner_name(query))
+        if series is not None:
+            return series
+        match = process.extractOne(query, {key: s.name for key, s in self.series.items()},
+                                   scorer=fuzz.token_set_ratio, score_cutoff=Config.ASIC_HISTORY_MATCH_SCORE)
+        return self.series[match[2]] if match else None
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+asic_history = ProfitabilityHistory(os.path.join(Config.DATA_DIR, Config.ASIC_HISTORY_FILE))
+
+def open_asic_history():
+    """Открывает файл истории доходности; при ошибке история ведется только в памяти."""
+    try:
+        asic_history.open()
+    except (sqlite3.Error, OSError) as e:
+        asic_history.close()
+        logger.error(f"Не удалось открыть историю доходности, работаю только с памятью: {e}")
+
+def render_profitability_chart(name: str, times: array, values: array) -> bytes:
+    """Рисует график доходности модели в PNG. Выполняется в пуле CPU-задач."""
+    fig = mpl_figure.Figure(figsize=(8, 4.5))
+    mpl_agg.FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.plot([datetime.fromtimestamp(t, timezone.utc) for t in times], values, color='#f7931a', linewidth=2)
+    ax.set_title(name)
+    ax.set_ylabel("Доход, $/день")
+    ax.grid(True, alpha=0.3)
+    fig.autofmt_xdate()
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=100)
+    return buf.getvalue()
+
+
+# --- Калькулятор доходности ---
+@async_cached(usd_rub_cache, refresh_after=Config.USD_RUB_CACHE_REFRESH, prefetch=True, persist=True, shared=True)
+async def get_usd_rub_rate() -> Optional[float]:
+    """Получает официальный курс USD/RUB ЦБ РФ."""
+    # Сервер отдает JSON с типом application/javascript, поэтому разбираем текст сами
+    text = await make_request(Config.USD_RUB_RATE_URL, 'text')
+    if not text:
+        return None
+    try:
+        return float(json.loads(text)['Valute']['USD']['Value'])
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Не удалось разобрать курс USD/RUB: {e}")
+        return None
+
+
+class TariffError(ValueError):
+    """Неверный тариф; текст ошибки показывается пользователю."""
+
+
+TARIFF_PATTERN = re.compile(r'([-+]?\d+(?:[.,]\d+)?)(?:\s*(?:-|–|—|\.\.)\s*([-+]?\d+(?:[.,]\d+)?))?')
+
+def parse_tariff_range(text: str) -> 'np.ndarray':
+    """Разбирает тариф "4.5" или диапазон "3-6" в массив тарифов в ₽/кВтч."""
+    match = TARIFF_PATTERN.fullmatch(text.strip())
+    if not match:
+        raise TariffError("Неверный формат. Введите число (например: 4.5) или диапазон (например: 3-6).")
+    parts = [float(part.replace(',', '.')) for part in match.groups() if part is not None]
+    if min(parts) <= 0:
+        raise TariffError("Тариф должен быть больше нуля.")
+    if len(parts) == 1 or parts[0] == parts[1]:
+        return np.array(parts[:1])
+    low, high = parts
+    if low > high:
+        raise TariffError(f"Начало диапазона больше конца. Введите, например: {high:g}-{low:g}.")
+    return np.linspace(low, high, Config.CALCULATOR_RANGE_STEPS)
+
+
+class ProfitCalculator:
+    """Векторный калькулятор доходности по всем ASIC из кэша.
+
+    Доход, потребление и цена устройств хранятся в массивах NumPy, которые
+    строятся один раз на каждое слияние списка ASIC. Чистая прибыль,
+    точка безубыточности и ROI считаются сразу для всех майнеров, а для
+    диапазона тарифов - одной матрицей (тарифы x майнеры).
+    """
+
+    def __init__(self, miners: List[AsicMiner]):
+        self.source = miners
+        self.miners = [m for m in miners if m.power]  # Без мощности расход посчитать нельзя
+        self.revenue = np.array([m.profitability for m in self.miners], dtype=np.float64)  # USD/день
+        self.daily_kwh = np.array([m.power for m in self.miners], dtype=np.float64) * 24 / 1000
+        self.price = np.array([m.price or np.nan for m in self.miners], dtype=np.float64)  # USD
+        self.break_even = self.revenue / self.daily_kwh  # USD/кВтч, при котором прибыль равна нулю
+
+    def __len__(self) -> int:
+        return len(self.miners)
+
+    def net_profit(self, tariffs_usd: 'np.ndarray') -> 'np.ndarray':
+        """Чистая прибыль в USD/день: матрица (тарифы x майнеры)."""
+        return self.revenue - np.outer(np.atleast_1d(tariffs_usd), self.daily_kwh)
+
+    def annual_roi(self, net_profit: 'np.ndarray') -> 'np.ndarray':
+        """Годовой ROI в процентах от цены устройства; NaN, если цена неизвестна."""
+        return net_profit * 365 / self.price * 100
+
+    def top(self, tariff_usd: float, limit: int = Config.CALCULATOR_TOP_COUNT) -> List[Tuple[AsicMiner, float, float, float]]:
+        """Настоящий топ по чистой прибыли: (майнер, прибыль/день, безубыточный тариф, ROI %)."""
+        if not self.miners:
+            return []
+        net = self.net_profit(tariff_usd)[0]
+        limit = min(limit, len(net))
+        # argpartition выбирает лучшие за O(n), сортируются только они
+        best = np.argpartition(-net, limit - 1)[:limit]
+        best = best[np.argsort(-net[best])]
+        roi = self.annual_roi(net)[best]
+        return [(self.miners[i], float(net[i]), float(self.break_even[i]), float(r)) for i, r in zip(best, roi)]
+
+    def best_by_tariff(self, tariffs_usd: 'np.ndarray') -> List[Tuple[AsicMiner, float, int]]:
+        """Для каждого тарифа: лучший майнер, его прибыль/день и число прибыльных майнеров."""
+        if not self.miners:
+            return []
+        net = self.net_profit(tariffs_usd)
+        best = net.argmax(axis=1)
+        profitable = (net > 0).sum(axis=1)
+        return [(self.miners[i], float(net[row, i]), int(count)) for row, (i, count) in enumerate(zip(best, profitable))]
+
+
+profit_calculator: Optional[ProfitCalculator] = None
+
+async def get_profit_calculator() -> Optional[ProfitCalculator]:
+    """Калькулятор по текущему списку ASIC; пересоздается, только когда кэш обновился."""
+    global profit_calculator
+    asics = await get_profitable_asics()
+    if not asics:
+        return None
+    if profit_calculator is None or profit_calculator.source is not asics:
+        profit_calculator = ProfitCalculator(asics)
+    return profit_calculator
+
+def format_profit_top(calculator: ProfitCalculator, tariff_rub: float, rate_usd_rub: float) -> str:
+    res = [f"💰 <b>Расчет профита (розетка {tariff_rub:.2f} ₽/кВтч, курс {rate_usd_rub:.2f} ₽/$)</b>\n"]
+    for asic, profit, break_even, roi in calculator.top(tariff_rub / rate_usd_rub):
+        line = f"<b>{sanitize_html(asic.name)}</b>: ${profit:.2f}/день, безубыточно до {break_even * rate_usd_rub:.2f} ₽/кВтч"
+        if np.isfinite(roi):
+            line += f", ROI {roi:.0f}%/год"
+        res.append(line)
+    return "\n".join(res)
+
+def format_profit_by_tariff(calculator: ProfitCalculator, tariffs_rub: 'np.ndarray', rate_usd_rub: float) -> str:
+    res = [f"💰 <b>Лучший ASIC по тарифам (курс {rate_usd_rub:.2f} ₽/$)</b>\n"]
+    for tariff_rub, (asic, profit, profitable) in zip(tariffs_rub, calculator.best_by_tariff(tariffs_rub / rate_usd_rub)):
+        res.append(f"{tariff_rub:.2f} ₽/кВтч: <b>{sanitize_html(asic.name)}</b> ${profit:.2f}/день, прибыльных {profitable} из {len(calculator)}")
+    return "\n".join(res)
+
+
+# --- Модуль для получения данных по криптовалютам ---
+@async_cached(cache=coin_list_cache, refresh_after=Config.COIN_LIST_CACHE_REFRESH, prefetch=True, persist=True, shared=True)
+async def get_coin_list() -> Dict[str, str]:
+    """Получает и кэширует полный список монет с их алгоритмами из Minerstat."""
+    logger.info("Обновление кэша списка монет с алгоритмами...")
+    coin_algo_map = {}
+    data = await make_request("https://api.minerstat.com/v2/coins")
+    if data:
+        for coin_data in data:
+            symbol = coin_data.get('coin')
+            algorithm = coin_data.get('algorithm')
+            if symbol and algorithm:
+                coin_algo_map[symbol.upper()] = algorithm
+    logger.info(f"Кэш списка монет обновлен. Загружено {len(coin_algo_map)} монет.")
+    return coin_algo_map
+
+class CoinIndex:
+    """Индекс монет CoinGecko в памяти: поиск по тикеру, id, названию и алиасам.
+
+    Точные совпадения ищутся в словарях, префиксы — бинарным поиском по
+    отсортированному списку ключей (для префиксов из одной-двух букв лучшие
+    монеты посчитаны заранее), опечатки — нечетким сравнением только с
+    монетами из рейтинга капитализации. Среди монет с одинаковым тикером
+    выбирается самая капитализированная. Текст, не похожий на монету,
+    отклоняется без сетевых запросов.
+    """
+    MIN_PREFIX_LENGTH = 3
+    SHORT_PREFIX_LENGTH = 2  # Префиксы не длиннее этого отвечаются из готовой таблицы
+    COMPLETE_LIMIT = 10
+
+    def __init__(self, coins: List[Dict[str, str]], ranks: Dict[str, int]):
+        self.names: Dict[str, str] = {}
+        self.symbols: Dict[str, str] = {}
+        self.ranks = ranks
+        exact: Dict[str, List[str]] = defaultdict(list)
+        for coin in coins:
+            coin_id, symbol, name = coin.get('id'), (coin.get('symbol') or '').lower(), (coin.get('name') or '').lower()
+            if not coin_id:
+                continue
+            self.names[coin_id] = coin.get('name') or coin_id
+            self.symbols[coin_id] = symbol.upper()
+            for k in {coin_id, symbol, name}:
+                if k:
+                    exact[k].append(coin_id)
+        for alias, symbol in Config.TICKER_ALIASES.items():
+            exact[alias.lower()].extend(exact.get(symbol.lower(), []))
+
+        # Для каждого ключа сразу выбираем лучшую монету
+        self.exact: Dict[str, str] = {k: min(ids, key=self._priority) for k, ids in exact.items() if ids}
+        self.sorted_keys: List[str] = sorted(self.exact)
+        self.fuzzy_choices: Dict[str, str] = {self.names[i].lower(): i for i in ranks if i in self.names}
+        self.short_prefixes  # Строится здесь же, в пуле CPU-задач
+
+    @functools.cached_property
+    def short_prefixes(self) -> Dict[str, List[str]]:
+        """Лучшие монеты для коротких префиксов: их диапазон ключей — тысячи записей.
+
+        Свойство, а не поле конструктора: индексы, восстановленные с диска
+        из старых версий, достраивают таблицу при первом обращении.
+        """
+        by_prefix: Dict[str, Set[str]] = defaultdict(set)
+        for k, coin_id in self.exact.items():
+            for length in range(1, min(len(k), self.SHORT_PREFIX_LENGTH) + 1):
+                by_prefix[k[:length]].add(coin_id)
+        return {prefix: sorted(ids, key=self._priority)[:self.COMPLETE_LIMIT] for prefix, ids in by_prefix.items()}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _priority(self, coin_id: str) -> Tuple[int, int, str]:
+        return (self.ranks.get(coin_id, 10 ** 9), len(coin_id), coin_id)
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return query.strip().lower().lstrip('$#/').replace('ё', 'е')
+
+    def complete(self, prefix: str, limit: int = COMPLETE_LIMIT) -> List[str]:
+        """Возвращает до limit id монет, у которых тикер, id, название или алиас начинается с prefix."""
+        prefix = self.normalize(prefix)
+        if not prefix:
+            return []
+        if len(prefix) <= self.SHORT_PREFIX_LENGTH and limit <= self.COMPLETE_LIMIT:
+            return self.short_prefixes.get(prefix, [])[:limit]
+        found: Dict[str, None] = {}
+        keys = self.sorted_keys
+        # Обход по индексу: islice пропускал бы первые start ключей по одному
+        for i in range(bisect.bisect_left(keys, prefix), len(keys)):
+            if not keys[i].startswith(prefix):
+                break
+            found[self.exact[keys[i]]] = None
+        return sorted(found, key=self._priority)[:limit]
+
+    def resolve(self, query: str, exact_only: bool = False) -> Optional[str]:
+        """Разрешает пользовательский запрос в id монеты CoinGecko или возвращает None."""
+        query = self.normalize(query)
+        if not query or len(query) > Config.COIN_QUERY_MAX_LENGTH:
+            return None
+        if query in self.exact:
+            return self.exact[query]
+        if not exact_only and len(query) >= self.MIN_PREFIX_LENGTH:
+            candidates = self.complete(query, limit=1)
+            if candidates:
+                return candidates[0]
+            match = process.extractOne(query, self.fuzzy_choices.keys(), scorer=fuzz.ratio,
+                                       score_cutoff=Config.COIN_FUZZY_SCORE)
+            if match:
+                return self.fuzzy_choices[match[0]]
+        return None
+
+    def resolve_chat(self, text: str) -> Optional[str]:
+        """Строгое разрешение обычного сообщения чата: только точные совпадения без опечаток.
+
+        Из ~15 тыс. монет CoinGecko многие называются обычными словами, поэтому
+        принимаются алиасы, монеты из первых Config.COIN_CHAT_MAX_RANK по
+        капитализации и любые монеты, если запрос начинается с $.
+        """
+        coin_id = self.resolve(text, exact_only=True)
+        if coin_id is None or text.strip().startswith('$'):
+            return coin_id
+        if self.normalize(text) in Config.TICKER_ALIASES:
+            return coin_id
+        if self.ranks.get(coin_id, Config.COIN_CHAT_MAX_RANK + 1) <= Config.COIN_CHAT_MAX_RANK:
+            return coin_id
+        return None
+
+
+@async_cached(coin_index_cache, refresh_after=Config.COIN_INDEX_REFRESH, prefetch=True, persist=True)
+async def get_coin_index() -> Optional[CoinIndex]:
+    """Загружает полный список монет CoinGecko и строит локальный индекс."""
+    logger.info("Обновление индекса монет...")
+    coins = await make_request("https://api.coingecko.com/api/v3/coins/list")
+    if not coins:
+        return None
+
+    ranks: Dict[str, int] = {}
+    for page in range(1, Config.COIN_INDEX_RANKED_PAGES + 1):
+        markets = await make_request("https://api.coingecko.com/api/v3/coins/markets",
+                                     params={'vs_currency': 'usd', 'order': 'market_cap_desc', 'per_page': 250, 'page': page})
+        for position, item in enumerate(markets or [], start=len(ranks) + 1):
+            ranks[item['id']] = item.get('market_cap_rank') or position
+
+    index = await run_cpu_bound(CoinIndex, coins, ranks)
+    logger.info(f"Индекс монет обновлен. Загружено {len(index)} монет.")
+    return index
+
+async def resolve_coin_id(query: str, strict: bool = False) -> Optional[str]:
+    """Разрешает запрос в id монеты по локальному индексу.
+
+    Если индекс недоступен, используется /search CoinGecko. В строгом режиме
+    (для обычных сообщений в чате) принимается только то, что узнает
+    CoinIndex.resolve_chat, и сеть не используется.
+    """
+    index = await get_coin_index()
+    if index:
+        return index.resolve_chat(query) if strict else index.resolve(query)
+    if strict:
+        return None
+
+    query = CoinIndex.normalize(query)
+    query = Config.TICKER_ALIASES.get(query, query)
+    search_data = await make_request("https://api.coingecko.com/api/v3/search", params={'query': query})
+    if not search_data or not search_data.get('coins'):
+        return None
+    return search_data['coins'][0].get('id')
+
+async def fetch_coin_markets(coin_ids: List[str]) -> Dict[str, Dict]:
+    """Один запрос /coins/markets сразу для нескольких монет. Возвращает данные по id."""
+    market_data_list = await make_request("https://api.coingecko.com/api/v3/coins/markets",
+                                          params={'vs_currency': 'usd', 'ids': ','.join(coin_ids),
+                                                  'per_page': len(coin_ids)})
+    return {item['id']: item for item in market_data_list or [] if item.get('id')}
+
+
+class PriceBatcher:
+    """Собирает одновременные запросы цен в пакеты (micro-batching).
+
+    Запросы, пришедшие в течение окна window, уходят одним вызовом
+    /coins/markets; при max_ids монет пакет отправляется сразу.
+    Статистика показывает средний размер пакета и сэкономленные запросы.
+    """
+
+    def __init__(self, window: float = Config.PRICE_BATCH_WINDOW, max_ids: int = Config.PRICE_BATCH_MAX_IDS):
+        self.window = window
+        self.max_ids = max_ids
+        self.pending: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.requests = 0
+        self.upstream_calls = 0
+        self.batched_ids = 0
+        self.max_batch_size = 0
+
+    async def get(self, coin_id: str) -> Optional[Dict]:
+        """Возвращает данные /coins/markets для монеты, дождавшись общего пакета."""
+        self.requests += 1
+        future = self.pending.get(coin_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.pending[coin_id] = future
+        if len(self.pending) >= self.max_ids:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self.pending = self.pending, {}
+        if batch:
+            # Через spawn_background: на задачу есть ссылка, и сборщик мусора не прервет выборку
+            spawn_background(self._fetch(batch))
+
+    async def _fetch(self, batch: Dict[str, asyncio.Future]):
+        self.upstream_calls += 1
+        self.batched_ids += len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        try:
+            markets = await fetch_coin_markets(list(batch))
+        except asyncio.CancelledError:
+            for future in batch.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for coin_id, future in batch.items():
+            if not future.done():
+                future.set_result(markets.get(coin_id))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'requests': self.requests,
+            'upstream_calls': self.upstream_calls,
+            'calls_saved': self.requests - self.upstream_calls,
+            'avg_batch_size': self.batched_ids / self.upstream_calls if self.upstream_calls else 0.0,
+            'max_batch_size': self.max_batch_size,
+        }
+
+
+price_batcher = PriceBatcher()
+
+@async_cached(price_cache, refresh_after=Config.PRICE_CACHE_REFRESH, persist=True, shared=True)
+async def get_coin_market(coin_id: str) -> Optional[CryptoCoin]:
+    """Получает цену и алгоритм монеты по ее id CoinGecko (через пакетные запросы)."""
+    market_data = await price_batcher.get(coin_id)
+    if not market_data:
+        return None
+    
+    symbol = market_data.get('symbol', '').upper()
+    
+    coin_algo_map = await get_coin_list()
+    algorithm = coin_algo_map.get(symbol)
+
+    return CryptoCoin(
+        id=market_data.get('id'),
+        symbol=symbol,
+        name=market_data.get('name'),
+        price=market_data.get('current_price', 0.0),
+        price_change_24h=market_data.get('price_change_percentage_24h'),
+        algorithm=algorithm
+    )
+
+async def get_crypto_price(query: str) -> Optional[CryptoCoin]:
+    """Получает цену и алгоритм для криптовалюты, используя CoinGecko."""
+    coin_id = await resolve_coin_id(query)
+    if not coin_id:
+        return None
+    return await get_coin_market(coin_id)
+
+def format_coin_price(coin: CryptoCoin) -> str:
+    change_24h = coin.price_change_24h or 0
+    emoji = "📈" if change_24h >= 0 else "📉"
+    text = (
+        f"<b>{coin.name} ({coin.symbol})</b>\n"
+        f"💹 Курс: <b>${coin.price:,.4f}</b>\n"
+        f"{emoji} Изменение за 24ч: <b>{change_24h:.2f}%</b>\n"
+    )
+    if coin.algorithm:
+        text += f"⚙️ Алгоритм: <code>{coin.algorithm}</code>"
+    return text
+
+
+class InlineDebouncer:
+    """Пропускает только последний inline-запрос пользователя за delay секунд.
+
+    Пока пользователь печатает, каждый новый символ заменяет предыдущий
+    запрос; ответ получает только тот, после которого была пауза.
+    """
+
+    def __init__(self, delay: float = Config.INLINE_DEBOUNCE):
+        self.delay = delay
+        self.latest: TTLCache = TTLCache(maxsize=10_000, ttl=60)  # user_id -> id последнего запроса
+
+    def push(self, user_id: int, query_id: str):
+        self.latest[user_id] = query_id
+
+    async def settle(self, user_id: int, query_id: str) -> bool:
+        """Ждет delay и возвращает True, если за это время не пришло нового запроса."""
+        await asyncio.sleep(self.delay)
+        return self.latest.get(user_id) == query_id
+
+
+inline_debouncer = InlineDebouncer()
+
+def inline_coin_ids(index: 'CoinIndex', text: str) -> List[str]:
+    """Кандидаты для inline-ответа: точное совпадение первым, затем продолжения префикса."""
+    if not text.strip():
+        return [index.exact[t.lower()] for t in Config.POPULAR_TICKERS if t.lower() in index.exact]
+    ids = index.complete(text, limit=Config.INLINE_RESULTS_LIMIT)
+    exact = index.resolve(text, exact_only=True)
+    if exact:
+        ids = [exact] + [i for i in ids if i != exact][:Config.INLINE_RESULTS_LIMIT - 1]
+    return ids
+
+def build_inline_price_results(coins: List[CryptoCoin]) -> List[InlineQueryResultArticle]:
+    results = []
+    for coin in coins:
+        change = f"{coin.price_change_24h:+.2f}% за 24ч" if coin.price_change_24h is not None else ""
+        results.append(InlineQueryResultArticle(
+            id=coin.id,
+            title=f"{coin.name} ({coin.symbol}) — ${coin.price:,.4f}",
+            description=change,
+            input_message_content=InputTextMessageContent(message_text=format_coin_price(coin)),
+        ))
+    return results
+
+# --- Модуль "Индекс страха и жадности" ---
+@async_cached(fear_greed_cache, persist=True, shared=True)
+async def get_fear_and_greed_index() -> Optional[Dict]:
+    """Получает "Индекс страха и жадности"."""
+    data = await make_request("https://api.alternative.me/fng/?limit=1")
+    if data and 'data' in data and data['data']:
+        return data['data'][0]
+    return None
+
+class FearGreedGaugeRenderer:
+    """Рисует шкалу индекса страха и жадности в PNG.
+
+    Фон (цветная дуга) строится один раз, а на каждый вызов добавляются только
+    стрелка и подписи, которые после сохранения удаляются. Используется
+    объектный API matplotlib (Figure + Agg) без pyplot и глобального состояния;
+    общую фигуру защищает блокировка, поэтому рисовать можно из пула потоков.
+    """
+    COLORS = ['#d94b4b', '#e88452', '#ece36a', '#b7d968', '#73c269']
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fig: Optional['mpl_figure.Figure'] = None
+        self._ax = None
+
+    def _build_background(self):
+        fig = mpl_figure.Figure(figsize=(8, 4.5))
+        mpl_agg.FigureCanvasAgg(fig)
+        ax = fig.add_subplot(projection='polar')
+        ax.set_yticklabels([])
+        ax.set_xticklabels([])
+        ax.grid(False)
+        ax.spines['polar'].set_visible(False)
+        ax.set_ylim(0, 1)
+        # Вся дуга из 100 сегментов — одним вызовом barh
+        ax.barh([1] * 100, [0.0314] * 100, left=[3.14 - (i * 0.0314) for i in range(100)], height=0.3,
+                color=[self.COLORS[min(len(self.COLORS) - 1, int(i / 25))] for i in range(100)])
+        self._fig, self._ax = fig, ax
+
+    def render(self, value: int, classification: str) -> bytes:
+        with self._lock:
+            if self._fig is None:
+                self._build_background()
+            fig, ax = self._fig, self._ax
+            angle = 3.14 - (value * 0.0314)
+            overlay = [
+                ax.annotate('', xy=(angle, 1), xytext=(0, 0), arrowprops=dict(facecolor='white', edgecolor='white', shrink=0.05, width=4, headwidth=10)),
+                fig.text(0.5, 0.5, f"{value}", ha='center', va='center', fontsize=48, color='white', weight='bold'),
+                fig.text(0.5, 0.35, classification, ha='center', va='center', fontsize=20, color='white'),
+            ]
+            try:
+                buf = io.BytesIO()
+                fig.savefig(buf, format='png', dpi=150, transparent=True)
+                return buf.getvalue()
+            finally:
+                for artist in overlay:
+                    artist.remove()
+
+
+fear_greed_gauge = FearGreedGaugeRenderer()
+
+def render_fear_greed_gauge(value: int, classification: str) -> bytes:
+    """Рисует шкалу индекса в PNG. Выполняется в пуле CPU-задач (в процессе — со своим фоном)."""
+    return fear_greed_gauge.render(value, classification)
+
+@async_cached(fear_greed_image_cache)
+async def get_fear_greed_image(value: int, classification: str) -> bytes:
+    """Возвращает PNG шкалы индекса, рисуя его только при первом запросе значения."""
+    return await run_cpu_bound(render_fear_greed_gauge, value, classification)
+
+# --- Модуль новостей ---
+def parse_rss_feed(text: str) -> List[Dict]:
+    """Разбирает RSS-ленту в список новостей. Выполняется в пуле CPU-задач."""
+    feed = feedparser.parse(text)
+    if feed.bozo and not feed.entries:
+        # feedparser не бросает исключений: битая лента - это bozo без записей
+        raise ValueError(f"некорректная лента: {feed.get('bozo_exception')}")
+    items = []
+    for entry in feed.entries:
+        published = getattr(entry, 'published_parsed', None)
+        items.append({
+            'id': entry.get('id') or entry.link,
+            'title': entry.title,
+            'link': entry.link,
+            'published': calendar.timegm(published) if published else None,  # UNIX-время
+        })
+    return items
+
+
+# --- Поиск почти одинаковых новостей ---
+NEWS_STOPWORDS = frozenset({
+    'и', 'в', 'во', 'на', 'по', 'за', 'из', 'от', 'до', 'для', 'что', 'как', 'это', 'не', 'с', 'со', 'к', 'о', 'об',
+    'the', 'a', 'an', 'of', 'to', 'in', 'on', 'for', 'and', 'is', 'at', 'by', 'with', 'as',
+})
+NEWS_SIGNATURE_FORMAT = struct.Struct(f'<{Config.NEWS_MINHASH_PERMUTATIONS}I')
+
+def normalize_news_title(title: str) -> str:
+    """Приводит заголовок к виду для сравнения: нижний регистр, без пунктуации и стоп-слов.
+
+    Слова обрезаются до Config.NEWS_STEM_LENGTH символов, чтобы разные
+    падежные окончания ("биткоина", "биткоину") совпадали.
+    """
+    words = re.findall(r'[a-zа-я0-9]+', title.lower().replace('ё', 'е'))
+    return ' '.join(word[:Config.NEWS_STEM_LENGTH] for word in words if word not in NEWS_STOPWORDS)
+
+@functools.lru_cache(maxsize=65536)
+def _shingle_hashes(shingle: str) -> Tuple[int, ...]:
+    """Значения шингла под всеми перестановками MinHash одним вызовом SHAKE-128."""
+    return NEWS_SIGNATURE_FORMAT.unpack(hashlib.shake_128(shingle.encode()).digest(NEWS_SIGNATURE_FORMAT.size))
+
+def news_title_signature(title: str) -> Tuple[int, ...]:
+    """MinHash-сигнатура заголовка по шинглам: словам и парам соседних слов.
+
+    Доля совпадающих позиций двух сигнатур оценивает коэффициент Жаккара
+    множеств шинглов. Пустой кортеж означает, что сравнивать нечего.
+    """
+    words = normalize_news_title(title).split()
+    if not words:
+        return ()
+    shingles = set(words)
+    shingles.update(' '.join(pair) for pair in zip(words, words[1:]))
+    return tuple(map(min, zip(*map(_shingle_hashes, shingles))))
+
+def news_title_signatures(titles: List[str]) -> List[Tuple[int, ...]]:
+    """Сигнатуры для пачки заголовков. Выполняется в пуле CPU-задач."""
+    return [news_title_signature(title) for title in titles]
+
+def signature_similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    return sum(map(operator.eq, a, b)) / len(a)
+
+
+class NewsDeduplicator:
+    """LSH-индекс MinHash-сигнатур для объединения новостей в сюжеты.
+
+    Сигнатура режется на Config.NEWS_LSH_BANDS полос; заголовки, совпавшие
+    хотя бы в одной полосе, становятся кандидатами и сверяются по оценке
+    сходства. Так каждый новый заголовок сравнивается только с похожими,
+    а не со всеми, и объем работы растет почти линейно.
+    """
+
+    def __init__(self, bands: int = Config.NEWS_LSH_BANDS, threshold: float = Config.NEWS_DUPLICATE_SIMILARITY):
+        self.bands = bands
+        self.rows = Config.NEWS_MINHASH_PERMUTATIONS // bands
+        self.threshold = threshold
+        self.buckets: Dict[Tuple[int, int], Set[Hashable]] = defaultdict(set)
+        self.signatures: Dict[Hashable, Tuple[int, ...]] = {}
+        self.story_of: Dict[Hashable, Hashable] = {}
+        self.members: Dict[Hashable, Set[Hashable]] = defaultdict(set)
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, int]]:
+        rows = self.rows
+        return [(band, hash(signature[band * rows:(band + 1) * rows])) for band in range(self.bands)]
+
+    def find_story(self, signature: Tuple[int, ...]) -> Optional[Hashable]:
+        """Возвращает сюжет самого похожего заголовка или None, если похожих нет."""
+        if not signature:
+            return None
+        candidates = set()
+        for band_key in self._band_keys(signature):
+            candidates.update(self.buckets.get(band_key, ()))
+        best_key, best_score = None, self.threshold
+        for key in candidates:
+            score = signature_similarity(signature, self.signatures[key])
+            if score >= best_score:
+                best_key, best_score = key, score
+        return None if best_key is None else self.story_of[best_key]
+
+    def add(self, key: Hashable, signature: Tuple[int, ...], story: Hashable):
+        self.story_of[key] = story
+        self.members[story].add(key)
+        if not signature:
+            return
+        self.signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self.buckets[band_key].add(key)
+
+    def remove_story(self, story: Hashable):
+        for key in self.members.pop(story, ()):
+            del self.story_of[key]
+            signature = self.signatures.pop(key, None)
+            if signature:
+                for band_key in self._band_keys(signature):
+                    bucket = self.buckets[band_key]
+                    bucket.discard(key)
+                    if not bucket:
+                        del self.buckets[band_key]
+
+
+def news_priority(item: Dict) -> Tuple[float, int]:
+    """Ключ выбора главной новости сюжета: раньше опубликованная, затем источник выше в Config.NEWS_RSS_FEEDS."""
+    source = item.get('source')
+    rank = Config.NEWS_RSS_FEEDS.index(source) if source in Config.NEWS_RSS_FEEDS else len(Config.NEWS_RSS_FEEDS)
+    return (item['published'] if item.get('published') is not None else float('inf'), rank)
+
+def cluster_news(items: List[Dict], signatures: List[Tuple[int, ...]],
+                 dedup: NewsDeduplicator) -> Dict[Hashable, List[Dict]]:
+    """Раскладывает новости по сюжетам индекса dedup и добавляет их в индекс.
+
+    Новый сюжет получает id своей первой новости, item['story'] заполняется.
+    Новости обходятся в порядке news_priority, поэтому первой в списке
+    каждого сюжета идет главная из переданных.
+    """
+    stories: Dict[Hashable, List[Dict]] = defaultdict(list)
+    for item, signature in sorted(zip(items, signatures), key=lambda pair: news_priority(pair[0])):
+        story = dedup.find_story(signature)
+        if story is None:
+            story = item['id']
+        item['story'] = story
+        dedup.add(item['id'], signature, story)
+        stories[story].append(item)
+    return stories
+
+
+class NewsIngester:
+    """Инкрементальный сбор RSS-лент.
+
+    Для каждой ленты запоминаются ETag и Last-Modified, и следующие запросы
+    отправляются условными: неизмененная лента отвечает 304 и не скачивается
+    и не разбирается заново. Ограниченное множество уже виденных GUID/ссылок
+    отсекает старые записи, поэтому в хранилище попадают только новые.
+    Почти одинаковые заголовки из разных лент объединяются в сюжет
+    (NewsDeduplicator), и хранится только главная новость сюжета.
+    Для каждой новости помнится, была ли она отправлена авто-рассылкой.
+    Состояние сохраняется в JSON-файл и переживает перезапуск.
+    """
+
+    def __init__(self, feeds: List[str], state_path: str,
+                 max_seen: int = Config.NEWS_SEEN_LIMIT, max_recent: int = Config.NEWS_RECENT_LIMIT):
+        self.feeds = feeds
+        self.state_path = state_path
+        self.max_seen = max_seen
+        self.max_recent = max_recent
+        self.validators: Dict[str, Dict[str, str]] = {}
+        self.seen: OrderedDict = OrderedDict()
+        self.recent: List[Dict] = []
+        self.dedup = NewsDeduplicator()
+        self._lock = asyncio.Lock()
+
+    def load(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось загрузить состояние новостей: {e}")
+            return
+        self.validators = state.get('validators', {})
+        self.seen = OrderedDict.fromkeys(state.get('seen', []))
+        self.recent = state.get('recent', [])
+        self.dedup = NewsDeduplicator()
+        for item in self.recent:
+            self.dedup.add(item['id'], news_title_signature(item['title']), item.setdefault('story', item['id']))
+        logger.info(f"Состояние новостей загружено: {len(self.seen)} известных записей.")
+
+    def _write_state(self, state: Dict):
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    async def save(self):
+        state = {'validators': self.validators, 'seen': list(self.seen), 'recent': self.recent}
+        try:
+            await asyncio.to_thread(self._write_state, state)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить состояние новостей: {e}")
+
+    async def _fetch_feed(self, url: str) -> List[Dict]:
+        validators = self.validators.get(url, {})
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+        response = await make_request(url, 'full', headers=headers)
+        if response is None:
+            return []
+        if response.status == 304:
+            logger.debug(f"RSS-лента {url} не изменилась.")
+            return []
+        try:
+            items = await run_cpu_bound(parse_rss_feed, response.text)
+        except Exception as e:
+            logger.warning(f"Не удалось спарсить RSS-ленту {url}: {e}")
+            return []
+        # Только после разбора: иначе битый ответ запомнился бы, и следующий запрос получил бы 304
+        self.validators[url] = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        for item in items:
+            item['source'] = url
+        return items
+
+    async def ingest(self) -> List[Dict]:
+        """Опрашивает все ленты и возвращает новые сюжеты."""
+        async with self._lock:
+            results = await asyncio.gather(*(self._fetch_feed(url) for url in self.feeds))
+            new_items = []
+            for item in itertools.chain.from_iterable(results):
+                key = item['id']
+                if key in self.seen:
+                    continue
+                self.seen[key] = None
+                item['sent'] = False
+                new_items.append(item)
+            while len(self.seen) > self.max_seen:
+                self.seen.popitem(last=False)
+
+            if new_items:
+                new_items = await self._merge_stories(new_items)
+                logger.info(f"Получено новых сюжетов: {len(new_items)}.")
+            await self.save()
+            return new_items
+
+    async def _merge_stories(self, items: List[Dict]) -> List[Dict]:
+        """Раскладывает новые записи по сюжетам и оставляет в recent по одной новости на сюжет.
+
+        Если копия сюжета вышла раньше (или в более приоритетной ленте), а сюжет
+        еще не отправлен, она становится главной новостью вместо прежней.
+        """
+        signatures = await run_cpu_bound(news_title_signatures, [item['title'] for item in items])
+        main_items = {item['story']: item for item in self.recent}
+        changed = {}
+        for story, story_items in cluster_news(items, signatures, self.dedup).items():
+            item = story_items[0]
+            main = main_items.get(story)
+            if main is None or (not main['sent'] and news_priority(item) < news_priority(main)):
+                main_items[story] = changed[story] = item
+
+        ranked = sorted(main_items.values(), key=lambda x: x['published'] or 0, reverse=True)
+        self.recent = ranked[:self.max_recent]
+        for item in ranked[self.max_recent:]:
+            self.dedup.remove_story(item['story'])
+            changed.pop(item['story'], None)
+        return list(changed.values())
+
+    def latest(self, limit: int = Config.NEWS_TOP_COUNT) -> List[Dict]:
+        """Самые свежие сюжеты."""
+        return self.recent[:limit]
+
+    def take_unsent(self, limit: int = Config.NEWS_TOP_COUNT) -> List[Dict]:
+        """Возвращает самые свежие еще не отправленные сюжеты и помечает все ожидающие отправленными.
+
+        Как и раньше, в рассылку попадают только limit самых свежих; более
+        старые неотправленные сюжеты не досылаются в следующий раз.
+        """
+        unsent = [item for item in self.recent if not item.get('sent')]
+        for item in unsent:
+            item['sent'] = True
+        return unsent[:limit]
+
+
+news_ingester = NewsIngester(Config.NEWS_RSS_FEEDS, os.path.join(Config.DATA_DIR, Config.NEWS_STATE_FILE))
+
+@async_cached(cache=news_cache, persist=True, shared=True)
+async def fetch_latest_news() -> List[Dict]:
+    """Забирает новые записи из RSS-лент и возвращает список последних новостей."""
+    await news_ingester.ingest()
+    return news_ingester.latest()
+
+# --- Модули статуса сети ---
+@dataclass
+class NetworkState:
+    """Снимок состояния сети Bitcoin: последний блок, комиссии и размер мемпула."""
+    height: Optional[int] = None
+    block_time: Optional[float] = None  # UNIX-время последнего блока
+    fees: Dict[str, int] = field(default_factory=dict)  # Рекомендуемые комиссии mempool.space, sat/vB
+    mempool_count: Optional[int] = None
+    updated_at: float = 0.0  # UNIX-время последнего обновления
+
+
+class MempoolFeed:
+    """Подписка на WebSocket mempool.space с моментальным снимком состояния сети.
+
+    Фоновая задача держит соединение, подписывается на блоки и статистику
+    и обновляет NetworkState по мере прихода сообщений, поэтому обработчики
+    «Халвинг» и «Статус BTC» не делают запросов. При обрыве или долгой
+    тишине соединение переоткрывается с экспоненциальной задержкой.
+    Подписчики on_block и on_fees вызываются на каждый новый блок и
+    обновление комиссий.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.state = NetworkState()
+        self.on_block: List[Callable[[NetworkState], Any]] = []
+        self.on_fees: List[Callable[[NetworkState], Any]] = []
+        self.last_message_at = 0.0  # time.monotonic()
+        self.reconnects = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_live(self) -> bool:
+        """Соединение открыто и недавно присылало данные."""
+        return (self.state.height is not None
+                and time.monotonic() - self.last_message_at < Config.MEMPOOL_WS_IDLE_TIMEOUT)
+
+    def handle_message(self, data: Dict, notify: bool = True):
+        """Применяет сообщение потока к снимку и уведомляет подписчиков.
+
+        notify=False только обновляет снимок: так применяется HTTP-ответ,
+        запрошенный нажатием пользователя, чтобы клики не сдвигали базу
+        детектора всплесков комиссий.
+        """
+        state = self.state
+        blocks = data.get('blocks') or ([data['block']] if data.get('block') else [])
+        blocks = [block for block in blocks if isinstance(block, dict) and isinstance(block.get('height'), int)]
+        if blocks:
+            tip = max(blocks, key=lambda block: block['height'])
+            height = tip['height']
+            if state.height is None or height > state.height:
+                is_new = state.height is not None
+                state.height = height
+                state.block_time = tip.get('timestamp')
+                if is_new and notify:
+                    self._notify(self.on_block)
+        mempool_info = data.get('mempoolInfo')
+        if isinstance(mempool_info, dict) and isinstance(mempool_info.get('size'), int):
+            state.mempool_count = mempool_info['size']
+        fees = data.get('fees')
+        if isinstance(fees, dict):
+            state.fees = fees
+            if notify:
+                self._notify(self.on_fees)
+        state.updated_at = time.time()
+
+    def _notify(self, callbacks: List[Callable[[NetworkState], Any]]):
+        for callback in callbacks:
+            try:
+                callback(self.state)
+            except Exception as e:
+                logger.error(f"Ошибка подписчика потока mempool.space: {e}", exc_info=True)
+
+    async def _listen(self):
+        async with get_http_session().ws_connect(self.url, heartbeat=Config.MEMPOOL_WS_PING_INTERVAL) as ws:
+            await ws.send_json({'action': 'init'})
+            await ws.send_json({'action': 'want', 'data': ['blocks', 'stats']})
+            logger.info(f"Подключен поток mempool.space: {self.url}")
+            while True:
+                message = await ws.receive(timeout=Config.MEMPOOL_WS_IDLE_TIMEOUT)
+                if message.type == aiohttp.WSMsgType.TEXT:
+                    try:
+                        data = json.loads(message.data)
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(data, dict):
+                        self.last_message_at = time.monotonic()
+                        self.handle_message(data)
+                elif message.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    return
+
+    async def _run(self):
+        attempt = 0
+        while True:
+            connected_at = time.monotonic()
+            try:
+                await self._listen()
+                reason = "соединение закрыто сервером"
+            except asyncio.TimeoutError:
+                reason = f"нет данных {Config.MEMPOOL_WS_IDLE_TIMEOUT} с"
+            except (aiohttp.ClientError, OSError) as e:
+                reason = str(e) or type(e).__name__
+            except Exception as e:
+                # Неожиданное сообщение не должно навсегда останавливать поток
+                logger.error(f"Ошибка обработки потока mempool.space: {e}", exc_info=True)
+                reason = type(e).__name__
+            self.last_message_at = 0.0
+            # Соединение, продержавшееся дольше максимальной задержки, сбрасывает счетчик попыток
+            attempt = 0 if time.monotonic() - connected_at > Config.MEMPOOL_WS_BACKOFF_MAX else attempt + 1
+            self.reconnects += 1
+            delay = random.uniform(0, min(Config.MEMPOOL_WS_BACKOFF_MAX, Config.MEMPOOL_WS_BACKOFF_BASE * 2 ** attempt))
+            logger.warning(f"Поток mempool.space прерван ({reason}), переподключение через {delay:.1f} с.")
+            await asyncio.sleep(delay)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+mempool_feed = MempoolFeed(Config.MEMPOOL_WS_URL)
+
+
+class FeeSpikeDetector:
+    """Всплеск комиссий: быстрая комиссия в FEE_SPIKE_RATIO раз выше сглаженной средней."""
+
+    def __init__(self):
+        self.baseline: Optional[float] = None
+        self.last_alert_at = 0.0
+
+    def update(self, fastest_fee: float) -> bool:
+        if self.baseline is None:
+            self.baseline = fastest_fee
+            return False
+        spike = (fastest_fee >= Config.FEE_SPIKE_MIN
+                 and fastest_fee >= self.baseline * Config.FEE_SPIKE_RATIO
+                 and time.monotonic() - self.last_alert_at > Config.FEE_SPIKE_COOLDOWN)
+        if spike:
+            self.last_alert_at = time.monotonic()
+        self.baseline += Config.FEE_BASELINE_ALPHA * (fastest_fee - self.baseline)
+        return spike
+
+
+@async_cached(network_state_cache)
+async def fetch_network_state_http() -> Optional[Dict]:
+    """Состояние сети через HTTP API mempool.space — пока поток недоступен."""
+    height, fees, mempool = await asyncio.gather(
+        make_request(f"{Config.MEMPOOL_API_URL}/blocks/tip/height", 'text'),
+        make_request(f"{Config.MEMPOOL_API_URL}/v1/fees/recommended"),
+        make_request(f"{Config.MEMPOOL_API_URL}/mempool"),
+    )
+    if not height or not height.isdigit() or not fees or not mempool:
+        return None
+    return {'blocks': [{'height': int(height)}], 'fees': fees, 'mempoolInfo': {'size': mempool.get('count')}}
+
+async def get_network_state() -> NetworkState:
+    """Снимок из потока, а если поток недоступен — дополненный данными HTTP API."""
+    if not mempool_feed.is_live:
+        data = await fetch_network_state_http()
+        if data:
+            mempool_feed.handle_message(data, notify=False)
+    return mempool_feed.state
+
+def format_halving_info(state: NetworkState) -> str:
+    blocks_left = Config.BTC_HALVING_INTERVAL - (state.height % Config.BTC_HALVING_INTERVAL)
+    days = blocks_left / 144  # Приблизительно 144 блока в день
+    return f"⏳ <b>До халвинга Bitcoin осталось:</b>\n\n🧱 <b>Блоков:</b> <code>{blocks_left:,}</code>\n🗓 <b>Примерно дней:</b> <code>{days:.1f}</code>"
+
+def format_btc_network_status(state: NetworkState) -> str:
+    fees = state.fees
+    mempool_count = f"{state.mempool_count:,}" if state.mempool_count is not None else 'N/A'
+    return (f"📡 <b>Статус сети Bitcoin:</b>\n\n"
+            f"🧱 <b>Последний блок:</b> <code>{state.height:,}</code>\n"
+            f"📈 <b>Транзакций в мемпуле:</b> <code>{mempool_count}</code>\n\n"
+            f"💸 <b>Рекомендуемые комиссии (sat/vB):</b>\n"
+            f"  - 🚀 Высокий приоритет: <code>{fees.get('fastestFee', 'N/A')}</code>\n"
+            f"  - 🚶‍♂️ Средний приоритет: <code>{fees.get('halfHourFee', 'N/A')}</code>\n"
+            f"  - 🐢 Низкий приоритет: <code>{fees.get('hourFee', 'N/A')}</code>")
+
+async def get_halving_info() -> str:
+    """Информация о халвинге Bitcoin по снимку состояния сети."""
+    state = await get_network_state()
+    if state.height is None:
+        return "❌ Не удалось получить данные о халвинге."
+    return format_halving_info(state)
+
+async def get_btc_network_status() -> str:
+    """Статус сети Bitcoin по снимку состояния сети."""
+    state = await get_network_state()
+    if state.height is None or not state.fees:
+        return "❌ Не удалось получить статус сети BTC."
+    return format_btc_network_status(state)
+
+
+# --- Модуль викторины с GPT ---
+def validate_quiz_question(data: Any) -> Optional[Dict]:
+    """Проверяет вопрос от GPT и приводит его к виду для send_poll; None, если он не подходит."""
+    if not isinstance(data, dict):
+        return None
+    question, options, correct = data.get('question'), data.get('options'), data.get('correct_option_index')
+    if not isinstance(question, str) or not question.strip() or len(question) > 300:  # Лимиты Telegram для опросов
+        return None
+    if not isinstance(options, list) or len(options) != 4:
+        return None
+    if not all(isinstance(o, str) and o.strip() and len(o) <= 100 for o in options) or len(set(options)) != 4:
+        return None
+    if not isinstance(correct, int) or isinstance(correct, bool) or not 0 <= correct < 4:
+        return None
+    return {'question': question.strip(), 'options': [o.strip() for o in options], 'correct_option_index': correct}
+
+async def generate_quiz_questions(client, count: int, avoid: List[str]) -> List[Dict]:
+    """Генерирует пачку вопросов для викторины одним запросом к OpenAI."""
+    logger.info(f"Генерация {count} вопросов для викторины...")
+    prompt = (f'Создай {count} разных интересных вопросов для викторины на тему криптовалют или майнинга. '
+              'Вопросы должны быть среднего уровня сложности. '
+              'Ответ верни строго в формате JSON-объекта с ключом "questions" - массивом объектов с ключами: '
+              '"question" (строка), "options" (массив из 4 строк) и "correct_option_index" (число от 0 до 3). '
+              'Без лишних слов и markdown-форматирования.')
+    if avoid:
+        prompt += ' Не повторяй эти вопросы: ' + '; '.join(avoid)
+    try:
+        response = await client.chat.completions.create(
+            model=Config.QUIZ_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            response_format={"type": "json_object"},
+            temperature=0.8,
+        )
+        data = json.loads(response.choices[0].message.content)
+    except Exception as e:
+        logger.error(f"Ошибка при генерации вопросов викторины через OpenAI: {e}", exc_info=True)
+        return []
+    raw = data.get('questions') if isinstance(data, dict) else None
+    if not isinstance(raw, list):
+        logger.warning(f"GPT вернул некорректный формат JSON: {data}")
+        return []
+    questions = [q for q in map(validate_quiz_question, raw) if q]
+    if len(questions) < len(raw):
+        logger.warning(f"GPT вернул некорректных вопросов: {len(raw) - len(questions)} из {len(raw)}.")
+    return questions
+
+
+class QuizPool:
+    """Заранее сгенерированные вопросы викторины.
+
+    Клик по кнопке берет готовый вопрос из пула. Когда в пуле остается
+    меньше Config.QUIZ_POOL_LOW_WATER вопросов, он в фоне пополняется до
+    Config.QUIZ_POOL_TARGET пачками по Config.QUIZ_BATCH_SIZE за один
+    запрос к OpenAI. Повторы отсекаются по нормализованному тексту вопроса
+    среди недавно выданных и лежащих в пуле. Пул сохраняется в JSON-файл и
+    переживает перезапуск. Клиент передается снаружи (get_client), так что
+    вместо AsyncOpenAI можно подставить заглушку.
+    """
+
+    def __init__(self, state_path: str, get_client: Callable[[], Any]):
+        self.state_path = state_path
+        self.get_client = get_client
+        self.questions: List[Dict] = []
+        self.seen: OrderedDict = OrderedDict()
+        self._refill_lock = asyncio.Lock()
+        self._refill_task: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()  # Сохранения из take() и refill() не должны писать файл одновременно
+
+    @staticmethod
+    def _key(question: Dict) -> str:
+        # Та же нормализация, что и для заголовков новостей: регистр, пунктуация, окончания
+        return normalize_news_title(question['question'])
+
+    def load(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось загрузить пул вопросов викторины: {e}")
+            return
+        self.questions = [q for q in map(validate_quiz_question, state.get('questions', [])) if q]
+        self.seen = OrderedDict.fromkeys(state.get('seen', []))
+        logger.info(f"Пул вопросов викторины загружен: {len(self.questions)} вопросов.")
+
+    def _write_state(self, state: Dict):
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        tmp_path = self.state_path + '.tmp'
+        with self._write_lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.state_path)
+
+    async def save(self):
+        state = {'questions': self.questions, 'seen': list(self.seen)}
+        try:
+            await asyncio.to_thread(self._write_state, state)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить пул вопросов викторины: {e}")
+
+    def _add(self, questions: List[Dict]) -> int:
+        added = 0
+        for question in questions:
+            key = self._key(question)
+            if key in self.seen:
+                continue
+            self.seen[key] = None
+            self.questions.append(question)
+            added += 1
+        while len(self.seen) > Config.QUIZ_SEEN_LIMIT:
+            self.seen.popitem(last=False)
+        return added
+
+    async def refill(self):
+        """Пополняет пул до Config.QUIZ_POOL_TARGET; одновременно выполняется только одно пополнение."""
+        # Первый вызов импортирует openai: делаем это в потоке, чтобы не задерживать event loop
+        client = await asyncio.to_thread(self.get_client)
+        if client is None:
+            return
+        async with self._refill_lock:
+            while len(self.questions) < Config.QUIZ_POOL_TARGET:
+                count = min(Config.QUIZ_BATCH_SIZE, Config.QUIZ_POOL_TARGET - len(self.questions))
+                avoid = [q['question'] for q in self.questions[-Config.QUIZ_AVOID_IN_PROMPT:]]
+                added = self._add(await generate_quiz_questions(client, count, avoid))
+                if not added:
+                    break  # Ошибка API или одни повторы: следующая попытка при следующем запросе вопроса
+            await self.save()
+        logger.info(f"Пул вопросов викторины пополнен: {len(self.questions)} вопросов.")
+
+    async def take(self) -> Optional[Dict]:
+        """Выдает вопрос из пула; если пул пуст, ждет пополнения."""
+        if not self.questions:
+            await self.refill()
+        if not self.questions:
+            return None
+        question = self.questions.pop(0)
+        if len(self.questions) < Config.QUIZ_POOL_LOW_WATER:
+            if self._refill_task is None or self._refill_task.done():
+                self._refill_task = spawn_background(self.refill())
+        else:
+            spawn_background(self.save())
+        return question
+
+
+quiz_pool = QuizPool(os.path.join(Config.DATA_DIR, Config.QUIZ_POOL_FILE), get_openai_client)
+
+# --- Результаты викторины и рейтинг ---
+class Leaderboard:
+    """Рейтинг с инкрементальным обновлением.
+
+    ranking - отсортированный список (-очки, user_id): ответ сдвигает одну
+    запись через bisect, а топ и место пользователя читаются без пересчета.
+    Участники с равными очками делят место (1, 1, 3), в топе они идут по user_id.
+    """
+    __slots__ = ('scores', 'answers', 'ranking')
+
+    def __init__(self):
+        self.scores: Dict[int, int] = {}
+        self.answers: Dict[int, int] = {}
+        self.ranking: List[Tuple[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.ranking)
+
+    def add(self, user_id: int, points: int, answers: int = 1):
+        self.answers[user_id] = self.answers.get(user_id, 0) + answers
+        old = self.scores.get(user_id)
+        if old is not None:
+            if not points:
+                return
+            del self.ranking[bisect.bisect_left(self.ranking, (-old, user_id))]
+        score = self.scores[user_id] = (old or 0) + points
+        bisect.insort(self.ranking, (-score, user_id))
+
+    def top(self, limit: int) -> List[Tuple[int, int, int]]:
+        """Первые limit мест: (user_id, очки, всего ответов)."""
+        return [(user_id, -neg_score, self.answers[user_id]) for neg_score, user_id in self.ranking[:limit]]
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """Место пользователя: 1 + число участников с большим числом очков."""
+        score = self.scores.get(user_id)
+        return None if score is None else bisect.bisect_left(self.ranking, (-score,)) + 1
+
+
+def week_start(timestamp: float) -> int:
+    """Начало недели (понедельник 00:00 UTC) для timestamp."""
+    day = int(timestamp) // 86400
+    return (day - (day + 3) % 7) * 86400  # 01.01.1970 - четверг
+
+
+class QuizResults:
+    """Подсчет ответов на викторину и рейтинги.
+
+    Для каждого отправленного опроса правильный ответ хранится в
+    ограниченном кэше по poll_id. Ответы сразу учитываются в рейтингах в
+    памяти (общем, по чатам и недельном), а в SQLite попадают отложенно:
+    буфер сбрасывается одной транзакцией раз в Config.QUIZ_FLUSH_INTERVAL
+    или при Config.QUIZ_FLUSH_BATCH ответах. Таблица читается целиком
+    только при старте, чтобы построить рейтинги.
+    С общим DATA_DIR (Config.SHARED_DATA_DIR) опросы записываются и в базу,
+    чтобы ответ, пришедший на другую реплику, был учтен, а sync() строит
+    рейтинги заново, если ответы записала другая реплика.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.polls: TTLCache = TTLCache(maxsize=Config.QUIZ_POLLS_CACHE_SIZE, ttl=Config.QUIZ_POLL_TTL)
+        self.global_board = Leaderboard()
+        self.chat_boards: Dict[int, Leaderboard] = defaultdict(Leaderboard)
+        self.week = week_start(time.time())
+        self.week_board = Leaderboard()
+        self.names: Dict[int, str] = {}
+        self._pending: List[Tuple] = []
+        self._pending_names: Dict[int, str] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()  # Рейтинги перестраиваются только по уже записанным ответам
+        self._task: Optional[asyncio.Task] = None
+        self._data_version = 0
+
+    def open(self):
+        self._conn = open_sqlite(self.path)
+        with self._lock, self._conn:
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS quiz_answers (poll_id TEXT NOT NULL, user_id INTEGER NOT NULL, chat_id INTEGER NOT NULL,"
+                " correct INTEGER NOT NULL, answered_at REAL NOT NULL, PRIMARY KEY (poll_id, user_id));"
+                "CREATE INDEX IF NOT EXISTS quiz_answers_time ON quiz_answers (answered_at);"
+                "CREATE TABLE IF NOT EXISTS quiz_users (user_id INTEGER PRIMARY KEY, name TEXT NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS quiz_polls (poll_id TEXT PRIMARY KEY, chat_id INTEGER NOT NULL,"
+                " correct_option INTEGER NOT NULL, sent_at REAL NOT NULL);"
+            )
+        self._load(*self._read())
+        logger.info(f"Результаты викторины загружены: {len(self.global_board)} участников.")
+
+    def _read(self) -> Tuple[int, List[Tuple], List[Tuple], Dict[int, str]]:
+        week = week_start(time.time())
+        with self._lock:
+            self._data_version = sqlite_data_version(self._conn)
+            rows = self._conn.execute(
+                "SELECT chat_id, user_id, SUM(correct), COUNT(*) FROM quiz_answers GROUP BY chat_id, user_id").fetchall()
+            week_rows = self._conn.execute(
+                "SELECT user_id, SUM(correct), COUNT(*) FROM quiz_answers WHERE answered_at >= ? GROUP BY user_id",
+                (week,)).fetchall()
+            names = dict(self._conn.execute("SELECT user_id, name FROM quiz_users"))
+        return week, rows, week_rows, names
+
+    def _read_if_changed(self) -> Optional[Tuple[int, List[Tuple], List[Tuple], Dict[int, str]]]:
+        with self._lock:
+            if self._conn is None or sqlite_data_version(self._conn) == self._data_version:
+                return None
+        return self._read()
+
+    def _load(self, week: int, rows: List[Tuple], week_rows: List[Tuple], names: Dict[int, str]):
+        self.global_board, self.chat_boards = Leaderboard(), defaultdict(Leaderboard)
+        self.week, self.week_board = week, Leaderboard()
+        self.names = names
+        for chat_id, user_id, points, answers in rows:
+            self.global_board.add(user_id, points, answers)
+            self.chat_boards[chat_id].add(user_id, points, answers)
+        for user_id, points, answers in week_rows:
+            self.week_board.add(user_id, points, answers)
+
+    async def sync(self):
+        """Перестраивает рейтинги, если другая реплика записала новые ответы."""
+        if not Config.SHARED_DATA_DIR:
+            return
+        async with self._flush_lock:
+            await self._flush()
+            state = await asyncio.to_thread(self._read_if_changed)
+            if state is not None:
+                self._load(*state)
+                # Ответы, принятые пока шло чтение, еще не записаны в базу
+                for _, user_id, chat_id, correct, answered_at in self._pending:
+                    self._count(chat_id, user_id, correct, answered_at)
+                self.names.update(self._pending_names)
+
+    def _insert_poll(self, poll_id: str, chat_id: int, correct_option: int):
+        with self._lock:
+            if self._conn is None:
+                return
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO quiz_polls VALUES (?, ?, ?, ?)",
+                                   (poll_id, chat_id, correct_option, time.time()))
+                self._conn.execute("DELETE FROM quiz_polls WHERE sent_at < ?", (time.time() - Config.QUIZ_POLL_TTL,))
+
+    def _select_poll(self, poll_id: str) -> Optional[QuizPoll]:
+        with self._lock:
+            if self._conn is None:
+                return None
+            row = self._conn.execute("SELECT chat_id, correct_option FROM quiz_polls WHERE poll_id = ? AND sent_at >= ?",
+                                     (poll_id, time.time() - Config.QUIZ_POLL_TTL)).fetchone()
+        return QuizPoll(*row) if row else None
+
+    async def register_poll(self, poll_id: str, chat_id: int, correct_option: int):
+        self.polls[poll_id] = QuizPoll(chat_id, correct_option)
+        if Config.SHARED_DATA_DIR:
+            await asyncio.to_thread(self._insert_poll, poll_id, chat_id, correct_option)
+
+    async def record_answer(self, poll_id: str, user_id: int, name: str, option_ids: List[int]) -> Optional[bool]:
+        """Учитывает ответ; возвращает его правильность или None, если опрос неизвестен или ответ повторный."""
+        poll = self.polls.get(poll_id)
+        if poll is None and Config.SHARED_DATA_DIR:
+            # Опрос могла отправить другая реплика
+            poll = await asyncio.to_thread(self._select_poll, poll_id)
+            if poll is not None:
+                poll = self.polls.setdefault(poll_id, poll)
+        if poll is None or not option_ids or user_id in poll.answered:
+            return None
+        poll.answered.add(user_id)
+        correct = option_ids == [poll.correct_option]
+        now = time.time()
+        self._count(poll.chat_id, user_id, int(correct), now)
+        if self.names.get(user_id) != name:
+            self.names[user_id] = self._pending_names[user_id] = name
+
+        self._pending.append((poll_id, user_id, poll.chat_id, int(correct), now))
+        if len(self._pending) >= Config.QUIZ_FLUSH_BATCH:
+            spawn_background(self.flush())
+        return correct
+
+    def _count(self, chat_id: int, user_id: int, points: int, answered_at: float):
+        if week_start(answered_at) != self.week:
+            self.week, self.week_board = week_start(answered_at), Leaderboard()
+        for board in (self.global_board, self.chat_boards[chat_id], self.week_board):
+            board.add(user_id, points)
+
+    def leaderboard(self, scope: str, chat_id: Optional[int] = None) -> Leaderboard:
+        if scope == 'week':
+            if week_start(time.time()) != self.week:
+                return Leaderboard()  # Новая неделя, ответов еще не было
+            return self.week_board
+        if scope == 'chat':
+            return self.chat_boards.get(chat_id) or Leaderboard()
+        return self.global_board
+
+    def _write(self, answers: List[Tuple], names: Dict[int, str]):
+        with self._lock:
+            if self._conn is None:
+                return
+            with self._conn:
+                self._conn.executemany("INSERT OR IGNORE INTO quiz_answers VALUES (?, ?, ?, ?, ?)", answers)
+                self._conn.executemany("INSERT OR REPLACE INTO quiz_users VALUES (?, ?)", names.items())
+
+    async def flush(self):
+        async with self._flush_lock:
+            await self._flush()
+
+    async def _flush(self):
+        if self._pending or self._pending_names:
+            answers, self._pending = self._pending, []
+            names, self._pending_names = self._pending_names, {}
+            try:
+                await asyncio.to_thread(self._write, answers, names)
+            except BaseException:
+                # Ответы возвращаются в буфер перед принятыми во время записи; новые имена важнее
+                self._pending = answers + self._pending
+                for user_id, name in names.items():
+                    self._pending_names.setdefault(user_id, name)
+                raise
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(Config.QUIZ_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи результатов викторины: {e}", exc_info=True)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+quiz_results = QuizResults(os.path.join(Config.DATA_DIR, Config.QUIZ_RESULTS_FILE))
+
+def open_quiz_results():
+    """Открывает базу результатов викторины; при ошибке результаты живут только в памяти."""
+    try:
+        quiz_results.open()
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Не удалось открыть базу результатов викторины, работаю с памятью: {e}")
+        quiz_results.path = ":memory:"
+        quiz_results.open()
+    quiz_results.start()
+
+# --- Рассылка подписчикам ---
+class BroadcastStore:
+    """Подписчики и прогресс рассылок в SQLite.
+
+    Каждая рассылка записывается до начала отправки, а доставленные чаты
+    отмечаются пачками, поэтому после перезапуска прерванная рассылка
+    продолжается с того места, где остановилась.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        self._db = open_sqlite(self.path)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS subscribers (chat_id INTEGER PRIMARY KEY, subscribed_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS broadcasts (id INTEGER PRIMARY KEY, text TEXT NOT NULL, created_at REAL NOT NULL, done INTEGER NOT NULL DEFAULT 0);"
+            "CREATE TABLE IF NOT EXISTS deliveries (broadcast_id INTEGER NOT NULL, chat_id INTEGER NOT NULL, PRIMARY KEY (broadcast_id, chat_id));"
+        )
+
+    def _execute(self, sql: str, *params) -> sqlite3.Cursor:
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            self._db.commit()
+            return cursor
+
+    def add_subscriber(self, chat_id: int) -> bool:
+        return self._execute("INSERT OR IGNORE INTO subscribers VALUES (?, ?)", chat_id, time.time()).rowcount > 0
+
+    def remove_subscriber(self, chat_id: int) -> bool:
+        return self._execute("DELETE FROM subscribers WHERE chat_id = ?", chat_id).rowcount > 0
+
+    def migrate_subscriber(self, old_chat_id: int, new_chat_id: int):
+        """Группа стала супергруппой и получила новый id."""
+        with self._lock:
+            self._db.execute("UPDATE OR IGNORE subscribers SET chat_id = ? WHERE chat_id = ?", (new_chat_id, old_chat_id))
+            self._db.execute("DELETE FROM subscribers WHERE chat_id = ?", (old_chat_id,))
+            self._db.commit()
+
+    def count_subscribers(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM subscribers").fetchone()[0]
+
+    def create_broadcast(self, text: str) -> int:
+        return self._execute("INSERT INTO broadcasts (text, created_at) VALUES (?, ?)", text, time.time()).lastrowid
+
+    def pending_broadcasts(self) -> List[Tuple[int, str]]:
+        with self._lock:
+            return self._db.execute("SELECT id, text FROM broadcasts WHERE done = 0 ORDER BY id").fetchall()
+
+    def pending_chats(self, broadcast_id: int) -> List[int]:
+        """Подписчики, которым рассылка еще не доставлена."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT chat_id FROM subscribers WHERE chat_id NOT IN "
+                "(SELECT chat_id FROM deliveries WHERE broadcast_id = ?) ORDER BY chat_id", (broadcast_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_delivered(self, broadcast_id: int, chat_ids: List[int]):
+        with self._lock:
+            self._db.executemany("INSERT OR IGNORE INTO deliveries VALUES (?, ?)", [(broadcast_id, c) for c in chat_ids])
+            self._db.commit()
+
+    def finish_broadcast(self, broadcast_id: int):
+        """Отмечает рассылку завершенной; список доставок больше не нужен."""
+        with self._lock:
+            self._db.execute("UPDATE broadcasts SET done = 1 WHERE id = ?", (broadcast_id,))
+            self._db.execute("DELETE FROM deliveries WHERE broadcast_id = ?", (broadcast_id,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+@dataclass
+class BroadcastStats:
+    """Итоги одной рассылки."""
+    total: int = 0
+    sent: int = 0
+    removed: int = 0  # Чаты, заблокировавшие бота или удаленные
+    failed: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+
+class Broadcaster:
+    """Рассылка сообщения всем подписчикам с учетом лимитов Telegram.
+
+    Несколько отправителей работают параллельно, но каждое сообщение
+    проходит через общую корзину токенов (Config.BROADCAST_GLOBAL_RATE)
+    и корзину своего чата (20 сообщений в минуту для групп, 1 в секунду
+    для личных чатов). RetryAfter приостанавливает всех отправителей на
+    указанное время, временные ошибки повторяются с задержкой, а чаты,
+    заблокировавшие бота, удаляются из подписчиков.
+    """
+
+    def __init__(self, bot: Bot, store: BroadcastStore):
+        self.bot = bot
+        self.store = store
+        self.global_bucket = TokenBucket(Config.BROADCAST_GLOBAL_RATE, Config.BROADCAST_GLOBAL_BURST)
+        self.chat_buckets: LRUCache = LRUCache(maxsize=Config.BROADCAST_CHAT_BUCKETS)
+        self.paused_until = 0.0  # По RetryAfter от Telegram (time.monotonic)
+        self._lock = asyncio.Lock()  # Рассылки выполняются по одной
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательный id - группа или канал
+            rate, burst = Config.BROADCAST_GROUP_RATE if chat_id < 0 else Config.BROADCAST_PRIVATE_RATE
+            bucket = self.chat_buckets[chat_id] = TokenBucket(rate, burst)
+        return bucket
+
+    async def broadcast(self, text: str) -> BroadcastStats:
+        """Сохраняет рассылку и отправляет ее всем подписчикам."""
+        broadcast_id = await asyncio.to_thread(self.store.create_broadcast, text)
+        return await self._run(broadcast_id, text)
+
+    async def resume(self):
+        """Досылает рассылки, прерванные перезапуском."""
+        for broadcast_id, text in await asyncio.to_thread(self.store.pending_broadcasts):
+            logger.info(f"Продолжаю прерванную рассылку #{broadcast_id}...")
+            await self._run(broadcast_id, text)
+
+    async def _run(self, broadcast_id: int, text: str) -> BroadcastStats:
+        async with self._lock:
+            queue: asyncio.Queue = asyncio.Queue()
+            for chat_id in await asyncio.to_thread(self.store.pending_chats, broadcast_id):
+                queue.put_nowait(chat_id)
+            stats = BroadcastStats(total=queue.qsize())
+            done: List[int] = []
+            started = time.monotonic()
+
+            async def checkpoint():
+                batch = done.copy()
+                done.clear()
+                if batch:
+                    await asyncio.to_thread(self.store.mark_delivered, broadcast_id, batch)
+
+            async def worker():
+                while not queue.empty():
+                    # После миграции группы доставленным отмечается ее новый id
+                    final_chat_id = await self._deliver(queue.get_nowait(), text, stats)
+                    if final_chat_id is not None:
+                        done.append(final_chat_id)
+                        if len(done) >= Config.BROADCAST_CHECKPOINT_EVERY:
+                            await checkpoint()
+
+            try:
+                await asyncio.gather(*(worker() for _ in range(min(Config.BROADCAST_CONCURRENCY, stats.total))))
+            finally:
+                # И при остановке бота: после перезапуска эти чаты не получат сообщение повторно
+                await checkpoint()
+            await asyncio.to_thread(self.store.finish_broadcast, broadcast_id)
+
+            stats.elapsed = time.monotonic() - started
+            logger.info(
+                f"Рассылка #{broadcast_id} завершена за {stats.elapsed:.1f} с: отправлено {stats.sent} из {stats.total} "
+                f"({stats.rate:.1f} сообщ./с), удалено чатов {stats.removed}, ошибок {stats.failed}, повторов {stats.retries}."
+            )
+            return stats
+
+    async def send(self, chat_id: int, text: str) -> bool:
+        """Отправляет одно сообщение с теми же лимитами и повторами, что и рассылка."""
+        return await self._deliver(chat_id, text, BroadcastStats(total=1)) is not None
+
+    async def _deliver(self, chat_id: int, text: str, stats: BroadcastStats) -> Optional[int]:
+        """Отправляет сообщение в чат.
+
+        Возвращает id чата, с которым рассылка закончена (новый, если группа
+        стала супергруппой), или None, если сообщение отправить не удалось.
+        """
+        attempt = retry_afters = 0
+        while attempt < Config.BROADCAST_MAX_ATTEMPTS:
+            await self._chat_bucket(chat_id).acquire()
+            wait = self.paused_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self.global_bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id, text, disable_web_page_preview=True)
+                stats.sent += 1
+                return chat_id
+            except TelegramRetryAfter as e:
+                # Флуд-лимит действует на весь бот: ждут все отправители, попытка не расходуется,
+                # но бесконечно одно сообщение не повторяется
+                retry_afters += 1
+                if retry_afters > Config.BROADCAST_MAX_RETRY_AFTER:
+                    logger.warning(f"Чат {chat_id}: превышено число ожиданий по RetryAfter, сообщение не отправлено.")
+                    break
+                self.paused_until = max(self.paused_until, time.monotonic() + e.retry_after)
+                logger.warning(f"Telegram просит подождать {e.retry_after} с, рассылка приостановлена.")
+                stats.retries += 1
+                continue
+            except TelegramMigrateToChat as e:
+                await asyncio.to_thread(self.store.migrate_subscriber, chat_id, e.migrate_to_chat_id)
+                chat_id = e.migrate_to_chat_id
+                continue
+            except (TelegramForbiddenError, TelegramNotFound) as e:
+                await self._drop_chat(chat_id, e, stats)
+                return chat_id
+            except TelegramBadRequest as e:
+                if "chat not found" in e.message.lower():
+                    await self._drop_chat(chat_id, e, stats)
+                    return chat_id
+                logger.warning(f"Не удалось отправить рассылку в чат {chat_id}: {e}")
+                break
+            except (TelegramNetworkError, TelegramServerError) as e:
+                attempt += 1
+                stats.retries += 1
+                logger.warning(f"Временная ошибка отправки в чат {chat_id} (попытка {attempt}): {e}")
+                # Экспоненциальная задержка с полным случайным разбросом
+                await asyncio.sleep(random.uniform(0, min(Config.BROADCAST_BACKOFF_MAX, Config.BROADCAST_BACKOFF_BASE * 2 ** attempt)))
+        stats.failed += 1
+        return None
+
+    async def _drop_chat(self, chat_id: int, error: Exception, stats: BroadcastStats):
+        logger.info(f"Чат {chat_id} недоступен ({error}), удаляю из подписчиков.")
+        await asyncio.to_thread(self.store.remove_subscriber, chat_id)
+        stats.removed += 1
+
+
+broadcast_store = BroadcastStore(os.path.join(Config.DATA_DIR, Config.BROADCAST_FILE))
+broadcaster = Broadcaster(bot, broadcast_store)
+
+def open_broadcast_store():
+    """Открывает базу подписчиков; при ошибке подписки живут только в памяти до перезапуска."""
+    try:
+        broadcast_store.open()
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Не удалось открыть базу подписчиков, работаю с памятью: {e}")
+        broadcast_store.path = ":memory:"
+        broadcast_store.open()
+    if Config.NEWS_CHAT_ID:
+        # Чат из настроек всегда получает новости, как и до появления подписок
+        broadcast_store.add_subscriber(int(Config.NEWS_CHAT_ID))
+
+# --- Ценовые оповещения ---
+class AlertIndex:
+    """Пороги оповещений одной монеты в отсортированных массивах.
+
+    Оповещения на рост (above) срабатывают при цене не ниже порога, на
+    падение (below) - не выше. Сработавшие за тик лежат в начале above и в
+    конце below, поэтому находятся одним bisect на массив и снимаются
+    срезом, без перебора всех оповещений. Направление задано при создании,
+    так что устаревшая цена прошлого тика не может вызвать ложное срабатывание.
+    """
+    __slots__ = ('above', 'above_ids', 'below', 'below_ids')
+
+    def __init__(self):
+        self.above: List[float] = []
+        self.above_ids: List[int] = []
+        self.below: List[float] = []
+        self.below_ids: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.above_ids) + len(self.below_ids)
+
+    def _arrays(self, direction: int) -> Tuple[List[float], List[int]]:
+        return (self.above, self.above_ids) if direction > 0 else (self.below, self.below_ids)
+
+    def add(self, threshold: float, alert_id: int, direction: int):
+        thresholds, alert_ids = self._arrays(direction)
+        i = bisect.bisect_right(thresholds, threshold)
+        thresholds.insert(i, threshold)
+        alert_ids.insert(i, alert_id)
 
-def parse_power(power_str: str) -> Optional[int]:
-    """Преобразует строку мощности (e.g., '3400W') в целое число."""
-    cleaned = re.sub(r'[^0-9]', '', str(power_str))
-    return int(cleaned) if cleaned.isdigit() else None
+    def remove(self, threshold: float, alert_id: int, direction: int):
+        thresholds, alert_ids = self._arrays(direction)
+        lo = bisect.bisect_left(thresholds, threshold)
+        hi = bisect.bisect_right(thresholds, threshold)
+        for i in range(lo, hi):
+            if alert_ids[i] == alert_id:
+                del thresholds[i]
+                del alert_ids[i]
+                return
 
-def parse_profitability(profit_str: str) -> float:
-    """Преобразует строку прибыльности (e.g., '$5.12/day') в число."""
-    cleaned = re.sub(r'[^\d.]', '', str(profit_str))
-    return float(cleaned) if cleaned else 0.0
+    def pop_reached(self, price: float) -> List[int]:
+        """Снимает оповещения на рост с порогом <= price и на падение с порогом >= price."""
+        hi = bisect.bisect_right(self.above, price)
+        lo = bisect.bisect_left(self.below, price)
+        reached = self.above_ids[:hi] + self.below_ids[lo:]
+        del self.above[:hi]
+        del self.above_ids[:hi]
+        del self.below[lo:]
+        del self.below_ids[lo:]
+        return reached
 
-# ==============================================================================
-# 6. ЯДРО ЛОГИКИ: СБОР И ОБРАБОТКА ДАННЫХ
-# ==============================================================================
 
-# --- Агрегатор данных по ASIC-майнерам ---
+class PriceAlertManager:
+    """Оповещения о пересечении цены: хранение в SQLite и проверка по тикам.
 
-async def scrape_asicminervalue(session: aiohttp.ClientSession) -> List[AsicMiner]:
-    """Скрапит данные с AsicMinerValue.com."""
-    miners = []
-    html = await make_request(session, 'https://www.asicminervalue.com/', 'text')
-    if not html:
-        return miners
-    
-    logger.info("Получены данные с AsicMinerValue.")
-    soup = BeautifulSoup(html, 'lxml')
-    table = soup.find('table', {'id': 'datatable'})
-    if not table:
-        return miners
-    
-    for row in table.find('tbody').find_all('tr'):
-        cols = row.find_all('td')
-        if len(cols) > 4:
-            try:
-                name = cols[1].find('a').text.strip()
-                profit_str = cols[3].text.strip()
-                profitability = parse_profitability(profit_str)
-                power_str = cols[4].text
-                power = parse_power(power_str)
-                
-                if profitability > 0:
-                    miners.append(AsicMiner(
-                        name=name,
-                        profitability=profitability,
-                        power=power,
-                        source='AsicMinerValue'
-                    ))
-            except Exception:
-                continue
-    return miners
+    За тик цены всех монет с оповещениями запрашиваются одним вызовом
+    /coins/markets (до Config.PRICE_BATCH_MAX_IDS монет на вызов), затем
+    для каждой монеты AlertIndex снимает пересеченные пороги. Бюджет тика
+    без учета сети - Config.ALERT_TICK_BUDGET (50 мс). На 100 тыс. оповещений
+    по 500 монетам тик занимает около 3 мс при движении цен на 1% и около
+    18 мс при движении на 10% (7,4 тыс. сработавших, см.
+    benchmarks/bench_price_alerts.py): работа зависит от числа монет и
+    сработавших оповещений, а не от числа всех.
+    Направление каждого оповещения сохраняется вместе с ним, поэтому
+    пересечение во время перезапуска срабатывает на первом тике.
+    С общим DATA_DIR (Config.SHARED_DATA_DIR) база - источник истины для
+    всех реплик: sync() перечитывает ее, если другая реплика создала или
+    удалила оповещения, поэтому лидер проверяет и их.
+    Сработавшее оповещение удаляется из базы только после того, как
+    уведомление отправлено (finish). Пока оно доставляется, тики его не
+    проверяют; если отправить не удалось, оно возвращается в индекс, а при
+    перезапуске во время доставки сработает снова.
+    """
 
-async def fetch_whattomine_asics(session: aiohttp.ClientSession) -> List[AsicMiner]:
-    """Получает данные с WhatToMine.com."""
-    miners = []
-    data = await make_request(session, 'https://whattomine.com/asics.json')
-    if not data or 'asics' not in data:
-        return miners
-        
-    logger.info("Получены данные с WhatToMine.")
-    for name, asic_data in data['asics'].items():
-        if asic_data.get('status') == 'Active' and 'revenue' in asic_data:
-            profit = parse_profitability(asic_data['revenue'])
-            if profit > 0:
-                miners.append(AsicMiner(
-                    name=name,
-                    profitability=profit,
-                    algorithm=asic_data.get('algorithm'),
-                    hashrate=str(asic_data.get('hashrate')),
-                    power=parse_power(str(asic_data.get('power', 0))),
-                    source='WhatToMine'
-                ))
-    return miners
+    def __init__(self, path: str):
+        self.path = path
+        self.alerts: Dict[int, PriceAlert] = {}
+        self.indexes: Dict[str, AlertIndex] = {}
+        self.by_chat: Dict[int, Set[int]] = defaultdict(set)
+        self.delivering: Dict[int, PriceAlert] = {}  # Сработавшие, уведомление еще не отправлено
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._sync_lock = asyncio.Lock()  # Перечитывание не должно потерять запись, сделанную между чтением и заменой
+        self._data_version = 0
 
-@async_cached(cache=asic_cache)
-async def get_profitable_asics() -> List[AsicMiner]:
-    """Агрегирует данные по ASIC из нескольких источников."""
-    logger.info("Обновление кэша ASIC-майнеров...")
-    async with aiohttp.ClientSession() as session:
-        tasks = [
-            scrape_asicminervalue(session),
-            fetch_whattomine_asics(session)
-        ]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-    all_miners = []
-    for res in results:
-        if isinstance(res, list):
-            all_miners.extend(res)
-
-    if not all_miners:
-        logger.warning("Не удалось получить данные по ASIC. Используется аварийный список.")
-        return [AsicMiner(**asic) for asic in Config.FALLBACK_ASICS]
-
-    # --- Слияние и дедупликация ---
-    final_miners: Dict[str, AsicMiner] = {}
-    sorted_by_name = sorted(all_miners, key=lambda m: m.name)
+    def open(self):
+        self._db = open_sqlite(self.path)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS alerts (id INTEGER PRIMARY KEY, chat_id INTEGER NOT NULL, coin_id TEXT NOT NULL,"
+            " symbol TEXT NOT NULL, threshold REAL NOT NULL, created_at REAL NOT NULL, direction INTEGER NOT NULL);"
+        )
+        self._load(self._read())
+        logger.info(f"Загружено ценовых оповещений: {len(self.alerts)}.")
 
-    for miner in sorted_by_name:
-        # Ищем наилучшее совпадение по имени
-        best_match_key, score = process.extractOne(miner.name, final_miners.keys(), scorer=fuzz.token_set_ratio) if final_miners else (None, 0)
-        
-        if score > 90 and best_match_key:
-            # Нашли дубликат, обновляем данные
-            existing_miner = final_miners[best_match_key]
-            if miner.profitability > existing_miner.profitability:
-                existing_miner.profitability = miner.profitability
-            existing_miner.algorithm = existing_miner.algorithm or miner.algorithm
-            existing_miner.hashrate = existing_miner.hashrate or miner.hashrate
-            existing_miner.power = existing_miner.power or miner.power
-        else:
-            # Уникальный майнер
-            final_miners[miner.name] = miner
-    
-    sorted_list = sorted(final_miners.values(), key=lambda m: m.profitability, reverse=True)
-    logger.info(f"Кэш ASIC-майнеров обновлен. Найдено {len(sorted_list)} уникальных устройств.")
-    return sorted_list
+    def _read(self) -> List[Tuple]:
+        with self._lock:
+            self._data_version = sqlite_data_version(self._db)
+            return self._db.execute(
+                "SELECT id, chat_id, coin_id, symbol, threshold, created_at, direction FROM alerts").fetchall()
 
+    def _read_if_changed(self) -> Optional[List[Tuple]]:
+        with self._lock:
+            if self._db is None or sqlite_data_version(self._db) == self._data_version:
+                return None
+        return self._read()
 
-# --- Модуль для получения данных по криптовалютам ---
-@async_cached(cache=coin_list_cache)
-async def get_coin_list() -> Dict[str, str]:
-    """Получает и кэширует полный список монет с их алгоритмами из Minerstat."""
-    logger.info("Обновление кэша списка монет с алгоритмами...")
-    coin_algo_map = {}
-    async with aiohttp.ClientSession() as session:
-        data = await make_request(session, "https://api.minerstat.com/v2/coins")
-        if data:
-            for coin_data in data:
-                symbol = coin_data.get('coin')
-                algorithm = coin_data.get('algorithm')
-                if symbol and algorithm:
-                    coin_algo_map[symbol.upper()] = algorithm
-    logger.info(f"Кэш списка монет обновлен. Загружено {len(coin_algo_map)} монет.")
-    return coin_algo_map
+    def _load(self, alerts: List[Tuple]):
+        self.alerts, self.indexes, self.by_chat = {}, {}, defaultdict(set)
+        for row in alerts:
+            if row[0] not in self.delivering:
+                self._index(PriceAlert(*row))
 
-@async_cached(price_cache, key=AIOK.REPR)
-async def get_crypto_price(query: str) -> Optional[CryptoCoin]:
-    """Получает цену и алгоритм для криптовалюты, используя CoinGecko."""
-    query = query.strip().lower()
-    query = Config.TICKER_ALIASES.get(query, query)
-    
-    async with aiohttp.ClientSession() as session:
-        search_url = f"https://api.coingecko.com/api/v3/search?query={query}"
-        search_data = await make_request(session, search_url)
-        if not search_data or not search_data.get('coins'):
-            return None
+    async def sync(self):
+        """Подхватывает оповещения, созданные или удаленные другими репликами."""
+        if not Config.SHARED_DATA_DIR:
+            return
+        async with self._sync_lock:
+            alerts = await asyncio.to_thread(self._read_if_changed)
+            if alerts is not None:
+                self._load(alerts)
 
-        coin_info = search_data['coins'][0]
-        coin_id = coin_info.get('id')
-        
-        market_url = f"https://api.coingecko.com/api/v3/coins/markets?vs_currency=usd&ids={coin_id}"
-        market_data_list = await make_request(session, market_url)
-        if not market_data_list:
-            return None
-        
-        market_data = market_data_list[0]
-        symbol = market_data.get('symbol', '').upper()
-        
-        coin_algo_map = await get_coin_list()
-        algorithm = coin_algo_map.get(symbol)
-
-        return CryptoCoin(
-            id=market_data.get('id'),
-            symbol=symbol,
-            name=market_data.get('name'),
-            price=market_data.get('current_price', 0.0),
-            price_change_24h=market_data.get('price_change_percentage_24h'),
-            algorithm=algorithm
-        )
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
 
-# --- Модуль "Индекс страха и жадности" ---
-@async_cached(fear_greed_cache)
-async def get_fear_and_greed_index() -> Optional[Dict]:
-    """Получает "Индекс страха и жадности"."""
-    async with aiohttp.ClientSession() as session:
-        data = await make_request(session, "https://api.alternative.me/fng/?limit=1")
-        if data and 'data' in data and data['data']:
-            return data['data'][0]
-    return None
+    def _index(self, alert: PriceAlert):
+        self.alerts[alert.id] = alert
+        self.by_chat[alert.chat_id].add(alert.id)
+        self.indexes.setdefault(alert.coin_id, AlertIndex()).add(alert.threshold, alert.id, alert.direction)
 
-# --- Модуль новостей ---
-@async_cached(cache=news_cache)
-async def fetch_latest_news() -> List[Dict]:
-    """Парсит RSS-ленты и возвращает список последних новостей."""
-    all_news = []
-    
-    async def parse_feed(session, url):
-        try:
-            response_text = await make_request(session, url, 'text')
-            if response_text:
-                feed = feedparser.parse(response_text)
-                for entry in feed.entries:
-                    all_news.append({
-                        'title': entry.title,
-                        'link': entry.link,
-                        'published': getattr(entry, 'published_parsed', None)
-                    })
-        except Exception as e:
-            logger.warning(f"Не удалось спарсить RSS-ленту {url}: {e}")
+    def _unindex(self, alert_id: int) -> PriceAlert:
+        alert = self.alerts.pop(alert_id)
+        chat_alerts = self.by_chat[alert.chat_id]
+        chat_alerts.discard(alert_id)
+        if not chat_alerts:
+            del self.by_chat[alert.chat_id]
+        return alert
 
-    async with aiohttp.ClientSession() as session:
-        tasks = [parse_feed(session, url) for url in Config.NEWS_RSS_FEEDS]
-        await asyncio.gather(*tasks)
+    def _insert(self, chat_id: int, coin_id: str, symbol: str, threshold: float, created_at: float, direction: int) -> int:
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO alerts (chat_id, coin_id, symbol, threshold, created_at, direction) VALUES (?, ?, ?, ?, ?, ?)",
+                (chat_id, coin_id, symbol, threshold, created_at, direction))
+            self._db.commit()
+            return cursor.lastrowid
 
-    all_news.sort(key=lambda x: x['published'] or (0,), reverse=True)
-    
-    seen_titles = set()
-    unique_news = []
-    for item in all_news:
-        if item['title'].lower() not in seen_titles:
-            unique_news.append(item)
-            seen_titles.add(item['title'].lower())
+    def _delete(self, alert_ids: List[int]):
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.executemany("DELETE FROM alerts WHERE id = ?", [(i,) for i in alert_ids])
+            self._db.commit()
 
-    return unique_news[:5]
+    def chat_alerts(self, chat_id: int) -> List[PriceAlert]:
+        return sorted((self.alerts[i] for i in self.by_chat.get(chat_id, ())), key=lambda a: a.id)
 
-# --- Модули статуса сети ---
-async def get_halving_info() -> str:
-    """Получает информацию о халвинге Bitcoin."""
-    async with aiohttp.ClientSession() as s:
-        height_str = await make_request(s, "https://mempool.space/api/blocks/tip/height", 'text')
-        if not height_str or not height_str.isdigit():
-            return "❌ Не удалось получить данные о халвинге."
-        
-        current_block = int(height_str)
-        halving_interval = 210000
-        blocks_left = halving_interval - (current_block % halving_interval)
-        days = blocks_left / 144  # Приблизительно 144 блока в день
-        return f"⏳ <b>До халвинга Bitcoin осталось:</b>\n\n🧱 <b>Блоков:</b> <code>{blocks_left:,}</code>\n🗓 <b>Примерно дней:</b> <code>{days:.1f}</code>"
+    async def create(self, chat_id: int, coin: CryptoCoin, threshold: float) -> PriceAlert:
+        await self.sync()
+        async with self._sync_lock:
+            if len(self.by_chat.get(chat_id, ())) >= Config.ALERTS_PER_CHAT:
+                raise ValueError(f"Не больше {Config.ALERTS_PER_CHAT} оповещений на чат")
+            created_at = time.time()
+            # Направление - по цене, которую видел пользователь, а не по цене прошлого тика
+            direction = 1 if threshold > coin.price else -1
+            alert_id = await asyncio.to_thread(self._insert, chat_id, coin.id, coin.symbol, threshold, created_at, direction)
+            alert = PriceAlert(alert_id, chat_id, coin.id, coin.symbol, threshold, created_at, direction)
+            self._index(alert)
+            return alert
 
-async def get_btc_network_status() -> str:
-    """Получает статус сети Bitcoin."""
-    async with aiohttp.ClientSession() as s:
-        fees_url = "https://mempool.space/api/v1/fees/recommended"
-        mempool_url = "https://mempool.space/api/mempool"
-        fees, mempool = await asyncio.gather(make_request(s, fees_url), make_request(s, mempool_url))
+    async def delete(self, chat_id: int, alert_id: int) -> bool:
+        await self.sync()
+        async with self._sync_lock:
+            alert = self.alerts.get(alert_id)
+            if alert is None or alert.chat_id != chat_id:
+                return False
+            self._unindex(alert_id)
+            self.indexes[alert.coin_id].remove(alert.threshold, alert_id, alert.direction)
+            await asyncio.to_thread(self._delete, [alert_id])
+            return True
 
-        if not fees or not mempool:
-            return "❌ Не удалось получить статус сети BTC."
+    async def tick(self) -> List[Tuple[PriceAlert, float]]:
+        """Проверяет все оповещения по свежим ценам; возвращает сработавшие с текущей ценой.
 
-        return (f"📡 <b>Статус сети Bitcoin:</b>\n\n"
-                f"📈 <b>Транзакций в мемпуле:</b> <code>{mempool.get('count', 'N/A'):,}</code>\n\n"
-                f"💸 <b>Рекомендуемые комиссии (sat/vB):</b>\n"
-                f"  - 🚀 Высокий приоритет: <code>{fees.get('fastestFee', 'N/A')}</code>\n"
-                f"  - 🚶‍♂️ Средний приоритет: <code>{fees.get('halfHourFee', 'N/A')}</code>\n"
-                f"  - 🐢 Низкий приоритет: <code>{fees.get('hourFee', 'N/A')}</code>")
+        Для каждого сработавшего оповещения после отправки уведомления нужно вызвать finish.
+        """
+        await self.sync()
+        for coin_id in [c for c, index in self.indexes.items() if not index]:
+            del self.indexes[coin_id]
+        coin_ids = list(self.indexes)
+        if not coin_ids:
+            return []
+        step = Config.PRICE_BATCH_MAX_IDS
+        batches = await asyncio.gather(*(fetch_coin_markets(coin_ids[i:i + step]) for i in range(0, len(coin_ids), step)))
+        markets = {coin_id: data for batch in batches for coin_id, data in batch.items()}
 
+        # Пересечения и их запись - под той же блокировкой, что и перечитывание базы
+        async with self._sync_lock:
+            started = time.perf_counter()
+            fired = []
+            for coin_id, data in markets.items():
+                index = self.indexes.get(coin_id)
+                price = data.get('current_price')
+                if index is None or price is None:
+                    continue
+                fired.extend((self._unindex(alert_id), price) for alert_id in index.pop_reached(price))
+            for alert, _ in fired:
+                self.delivering[alert.id] = alert
+            elapsed = time.perf_counter() - started
+            if elapsed > Config.ALERT_TICK_BUDGET:
+                logger.warning(f"Проверка {len(self.alerts)} оповещений заняла {elapsed * 1000:.1f} мс.")
+            return fired
 
-# --- Модуль викторины с GPT ---
-async def generate_quiz_question() -> Optional[Dict]:
-    """Генерирует вопрос для викторины с помощью OpenAI."""
-    if not openai_client:
-        logger.warning("Ключ OpenAI не установлен. Викторина недоступна.")
-        return None
+    async def finish(self, alert: PriceAlert, delivered: bool):
+        """Удаляет доставленное оповещение из базы или возвращает недоставленное в индекс."""
+        if delivered:
+            await asyncio.to_thread(self._delete, [alert.id])
+            self.delivering.pop(alert.id, None)
+            return
+        async with self._sync_lock:
+            if self.delivering.pop(alert.id, None) is not None:
+                self._index(alert)
 
-    logger.info("Генерация вопроса для викторины...")
-    prompt = ('Создай 1 интересный вопрос для викторины на тему криптовалют или майнинга. '
-              'Вопрос должен быть среднего уровня сложности. '
-              'Ответ верни строго в формате JSON-объекта с ключами: "question" (строка), '
-              '"options" (массив из 4 строк) и "correct_option_index" (число от 0 до 3). '
-              'Без лишних слов и markdown-форматирования.')
+
+price_alerts = PriceAlertManager(os.path.join(Config.DATA_DIR, Config.ALERTS_FILE))
+
+def open_price_alerts():
+    """Открывает базу оповещений; при ошибке оповещения живут только в памяти до перезапуска."""
     try:
-        response = await openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},
-            temperature=0.8,
-        )
-        quiz_data = json.loads(response.choices[0].message.content)
-        # Валидация
-        if all(k in quiz_data for k in ['question', 'options', 'correct_option_index']) and len(quiz_data['options']) == 4:
-            logger.info("Вопрос для викторины успешно сгенерирован.")
-            return quiz_data
-        else:
-            logger.warning(f"GPT вернул некорректный формат JSON: {quiz_data}")
-            return None
-    except Exception as e:
-        logger.error(f"Ошибка при генерации вопроса викторины через OpenAI: {e}", exc_info=True)
-        return None
+        price_alerts.open()
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Не удалось открыть базу оповещений, работаю с памятью: {e}")
+        price_alerts.path = ":memory:"
+        price_alerts.open()
+
+def parse_price_threshold(text: str) -> float:
+    """Разбирает порог цены: "100000", "100 000", "$0,45", "100k"."""
+    cleaned = text.lower().replace(' ', '').replace('$', '').replace(',', '.')
+    multiplier = 1
+    if cleaned[-1:] in ('k', 'к'):
+        multiplier, cleaned = 1_000, cleaned[:-1]
+    elif cleaned[-1:] in ('m', 'м'):
+        multiplier, cleaned = 1_000_000, cleaned[:-1]
+    value = float(cleaned) * multiplier
+    if value <= 0:
+        raise ValueError(f"Неверный порог цены: {text}")
+    return value
+
+def format_usd(value: float) -> str:
+    return f"${value:,.2f}" if value >= 1 else f"${value:.6g}"
+
 
 # ==============================================================================
 # 7. ОБРАБОТЧИКИ КОМАНД И КОЛБЭКОВ TELEGRAM
 # ==============================================================================
 
+class FirstUpdateMiddleware(BaseMiddleware):
+    """Логирует время от запуска процесса до первого обработанного обновления."""
+
+    def __init__(self):
+        self.done = False
+        self.warm_start = False  # Были ли кэши восстановлены с диска
+
+    async def __call__(self, handler, event, data):
+        result = await handler(event, data)
+        if not self.done:
+            self.done = True
+            elapsed = time.monotonic() - PROCESS_STARTED_AT
+            logger.info(f"Первое обновление обработано через {elapsed:.2f} с после запуска "
+                        f"({'теплый старт с диска' if self.warm_start else 'холодный старт'}).")
+            if import_profiler.enabled:
+                logger.info(import_profiler.report())
+        return result
+
+
+first_update_middleware = FirstUpdateMiddleware()
+dp.update.outer_middleware(first_update_middleware)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Время работы каждого обработчика для mining_bot_handler_seconds.
+
+    Внутренний middleware вызывается уже для выбранного обработчика, поэтому
+    его имя берется из data['handler'].
+    """
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            handler_object = data.get('handler')
+            name = handler_object.callback.__name__ if handler_object is not None else 'unknown'
+            handler_latency.observe(time.perf_counter() - started, name, status)
+
+
+handler_metrics_middleware = HandlerMetricsMiddleware()
+for observer in (dp.message, dp.callback_query, dp.inline_query, dp.poll_answer):
+    observer.middleware(handler_metrics_middleware)
+
 def get_main_menu_keyboard():
     """Создает основную клавиатуру меню."""
     builder = InlineKeyboardBuilder()
@@ -468,6 +4087,96 @@ async def handle_start(message: Message):
 async def handle_menu_command(message: Message):
     await message.answer("Главное меню:", reply_markup=get_main_menu_keyboard())
 
+@dp.message(Command('trend'))
+async def handle_trend_command(message: Message, command: CommandObject):
+    """/trend <модель> [дней] - график доходности модели по истории."""
+    args = (command.args or "").split()
+    days = Config.ASIC_HISTORY_DEFAULT_DAYS
+    if len(args) > 1 and args[-1].isdigit():
+        days = int(args.pop())
+    if not args:
+        await message.answer("Укажите модель, например: /trend S21 30")
+        return
+
+    series = asic_history.find(" ".join(args))
+    if series is None:
+        await message.answer("❌ Нет истории доходности для этой модели.")
+        return
+    now = int(time.time())
+    times, values = series.range(now - days * 86400, now)
+    if len(times) < 2:
+        await message.answer(f"Для <b>{sanitize_html(series.name)}</b> пока недостаточно данных для графика.")
+        return
+
+    image = await run_cpu_bound(render_profitability_chart, series.name, times, values)
+    change = values[-1] - values[0]
+    caption = (f"📈 <b>{sanitize_html(series.name)}</b> за {days} дн.\n"
+               f"Сейчас: ${values[-1]:.2f}/день ({change:+.2f}), мин. ${min(values):.2f}, макс. ${max(values):.2f}")
+    await message.answer_photo(types.BufferedInputFile(image, "trend.png"), caption=caption)
+
+@dp.message(Command('sources'))
+async def handle_sources_command(message: Message):
+    """/sources - свежесть и задержка источников данных по ASIC."""
+    await message.answer(format_asic_sources(asic_aggregator.source_status()))
+
+@dp.message(Command('subscribe'))
+async def handle_subscribe_command(message: Message):
+    if await asyncio.to_thread(broadcast_store.add_subscriber, message.chat.id):
+        await message.answer(f"✅ Чат подписан на новости. Рассылка каждые {Config.NEWS_INTERVAL_HOURS} ч. Отписаться: /unsubscribe")
+    else:
+        await message.answer("Этот чат уже подписан на новости.")
+
+@dp.message(Command('unsubscribe'))
+async def handle_unsubscribe_command(message: Message):
+    if await asyncio.to_thread(broadcast_store.remove_subscriber, message.chat.id):
+        await message.answer("Чат отписан от новостей.")
+    else:
+        await message.answer("Этот чат не подписан на новости. Подписаться: /subscribe")
+
+@dp.message(Command('alert'))
+async def handle_alert_command(message: Message, command: CommandObject):
+    """/alert <монета> <цена> - оповещение, когда цена пересечет порог."""
+    args = (command.args or "").split()
+    if len(args) < 2:
+        await message.answer("Укажите монету и цену, например: /alert BTC 100000")
+        return
+    try:
+        threshold = parse_price_threshold("".join(args[1:]))
+    except ValueError:
+        await message.answer("❌ Неверная цена. Пример: /alert BTC 100000 или /alert ETH 4k")
+        return
+
+    coin = await get_crypto_price(args[0])
+    if not coin:
+        await message.answer(f"❌ Не удалось найти информацию по '{sanitize_html(args[0])}'.")
+        return
+    try:
+        alert = await price_alerts.create(message.chat.id, coin, threshold)
+    except ValueError as e:
+        await message.answer(f"❌ {e}. Удалить лишние: /alerts")
+        return
+    direction = "поднимется до" if alert.direction > 0 else "опустится до"
+    await message.answer(f"🔔 Оповещение #{alert.id}: сообщу, когда {coin.symbol} {direction} {format_usd(threshold)} "
+                         f"(сейчас {format_usd(coin.price)}).")
+
+@dp.message(Command('alerts'))
+async def handle_alerts_command(message: Message):
+    await price_alerts.sync()
+    alerts = price_alerts.chat_alerts(message.chat.id)
+    if not alerts:
+        await message.answer("Оповещений нет. Создать: /alert BTC 100000")
+        return
+    lines = [f"#{a.id}: {a.symbol} {format_usd(a.threshold)}" for a in alerts]
+    await message.answer("🔔 <b>Ваши оповещения:</b>\n" + "\n".join(lines) + "\n\nУдалить: /delalert <номер>")
+
+@dp.message(Command('delalert'))
+async def handle_delete_alert_command(message: Message, command: CommandObject):
+    alert_id = (command.args or "").strip().lstrip('#')
+    if alert_id.isdigit() and await price_alerts.delete(message.chat.id, int(alert_id)):
+        await message.answer(f"Оповещение #{alert_id} удалено.")
+    else:
+        await message.answer("❌ Оповещение не найдено. Список: /alerts")
+
 # --- Обработчики кнопок главного меню ---
 
 @dp.callback_query(F.data == "menu_asics")
@@ -486,7 +4195,9 @@ async def handle_asics_menu(call: CallbackQuery):
             f"{f' | Алгоритм: {miner.algorithm}' if miner.algorithm else ''}"
             f"{f' | Мощность: {miner.power}W' if miner.power else ''}\n"
         )
-    
+    response_text += format_data_as_of(asic_aggregator.as_of)
+    response_text += "\n📈 Динамика доходности модели: /trend S21"
+
     await call.message.edit_text(response_text, reply_markup=get_main_menu_keyboard())
     await call.answer()
 
@@ -513,18 +4224,7 @@ async def send_price_info(message: types.Message, query: str):
     if not coin:
         await message.answer(f"❌ Не удалось найти информацию по запросу '{query}'.")
         return
-
-    change_24h = coin.price_change_24h or 0
-    emoji = "📈" if change_24h >= 0 else "📉"
-    response_text = (
-        f"<b>{coin.name} ({coin.symbol})</b>\n"
-        f"💹 Курс: <b>${coin.price:,.4f}</b>\n"
-        f"{emoji} Изменение за 24ч: <b>{change_24h:.2f}%</b>\n"
-    )
-    if coin.algorithm:
-        response_text += f"⚙️ Алгоритм: <code>{coin.algorithm}</code>"
-    
-    await message.answer(response_text)
+    await message.answer(format_coin_price(coin))
 
 @dp.callback_query(F.data.startswith("price_"))
 async def handle_price_callback(call: CallbackQuery):
@@ -555,6 +4255,23 @@ async def handle_news_menu(call: CallbackQuery):
     await call.message.answer("Главное меню:", reply_markup=get_main_menu_keyboard())
     await call.answer()
     
+async def send_fear_greed_photo(message: types.Message, value: int, classification: str, caption: str):
+    """Отправляет картинку индекса: по file_id, если она уже загружалась, иначе из кэша PNG."""
+    key = (value, classification)
+    file_id = fear_greed_file_id_cache.get(key)
+    if file_id:
+        try:
+            await message.answer_photo(file_id, caption=caption)
+            return
+        except TelegramBadRequest:
+            logger.warning("file_id картинки индекса устарел, загружаю заново.")
+            fear_greed_file_id_cache.pop(key, None)
+
+    image = await get_fear_greed_image(value, classification)
+    sent = await message.answer_photo(types.BufferedInputFile(image, "fng.png"), caption=caption)
+    if sent.photo:
+        fear_greed_file_id_cache[key] = sent.photo[-1].file_id
+
 @dp.callback_query(F.data == "menu_fear_greed")
 async def handle_fear_greed_menu(call: CallbackQuery):
     await call.message.edit_text("⏳ Получаю индекс...")
@@ -566,31 +4283,10 @@ async def handle_fear_greed_menu(call: CallbackQuery):
     value = int(index['value'])
     classification = index['value_classification']
     
-    # Генерация изображения
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(8, 4.5), subplot_kw={'projection': 'polar'})
-    ax.set_yticklabels([])
-    ax.set_xticklabels([])
-    ax.grid(False)
-    ax.spines['polar'].set_visible(False)
-    ax.set_ylim(0, 1)
-    colors = ['#d94b4b', '#e88452', '#ece36a', '#b7d968', '#73c269']
-    for i in range(100):
-        ax.barh(1, 0.0314, left=3.14 - (i * 0.0314), height=0.3, color=colors[min(len(colors) - 1, int(i / 25))])
-    angle = 3.14 - (value * 0.0314)
-    ax.annotate('', xy=(angle, 1), xytext=(0, 0), arrowprops=dict(facecolor='white', shrink=0.05, width=4, headwidth=10))
-    fig.text(0.5, 0.5, f"{value}", ha='center', va='center', fontsize=48, color='white', weight='bold')
-    fig.text(0.5, 0.35, classification, ha='center', va='center', fontsize=20, color='white')
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, transparent=True)
-    buf.seek(0)
-    plt.close(fig)
-    
     caption = f"😱 <b>Индекс страха и жадности: {value} - {classification}</b>"
     
     await call.message.delete()
-    await call.message.answer_photo(types.BufferedInputFile(buf.read(), "fng.png"), caption=caption)
+    await send_fear_greed_photo(call.message, value, classification, caption)
     await call.message.answer("Главное меню:", reply_markup=get_main_menu_keyboard())
     await call.answer()
 
@@ -603,7 +4299,7 @@ async def handle_info_callbacks(call: CallbackQuery):
     elif call.data == "menu_btc_status":
         text = await get_btc_network_status()
     elif call.data == "menu_calculator":
-        await call.message.answer("💡 Введите стоимость электроэнергии в <b>рублях</b> за кВт/ч:", reply_markup=ForceReply())
+        await call.message.answer("💡 Введите стоимость электроэнергии в <b>рублях</b> за кВт/ч (например: 4.5) или диапазон (например: 3-6):", reply_markup=ForceReply())
         await call.answer()
         return
 
@@ -612,14 +4308,15 @@ async def handle_info_callbacks(call: CallbackQuery):
 
 @dp.callback_query(F.data == "menu_quiz")
 async def handle_quiz_menu(call: CallbackQuery):
-    await call.message.edit_text("⏳ Генерирую уникальный вопрос...")
-    quiz_data = await generate_quiz_question()
+    if not quiz_pool.questions:
+        await call.message.edit_text("⏳ Генерирую уникальный вопрос...")
+    quiz_data = await quiz_pool.take()
     if not quiz_data:
         await call.message.edit_text("😕 Не удалось сгенерировать вопрос. Попробуйте позже.", reply_markup=get_main_menu_keyboard())
         return
 
     await call.message.delete()
-    await call.message.answer_poll(
+    sent = await call.message.answer_poll(
         question=quiz_data['question'],
         options=quiz_data['options'],
         type='quiz',
@@ -627,13 +4324,79 @@ async def handle_quiz_menu(call: CallbackQuery):
         is_anonymous=False,
         reply_markup=InlineKeyboardBuilder().button(text="Следующий вопрос", callback_data="menu_quiz").as_markup()
     )
+    await quiz_results.register_poll(sent.poll.id, call.message.chat.id, quiz_data['correct_option_index'])
     await call.answer()
 
 @dp.poll_answer()
 async def handle_poll_answer(poll_answer: types.PollAnswer):
-    # Здесь можно добавить логику для сохранения результатов викторины
-    logger.info(f"Пользователь {poll_answer.user.id} ответил на викторину.")
+    if poll_answer.user is None:
+        return  # Анонимный ответ от имени канала
+    correct = await quiz_results.record_answer(poll_answer.poll_id, poll_answer.user.id,
+                                               poll_answer.user.full_name, poll_answer.option_ids)
+    if correct is not None:
+        logger.debug(f"Пользователь {poll_answer.user.id} ответил на викторину {'верно' if correct else 'неверно'}.")
+
+@dp.message(Command('top'))
+async def handle_top_command(message: Message, command: CommandObject):
+    """/top - рейтинг чата (в личке - общий), /top week - за неделю, /top all - общий."""
+    arg = (command.args or "").strip().lower()
+    if arg in ('week', 'неделя'):
+        scope, title = 'week', "за неделю"
+    elif arg in ('all', 'global', 'все') or message.chat.type == 'private':
+        scope, title = 'global', "общий"
+    else:
+        scope, title = 'chat', "чата"
+    await quiz_results.sync()
+    board = quiz_results.leaderboard(scope, message.chat.id)
+    if not board:
+        await message.answer("Рейтинг пока пуст. Сыграйте в викторину: /menu → 🧠 Викторина")
+        return
+
+    medals = ["🥇", "🥈", "🥉"]
+    lines = [f"🏆 <b>Рейтинг викторины ({title}):</b>\n"]
+    top = board.top(Config.QUIZ_TOP_COUNT)
+    for user_id, score, answers in top:
+        place = board.rank(user_id)
+        name = sanitize_html(quiz_results.names.get(user_id, str(user_id)))
+        lines.append(f"{medals[place - 1] if place <= 3 else f'{place}.'} {name}: {score} из {answers}")
+    user_id = message.from_user.id if message.from_user else None
+    place = board.rank(user_id) if user_id is not None else None
+    if place and user_id not in {listed for listed, _, _ in top}:
+        lines.append(f"\nВаше место: {place}")
+    await message.answer("\n".join(lines))
+
+
+# --- Inline-режим ---
+@dp.inline_query()
+async def handle_inline_query(inline_query: InlineQuery):
+    """@bot btc — курс монеты в любом чате. Совпадения из кэша отвечаются без сети."""
+    index = get_coin_index.peek()
+    if index is None:
+        # Индекс еще загружается (прогрев): Telegram повторит запрос при следующем символе
+        await inline_query.answer([], cache_time=Config.INLINE_PARTIAL_CACHE_TIME)
+        return
+
+    user_id = inline_query.from_user.id
+    inline_debouncer.push(user_id, inline_query.id)
+    coin_ids = inline_coin_ids(index, inline_query.query)
+    coins: Dict[str, Optional[CryptoCoin]] = {}
+    for coin_id in coin_ids:
+        # Закэшированная цена возвращается сразу, устаревшая при этом обновляется в фоне
+        coins[coin_id] = await get_coin_market(coin_id) if get_coin_market.peek(coin_id) is not None else None
+    missing = [coin_id for coin_id, coin in coins.items() if coin is None]
+    if missing:
+        if not await inline_debouncer.settle(user_id, inline_query.id):
+            return  # Пользователь продолжил печатать, ответит более новый запрос
+        try:
+            fetched = await asyncio.wait_for(asyncio.gather(*(get_coin_market(i) for i in missing), return_exceptions=True),
+                                             Config.INLINE_FETCH_DEADLINE)
+            coins.update((i, coin) for i, coin in zip(missing, fetched) if isinstance(coin, CryptoCoin))
+        except asyncio.TimeoutError:
+            logger.warning(f"Цены для inline-запроса не загрузились за {Config.INLINE_FETCH_DEADLINE} с.")
 
+    found = [coin for coin in coins.values() if coin is not None]
+    cache_time = Config.INLINE_CACHE_TIME if len(found) == len(coin_ids) else Config.INLINE_PARTIAL_CACHE_TIME
+    await inline_query.answer(build_inline_price_results(found), cache_time=cache_time, is_personal=False)
 
 # --- Обработчик текстовых сообщений ---
 @dp.message(F.text)
@@ -649,46 +4412,46 @@ async def handle_text_message(message: Message):
         # Ответ на "Введите стоимость электроэнергии"
         elif "стоимость электроэнергии" in message.reply_to_message.text:
             try:
-                cost_rub = float(message.text.replace(',', '.'))
-                # Заглушка для курса, в реальном приложении нужно получать актуальный
-                rate_usd_rub = 90.0 
-                cost_usd = cost_rub / rate_usd_rub
-                
-                asics = await get_profitable_asics()
-                if not asics:
+                tariffs_rub = parse_tariff_range(message.text)
+                calculator = await get_profit_calculator()
+                if calculator is None:
                     await message.answer("❌ Не удалось получить данные о доходности ASIC.")
                     return
+                rate_usd_rub = await get_usd_rub_rate() or Config.USD_RUB_FALLBACK_RATE
 
-                res = [f"💰 <b>Расчет профита (розетка {cost_rub:.2f} ₽/кВтч)</b>\n"]
-                for asic in asics[:10]:
-                    if asic.power:
-                        daily_cost = (asic.power / 1000) * 24 * cost_usd
-                        profit = asic.profitability - daily_cost
-                        res.append(f"<b>{sanitize_html(asic.name)}</b>: ${profit:.2f}/день")
-                await message.answer("\n".join(res))
+                if len(tariffs_rub) == 1:
+                    text = format_profit_top(calculator, tariffs_rub[0], rate_usd_rub)
+                else:
+                    text = format_profit_by_tariff(calculator, tariffs_rub, rate_usd_rub)
+                await message.answer(text + "\n" + format_data_as_of(asic_aggregator.as_of))
                 await handle_menu_command(message) # Показываем меню снова
 
+            except TariffError as e:
+                await message.answer(f"❌ {e}")
             except (ValueError, TypeError):
-                await message.answer("❌ Неверный формат. Введите число (например: 4.5).")
+                await message.answer("❌ Неверный формат. Введите число (например: 4.5) или диапазон (например: 3-6).")
             await message.reply_to_message.delete()
             await message.delete()
     else:
-        # Если это не ответ, считаем, что пользователь хочет узнать курс
-        await send_price_info(message, message.text)
+        # Если это не ответ, считаем запросом курса только то, что локальный индекс узнает как монету:
+        # обычная переписка в чате не порождает запросов к CoinGecko
+        if await resolve_coin_id(message.text, strict=True):
+            await send_price_info(message, message.text)
 
 
 # ==============================================================================
 # 8. ЗАПУСК ПЛАНИРОВЩИКА И БОТА
 # ==============================================================================
 async def send_news_job():
-    """Задача для APScheduler: получает новости и отправляет их."""
-    if not Config.NEWS_CHAT_ID:
-        logger.warning("Переменная NEWS_CHAT_ID не установлена. Авто-отправка новостей отключена.")
+    """Задача для APScheduler: забирает новые новости из лент и рассылает только их подписчикам."""
+    if not await asyncio.to_thread(broadcast_store.count_subscribers):
+        logger.info("Подписчиков на новости нет, рассылка пропущена.")
         return
 
     logger.info("Запуск задачи по отправке новостей...")
     try:
-        news = await fetch_latest_news()
+        await news_ingester.ingest()
+        news = news_ingester.take_unsent(Config.NEWS_TOP_COUNT)
         if not news:
             logger.info("Новых новостей для отправки не найдено.")
             return
@@ -696,47 +4459,364 @@ async def send_news_job():
         text = "📰 <b>Последние крипто-новости (авто-рассылка):</b>\n\n" + "\n".join(
             [f"🔹 <a href=\"{n['link']}\">{sanitize_html(n['title'])}</a>" for n in news]
         )
-        await bot.send_message(Config.NEWS_CHAT_ID, text, disable_web_page_preview=True)
-        logger.info(f"Новости успешно отправлены в чат {Config.NEWS_CHAT_ID}.")
+        # Отметка об отправке сохраняется до рассылки; прерванную рассылку продолжит broadcaster.resume()
+        await news_ingester.save()
+        await broadcaster.broadcast(text)
     except Exception as e:
         logger.error(f"Ошибка при выполнении задачи отправки новостей: {e}", exc_info=True)
 
 
-async def main():
-    """Основная функция для запуска бота и планировщика."""
-    # Добавление задачи в планировщик
-    if Config.NEWS_CHAT_ID:
-        scheduler.add_job(send_news_job, 'interval', hours=Config.NEWS_INTERVAL_HOURS, misfire_grace_time=60)
-        scheduler.start()
-        logger.info(f"Задача по отправке новостей запланирована каждые {Config.NEWS_INTERVAL_HOURS} часа.")
-    else:
-        logger.warning("NEWS_CHAT_ID не указан, автоматическая отправка новостей отключена.")
+async def deliver_price_alert(alert: PriceAlert, price: float):
+    """Отправляет уведомление о сработавшем оповещении; оповещение удаляется, только если оно доставлено."""
+    text = f"🔔 <b>{alert.symbol}</b> пересек {format_usd(alert.threshold)}: сейчас {format_usd(price)}."
+    delivered = False
+    try:
+        delivered = await broadcaster.send(alert.chat_id, text)
+    finally:
+        if not delivered:
+            logger.warning(f"Оповещение #{alert.id} не доставлено в чат {alert.chat_id}, проверю его снова.")
+        await price_alerts.finish(alert, delivered)
+
+async def check_price_alerts_job():
+    """Задача для APScheduler: проверяет ценовые оповещения и уведомляет сработавшие чаты."""
+    try:
+        fired = await price_alerts.tick()
+    except Exception as e:
+        logger.error(f"Ошибка при проверке ценовых оповещений: {e}", exc_info=True)
+        return
+    for alert, price in fired:
+        spawn_background(deliver_price_alert(alert, price))
+    if fired:
+        logger.info(f"Сработало ценовых оповещений: {len(fired)}.")
+
+
+fee_spike_detector = FeeSpikeDetector()
+
+def notify_new_block(state: NetworkState):
+    """Подписчик потока mempool.space: сообщает о новом блоке в NETWORK_ALERTS_CHAT_ID."""
+    if not Config.NETWORK_ALERTS_CHAT_ID or not leader_elector.is_leader:
+        return
+    blocks_left = Config.BTC_HALVING_INTERVAL - (state.height % Config.BTC_HALVING_INTERVAL)
+    text = f"🧱 Новый блок Bitcoin <code>{state.height:,}</code>. До халвинга блоков: <code>{blocks_left:,}</code>."
+    spawn_background(broadcaster.send(int(Config.NETWORK_ALERTS_CHAT_ID), text))
 
-    # Предварительный прогрев кэша
+def notify_fee_spike(state: NetworkState):
+    """Подписчик потока mempool.space: сообщает о резком росте комиссий."""
+    fastest = state.fees.get('fastestFee')
+    if not isinstance(fastest, (int, float)):
+        return
+    baseline = fee_spike_detector.baseline
+    # Средняя обновляется на всех репликах, чтобы новый лидер сразу знал ее
+    if not fee_spike_detector.update(fastest) or not Config.NETWORK_ALERTS_CHAT_ID or not leader_elector.is_leader:
+        return
+    text = (f"💸 Комиссии в сети Bitcoin выросли: <code>{fastest}</code> sat/vB за быстрое подтверждение "
+            f"(в среднем было <code>{baseline:.0f}</code>).")
+    spawn_background(broadcaster.send(int(Config.NETWORK_ALERTS_CHAT_ID), text))
+
+
+async def refresh_stale_caches_job():
+    """Задача для APScheduler: заранее обновляет устаревающие записи кэшей."""
+    for func in prefetched_functions:
+        try:
+            refreshed = await func.refresh_stale(ahead=Config.CACHE_REFRESH_INTERVAL)
+            if refreshed:
+                logger.info(f"Фоновое обновление кэша {func.__name__}: {refreshed} записей.")
+        except Exception as e:
+            logger.error(f"Ошибка фонового обновления кэша {func.__name__}: {e}", exc_info=True)
+
+
+async def prefetch_popular_prices_job():
+    """Задача для APScheduler: заранее обновляет цены Config.POPULAR_TICKERS одним пакетным запросом."""
+    coin_ids = [coin_id for coin_id in await asyncio.gather(*(resolve_coin_id(t) for t in Config.POPULAR_TICKERS)) if coin_id]
+    await asyncio.gather(*(get_coin_market.refresh(coin_id) for coin_id in coin_ids), return_exceptions=True)
+    stats = price_batcher.stats()
+    logger.info(f"Цены популярных монет обновлены. Пакетные запросы: {stats['requests']} запросов, "
+                f"{stats['upstream_calls']} вызовов CoinGecko (сэкономлено {stats['calls_saved']}), "
+                f"средний пакет {stats['avg_batch_size']:.1f}, максимальный {stats['max_batch_size']}.")
+
+
+class WebhookServer:
+    """Прием обновлений Telegram через aiohttp.web.
+
+    Обновление проверяется по секретному токену, сразу подтверждается ответом
+    200 и обрабатывается диспетчером в фоне, поэтому Telegram не ждет
+    медленные обработчики. При остановке новые обновления не принимаются
+    (503 — Telegram повторит их позже), а уже принятые дообрабатываются.
+    """
+
+    def __init__(self, bot: Bot, dispatcher: Dispatcher, secret_token: Optional[str] = Config.WEBHOOK_SECRET):
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self.secret_token = secret_token
+        self.tasks: Set[asyncio.Task] = set()
+        self.accepting = True
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.secret_token:
+            received = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if not hmac.compare_digest(received, self.secret_token):
+                return web.Response(status=401)
+        if not self.accepting:
+            return web.Response(status=503)
+        try:
+            update = types.Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError as e:
+            logger.warning(f"Некорректное обновление во вебхуке: {e}")
+            return web.Response(status=400)
+
+        task = asyncio.create_task(self.dispatcher.feed_update(self.bot, update))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'status': 'ok' if self.accepting else 'stopping',
+            'pending_updates': len(self.tasks),
+        })
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(Config.WEBHOOK_PATH, self.handle_update)
+        app.router.add_get('/health', self.handle_health)
+        return app
+
+    async def drain(self, timeout: float = Config.WEBHOOK_SHUTDOWN_TIMEOUT):
+        """Перестает принимать обновления и ждет обработки уже принятых."""
+        self.accepting = False
+        if self.tasks:
+            logger.info(f"Ожидание обработки {len(self.tasks)} принятых обновлений...")
+            await asyncio.wait(set(self.tasks), timeout=timeout)
+
+
+def collect_runtime_metrics():
+    """Обновляет вычисляемые метрики: размеры кэшей, лидерство, состояние потоков."""
+    for cache in metered_caches:
+        cache_entries.set(len(cache), cache.name)
+    uptime_seconds.set(time.monotonic() - PROCESS_STARTED_AT)
+    is_leader_gauge.set(int(leader_elector.is_leader))
+    mempool_feed_live.set(int(mempool_feed.is_live))
+    now = time.time()
+    for source in asic_aggregator.sources.values():
+        fetched_at = source.fetched_at()
+        if fetched_at is not None:
+            asic_source_age.set(now - fetched_at, source.name)
+
+metrics_collectors.append(collect_runtime_metrics)
+
+
+class MetricsServer:
+    """Отдает метрики в формате Prometheus на отдельном порту (по умолчанию только localhost)."""
+
+    def __init__(self, host: str = Config.METRICS_HOST, port: int = Config.METRICS_PORT):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=render_metrics().encode(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        return app
+
+    async def start(self):
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            logger.error(f"Не удалось открыть порт метрик {self.host}:{self.port}, работаю без них: {e}")
+            await self.close()
+            return
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics.")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+metrics_server = MetricsServer()
+
+
+def wait_for_stop_signal() -> asyncio.Event:
+    """Возвращает событие, которое выставляется по SIGINT/SIGTERM."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: остановка через KeyboardInterrupt
+    return stop_event
+
+async def run_webhook():
+    """Запускает встроенный веб-сервер и регистрирует вебхук в Telegram."""
+    server = WebhookServer(bot, dp)
+    runner = web.AppRunner(server.create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, Config.WEBAPP_HOST, Config.WEBAPP_PORT)
+    await site.start()
+    logger.info(f"Веб-сервер запущен на {Config.WEBAPP_HOST}:{Config.WEBAPP_PORT}.")
+
+    stop_event = wait_for_stop_signal()
+    try:
+        await bot.set_webhook(
+            url=Config.WEBHOOK_URL.rstrip('/') + Config.WEBHOOK_PATH,
+            secret_token=Config.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=True,
+        )
+        await dp.emit_startup(bot=bot)
+        await stop_event.wait()
+    finally:
+        logger.info("Остановка вебхука...")
+        await server.drain()
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+
+def open_persistent_cache():
+    """Открывает постоянный кэш на диске, если он включен."""
+    global persistent_cache
+    if not Config.PERSISTENT_CACHE_ENABLED:
+        return
+    try:
+        cache = PersistentCache(os.path.join(Config.DATA_DIR, Config.PERSISTENT_CACHE_FILE))
+        cache.open()
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Не удалось открыть постоянный кэш, работаю только с памятью: {e}")
+        return
+    persistent_cache = cache
+    persistent_cache.start()
+
+async def close_persistent_cache():
+    """Сохраняет отложенные записи и закрывает постоянный кэш."""
+    global persistent_cache
+    if persistent_cache is not None:
+        await persistent_cache.close()
+        persistent_cache = None
+
+def open_cache_backend():
+    """Подключает общий кэш, если задан REDIS_URL; без него остается кэш в памяти."""
+    global cache_backend
+    if not Config.REDIS_URL:
+        return
+    try:
+        cache_backend = RedisCacheBackend(Config.REDIS_URL)
+    except (ImportError, ValueError) as e:
+        logger.error(f"Не удалось подключить общий кэш, работаю только с памятью: {e}")
+        return
+    logger.info(f"Общий кэш подключен, реплика {Config.REPLICA_ID}.")
+
+async def close_cache_backend():
+    global cache_backend
+    await cache_backend.close()
+    cache_backend = MemoryCacheBackend()
+
+def restore_persistent_caches() -> int:
+    """Загружает записи постоянного кэша в память с их исходным временем получения."""
+    if persistent_cache is None:
+        return 0
+    restored = 0
+    for func in persisted_functions:
+        try:
+            restored += func.restore(persistent_cache.load(func.cache_namespace))
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось восстановить кэш {func.__name__}: {e}")
+    logger.info(f"Из постоянного кэша восстановлено записей: {restored}.")
+    return restored
+
+async def warm_up_caches():
+    """Прогревает (или обновляет в фоне) основные кэши."""
     logger.info("Предварительный прогрев кэша...")
+    # Импорт парсеров в потоке, чтобы первая загрузка не блокировала event loop
+    await asyncio.to_thread(preload_modules, bs4, process, np)
     await asyncio.gather(
         get_profitable_asics(),
         get_coin_list(),
+        get_coin_index(),
         return_exceptions=True
     )
     logger.info("Кэш прогрет.")
-    
-    # Удаление вебхука перед запуском
-    await bot.delete_webhook(drop_pending_updates=True)
+
+
+async def main():
+    """Основная функция для запуска бота и планировщика."""
+    create_http_session()
+    create_cpu_executor()
+    open_cache_backend()
+    open_persistent_cache()
+    open_asic_history()
+    open_broadcast_store()
+    open_price_alerts()
+    open_quiz_results()
+    news_ingester.load()
+    quiz_pool.load()
+    loop_lag_monitor.start()
+    try:
+        if Config.METRICS_PORT:
+            await metrics_server.start()
+        await run_bot()
+    finally:
+        loop_lag_monitor.stop()
+        await metrics_server.close()
+        await mempool_feed.close()
+        await leader_elector.stop()
+        await cancel_background_tasks()
+        await close_persistent_cache()
+        asic_history.close()
+        broadcast_store.close()
+        price_alerts.close()
+        await quiz_results.close()
+        await close_cache_backend()
+        shutdown_cpu_executor()
+        await close_http_session()
+
+
+async def run_bot():
+    """Запускает планировщик, прогревает кэш и начинает получать обновления."""
+    # Добавление задач в планировщик
+    scheduler.add_job(metered_job(refresh_stale_caches_job), 'interval', seconds=Config.CACHE_REFRESH_INTERVAL, misfire_grace_time=30)
+    # Обновление устаревающих записей безопасно на всех репликах: общий кэш
+    # пропускает к источнику только одну. Остальные задачи — только на лидере.
+    scheduler.add_job(leader_only(metered_job(prefetch_popular_prices_job)), 'interval', seconds=Config.PRICE_PREFETCH_INTERVAL,
+                      misfire_grace_time=30, next_run_time=datetime.now(timezone.utc))
+    scheduler.add_job(leader_only(metered_job(check_price_alerts_job)), 'interval', seconds=Config.ALERT_CHECK_INTERVAL, misfire_grace_time=30)
+    scheduler.add_job(leader_only(metered_job(send_news_job)), 'interval', hours=Config.NEWS_INTERVAL_HOURS, misfire_grace_time=60)
+    logger.info(f"Рассылка новостей подписчикам запланирована каждые {Config.NEWS_INTERVAL_HOURS} часа.")
+    # Прерванную рассылку продолжает реплика, ставшая лидером
+    leader_elector.on_elected.append(lambda: spawn_background(broadcaster.resume()))
+    if Config.SHARED_DATA_DIR:
+        # Что уже разослал прежний лидер, знает только файл состояния в общем DATA_DIR
+        leader_elector.on_elected.append(news_ingester.load)
+    await leader_elector.start()
+    scheduler.start()
+    mempool_feed.on_block.append(notify_new_block)
+    mempool_feed.on_fees.append(notify_fee_spike)
+    mempool_feed.start()
+    spawn_background(quiz_pool.refill())
+
+    # Прогрев кэша идет параллельно с приемом обновлений: если данные
+    # восстановлены с диска, бот отвечает ими сразу, а иначе первые запросы
+    # присоединяются к уже идущей загрузке (single-flight в async_cached).
+    first_update_middleware.warm_start = restore_persistent_caches()
+    spawn_background(warm_up_caches())
+    logger.info(f"Бот готов принимать обновления через {time.monotonic() - PROCESS_STARTED_AT:.2f} с после запуска.")
 
     if Config.WEBHOOK_URL:
         # Запуск в режиме вебхука (для продакшена)
-        # Убедитесь, что ваше приложение может обрабатывать входящие запросы на /webhook
-        # и что порт 8080 (или другой) открыт.
         logger.info(f"Запуск в режиме вебхука. URL: {Config.WEBHOOK_URL}")
-        # Здесь должен быть код для запуска веб-сервера (например, aiohttp.web)
-        # Этот код здесь не приводится для простоты, так как он зависит от хостинга
-        # await bot.set_webhook(url=Config.WEBHOOK_URL)
-        logger.warning("Для режима вебхука требуется дополнительная настройка веб-сервера (aiohttp, FastAPI). Запускаюсь в режиме опроса.")
-        await dp.start_polling(bot)
+        if not Config.WEBHOOK_SECRET:
+            logger.warning("WEBHOOK_SECRET не задан: входящие обновления не проверяются.")
+        await run_webhook()
 
     else:
         # Запуск в режиме long-polling (для разработки)
+        # Удаление вебхука перед запуском
+        await bot.delete_webhook(drop_pending_updates=True)
         logger.info("Запуск в режиме long-polling.")
         await dp.start_polling(bot)
 
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# mining_bot читает настройки при импорте: токен-заглушка и отдельный каталог данных
+os.environ["BOT_TOKEN"] = "123456:TEST-TOKEN"
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="mining_bot_tests_")
+for name in ("REDIS_URL", "WEBHOOK_URL", "METRICS_PORT", "STARTUP_PROFILE", "OPENAI_API_KEY"):
+    os.environ.pop(name, None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
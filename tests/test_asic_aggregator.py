@@ -0,0 +1,113 @@
+"""Слияние источников ASIC: deadline каждого источника, частичный список при сбоях и порядок слияния."""
+import asyncio
+from datetime import timezone
+
+import pytest
+
+import mining_bot
+from mining_bot import AsicAggregator, AsicMiner, AsicSource, Config, ProfitabilityHistory
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    # Источники регистрируют свои кэши в списках модуля; история пишется во временный каталог
+    monkeypatch.setattr(mining_bot, 'persisted_functions', [])
+    monkeypatch.setattr(mining_bot, 'prefetched_functions', [])
+    monkeypatch.setattr(mining_bot, 'asic_history', ProfitabilityHistory(str(tmp_path / 'history.sqlite3')))
+
+
+class StubSource:
+    """fetch для AsicSource: отдает заданные майнеры с задержкой или падает."""
+
+    def __init__(self, miners=(), delay=0.0, error=None):
+        self.miners = list(miners)
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def fetch(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.miners
+
+    @staticmethod
+    def parse(raw):
+        return [AsicMiner(m.name, m.profitability, m.algorithm, m.hashrate, m.power) for m in raw]
+
+
+def make_aggregator(**stubs):
+    aggregator = AsicAggregator()
+    for name, stub in stubs.items():
+        aggregator.register(AsicSource(name, stub.fetch, stub.parse, deadline=0.1))
+    return aggregator
+
+
+def names(miners):
+    return [miner.name for miner in miners]
+
+
+async def test_merge_is_sorted_by_profitability_and_keeps_best_duplicate():
+    aggregator = make_aggregator(
+        First=StubSource([AsicMiner("Antminer S21 200Th", 10.0, 'SHA-256', '200Th'),
+                          AsicMiner("Whatsminer M66S 298Th", 14.0)]),
+        Second=StubSource([AsicMiner("Bitmain Antminer S21 200Th", 12.0, power=3550),
+                           AsicMiner("Antminer L9 16Gh", 20.0, 'Scrypt')]),
+    )
+    miners = await aggregator.get()
+    assert names(miners) == ["Antminer L9 16Gh", "Whatsminer M66S 298Th", "Antminer S21 200Th"]
+    s21 = miners[2]
+    # Название - первого по алфавиту, доходность - лучшая, пустые поля дополняются из дубликата
+    assert (s21.profitability, s21.algorithm, s21.power) == (12.0, 'SHA-256', 3550)
+    assert aggregator.as_of.tzinfo is timezone.utc
+
+
+async def test_slow_source_is_left_out_until_it_loads():
+    slow = StubSource([AsicMiner("Avalon A1466 150Th", 30.0)], delay=0.3)
+    aggregator = make_aggregator(Fast=StubSource([AsicMiner("Antminer S21 200Th", 10.0)]), Slow=slow)
+
+    started = asyncio.get_running_loop().time()
+    assert names(await aggregator.get()) == ["Antminer S21 200Th"]
+    assert asyncio.get_running_loop().time() - started < 0.25  # Ответ не ждал медленный источник
+
+    # Загрузка продолжилась в фоне, и следующий запрос уже с ней, без повторного обращения
+    await aggregator.sources['Slow'].load()
+    assert names(await aggregator.get()) == ["Avalon A1466 150Th", "Antminer S21 200Th"]
+    assert slow.calls == 1
+
+
+async def test_failing_source_does_not_break_the_list():
+    aggregator = make_aggregator(Broken=StubSource(error=RuntimeError("HTTP 503")),
+                                 Empty=StubSource([]),
+                                 Working=StubSource([AsicMiner("Antminer S21 200Th", 10.0)]))
+    assert names(await aggregator.get()) == ["Antminer S21 200Th"]
+    assert aggregator.sources['Broken'].stats.last_error == "HTTP 503"
+    assert aggregator.sources['Empty'].stats.last_error == "нет данных"
+    assert aggregator.sources['Working'].stats.failures == 0
+
+
+async def test_all_sources_failing_gives_fallback_list():
+    aggregator = make_aggregator(Broken=StubSource(error=RuntimeError("HTTP 503")),
+                                 Slow=StubSource([AsicMiner("Antminer S21 200Th", 10.0)], delay=0.3))
+    miners = await aggregator.get()
+    assert names(miners) == [asic['name'] for asic in Config.FALLBACK_ASICS]
+    assert aggregator.as_of is None
+    await aggregator.sources['Slow'].load()
+
+
+async def test_merge_is_reused_until_a_snapshot_changes(monkeypatch):
+    aggregator = make_aggregator(Only=StubSource([AsicMiner("Antminer S21 200Th", 10.0)]))
+    merges = []
+    merge = mining_bot.merge_asic_miners
+
+    def counting_merge(all_miners):
+        merges.append(len(all_miners))
+        return merge(all_miners)
+
+    monkeypatch.setattr(mining_bot, 'merge_asic_miners', counting_merge)  # Пул потоков: подмена видна в воркере
+    first = await aggregator.get()
+    assert await aggregator.get() is first and merges == [1]
+
+    await aggregator.sources['Only'].load.refresh()
+    assert await aggregator.get() is not first and merges == [1, 1]
@@ -0,0 +1,164 @@
+"""История доходности ASIC: запись точек, свертка в средние за сутки, выборка диапазона и /trend."""
+import time
+from array import array
+
+import pytest
+from aiogram.filters import CommandObject
+
+import mining_bot
+from mining_bot import AsicMiner, ProfitabilityHistory, ProfitabilitySeries
+
+DAY = 86400
+HOUR = 3600
+START = 20000 * DAY  # Полночь UTC
+
+
+@pytest.fixture(autouse=True)
+def retention(monkeypatch):
+    monkeypatch.setattr(mining_bot.Config, 'ASIC_HISTORY_MIN_INTERVAL', 1800)
+    monkeypatch.setattr(mining_bot.Config, 'ASIC_HISTORY_RAW_RETENTION', 2 * DAY)
+    monkeypatch.setattr(mining_bot.Config, 'ASIC_HISTORY_RETENTION', 10 * DAY)
+
+
+def hourly_series(hours, start=START, value=lambda hour: float(hour)):
+    series = ProfitabilitySeries("Antminer S21")
+    for hour in range(hours):
+        series.append(start + hour * HOUR, value(hour))
+    return series
+
+
+def test_range_includes_both_boundaries():
+    series = hourly_series(5)
+    times, values = series.range(START + HOUR, START + 3 * HOUR)
+    assert list(times) == [START + HOUR, START + 2 * HOUR, START + 3 * HOUR]
+    assert list(values) == [1.0, 2.0, 3.0]
+    assert list(series.range(START + 4 * HOUR, START + 4 * HOUR)[0]) == [START + 4 * HOUR]
+
+
+@pytest.mark.parametrize('start, end', [
+    (START - 2 * HOUR, START - 1),  # До первой точки
+    (START + 5 * HOUR, START + 9 * HOUR),  # После последней
+    (START + 1, START + HOUR - 1),  # Между соседними точками
+    (START + 3 * HOUR, START + HOUR),  # Начало позже конца
+])
+def test_empty_ranges(start, end):
+    times, values = hourly_series(5).range(start, end)
+    assert isinstance(times, array) and len(times) == 0 and len(values) == 0
+
+
+def test_empty_series_range():
+    times, values = ProfitabilitySeries("Antminer S21").range(0, 2 ** 32 - 1)
+    assert len(times) == 0 and len(values) == 0
+
+
+def test_compact_folds_whole_days_into_averages():
+    series = hourly_series(4 * 24)  # Четверо суток по часу
+    now = START + 4 * DAY + 12 * HOUR  # Окно сырых точек начинается в START + 2.5 суток
+    series.compact(now)
+
+    # Свернуты только целые сутки до начала окна: 0-е и 1-е; 2-е сутки остаются сырыми целиком
+    assert list(series.daily_times) == [START, START + DAY]
+    assert list(series.daily_values) == [pytest.approx(11.5), pytest.approx(35.5)]
+    assert series.raw_times[0] == START + 2 * DAY and len(series.raw_times) == 2 * 24
+    assert len(series) == 2 + 2 * 24
+
+    # Повторная свертка в тот же момент ничего не меняет
+    series.compact(now)
+    assert list(series.daily_times) == [START, START + DAY] and len(series.raw_times) == 2 * 24
+
+    # Диапазон через обе ступени: средние за сутки, затем сырые точки
+    times, values = series.range(START + DAY, START + 2 * DAY)
+    assert list(times) == [START + DAY, START + 2 * DAY]
+    assert list(values) == [pytest.approx(35.5), 48.0]
+
+
+def test_compact_drops_expired_days():
+    series = hourly_series(2 * 24)
+    series.compact(START + 5 * DAY)
+    assert list(series.daily_times) == [START, START + DAY] and len(series.raw_times) == 0
+
+    series.compact(START + 10 * DAY + 1)  # Первые сутки вышли за ASIC_HISTORY_RETENTION
+    assert list(series.daily_times) == [START + DAY]
+    series.compact(START + 12 * DAY)
+    assert len(series) == 0
+
+
+def test_record_respects_interval_and_canonical_names(tmp_path):
+    history = ProfitabilityHistory(str(tmp_path / 'history.sqlite3'))
+    snapshot = [AsicMiner("Antminer S21 200Th", 10.0), AsicMiner("Whatsminer M66S", 7.0),
+                AsicMiner("200Th Antminer S21", 11.0)]  # То же название в другом порядке слов
+    changed = history.record(snapshot, now=START)
+    assert sorted(changed) == ['200th antminer s21', 'm66s whatsminer']
+    assert list(history.series['200th antminer s21'].raw_values) == [10.0]
+
+    assert history.record(snapshot, now=START + 1799) == []  # Раньше ASIC_HISTORY_MIN_INTERVAL
+    history.record([AsicMiner("antminer s21 200th", 12.0)], now=START + 1800)
+    series = history.find("Antminer S21 200Th")
+    assert list(series.raw_times) == [START, START + 1800] and list(series.raw_values) == [10.0, 12.0]
+    assert history.find("S21 200Th") is series
+    assert history.find("Avalon A1466") is None
+
+
+def test_daily_compaction_removes_stale_models(tmp_path):
+    history = ProfitabilityHistory(str(tmp_path / 'history.sqlite3'))
+    history.record([AsicMiner("Old", 1.0), AsicMiner("New", 2.0)], now=START)
+    # Спустя 11 суток "Old" больше нет в источниках, а его средние устарели
+    history.record([AsicMiner("New", 3.0)], now=START + 3 * DAY)
+    changed = history.record([AsicMiner("New", 4.0)], now=START + 11 * DAY)
+    assert 'old' in changed and 'old' not in history.series
+    assert list(history.series['new'].raw_values) == [4.0]
+
+
+async def test_history_survives_restart(tmp_path):
+    path = str(tmp_path / 'history.sqlite3')
+    history = ProfitabilityHistory(path)
+    history.open()
+    for hour in range(3):
+        await history.save(history.record([AsicMiner("Antminer S21", 10.0 + hour)], now=START + hour * HOUR))
+    history.close()
+
+    restarted = ProfitabilityHistory(path)
+    restarted.open()
+    series = restarted.find("Antminer S21")
+    assert series.name == "Antminer S21"
+    assert list(series.raw_times) == [START, START + HOUR, START + 2 * HOUR]
+    assert list(series.raw_values) == [10.0, 11.0, 12.0]
+    assert restarted.last_recorded == START + 2 * HOUR
+    assert restarted.record([AsicMiner("Antminer S21", 1.0)], now=START + 2 * HOUR + 60) == []
+    restarted.close()
+
+
+class FakeMessage:
+    def __init__(self):
+        self.answers = []
+        self.photos = []
+
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+
+    async def answer_photo(self, photo, caption=None, **kwargs):
+        self.photos.append((photo, caption))
+
+
+async def trend(args):
+    message = FakeMessage()
+    await mining_bot.handle_trend_command(message, CommandObject(prefix='/', command='trend', args=args))
+    return message
+
+
+async def test_trend_command(tmp_path, monkeypatch):
+    history = ProfitabilityHistory(str(tmp_path / 'history.sqlite3'))
+    monkeypatch.setattr(mining_bot, 'asic_history', history)
+    now = int(time.time())
+    history.record([AsicMiner("Antminer S21 200Th", 10.0)], now=now - 3 * DAY)
+    history.record([AsicMiner("Antminer S21 200Th", 12.5)], now=now - HOUR)
+
+    assert "Укажите модель" in (await trend(None)).answers[0]
+    assert "Нет истории" in (await trend("Avalon A1466")).answers[0]
+    # За последние сутки только одна точка
+    assert "недостаточно данных" in (await trend("S21 200Th 1")).answers[0]
+
+    message = await trend("S21 200Th 7")
+    [(photo, caption)] = message.photos
+    assert photo.data.startswith(b'\x89PNG')
+    assert "за 7 дн." in caption and "$12.50/день (+2.50)" in caption
@@ -0,0 +1,137 @@
+import json
+import random
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+from fuzzywuzzy import fuzz, process
+
+from mining_bot import (
+    AsicDeduplicator, AsicMiner, asic_block_key, merge_asic_miners, parse_asicminervalue_html, parse_whattomine_json,
+)
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+
+
+def reference_merge(all_miners, blocked=True):
+    """Слияние через process.extractOne по всем уже принятым майнерам (blocked=False - прежний алгоритм)
+    или только по майнерам с тем же asic_block_key."""
+    final_miners = {}
+    for miner in sorted(all_miners, key=lambda m: m.name):
+        choices = [name for name in final_miners
+                   if not blocked or asic_block_key(name) == asic_block_key(miner.name)]
+        best_match_key, score = process.extractOne(miner.name, choices, scorer=fuzz.token_set_ratio) \
+            if choices else (None, 0)
+        if score > 90 and best_match_key:
+            existing_miner = final_miners[best_match_key]
+            if miner.profitability > existing_miner.profitability:
+                existing_miner.profitability = miner.profitability
+            existing_miner.algorithm = existing_miner.algorithm or miner.algorithm
+            existing_miner.hashrate = existing_miner.hashrate or miner.hashrate
+            existing_miner.power = existing_miner.power or miner.power
+        else:
+            final_miners[miner.name] = replace(miner)
+    return sorted(final_miners.values(), key=lambda m: m.profitability, reverse=True)
+
+
+def as_rows(miners):
+    return [(m.name, m.profitability, m.algorithm, m.hashrate, m.power, m.source) for m in miners]
+
+
+VENDORS = [('Bitmain Antminer', 'Antminer'), ('MicroBT Whatsminer', 'Whatsminer'), ('Canaan Avalon', 'Avalon'),
+           ('Goldshell', 'Goldshell'), ('Iceriver', 'IceRiver'), ('Jasminer', 'Jasminer')]
+SERIES = ['S', 'T', 'L', 'K', 'KS', 'M', 'A', 'E', 'D', 'X']
+SUFFIXES = ['', ' Pro', ' XP', ' Hyd', '+', '++', ' Pro+', ' Mini', 'j Pro', 'k Pro']
+
+
+def synthetic_miners(seed, count=40):
+    """Модели двух источников: одни и те же в разном написании, с опечатками и без пары."""
+    rnd = random.Random(seed)
+    miners = []
+    for _ in range(count):
+        vendor, short_vendor = rnd.choice(VENDORS)
+        model = f"{rnd.choice(SERIES)}{rnd.randint(1, 70)}{rnd.choice(SUFFIXES)}"
+        hashrate = f"{rnd.choice([9.5, 16, 104, 120, 140, 186, 200, 234, 298, 335])}{rnd.choice(['Th', 'Gh'])}"
+        name = f"{vendor} {model} ({hashrate})"
+        miners.append(AsicMiner(name, round(rnd.uniform(0.1, 30), 2), power=rnd.randint(100, 6000), source='AsicMinerValue'))
+        if rnd.random() < 0.6:
+            other = f"{short_vendor} {model} {hashrate}"
+            if rnd.random() < 0.3:
+                other = other.lower()
+            if rnd.random() < 0.2:
+                i = rnd.randrange(len(other))
+                other = other[:i] + other[i + 1:]
+            miners.append(AsicMiner(other, round(rnd.uniform(0.1, 30), 2), algorithm='SHA-256',
+                                    hashrate=hashrate, source='WhatToMine'))
+    return miners
+
+
+@pytest.fixture(scope='module')
+def fixture_miners():
+    amv = parse_asicminervalue_html((FIXTURES / 'asicminervalue.html').read_text(encoding='utf-8'))
+    wtm = parse_whattomine_json(json.loads((FIXTURES / 'whattomine.json').read_text(encoding='utf-8')))
+    return amv, wtm
+
+
+def test_fixtures_parse(fixture_miners):
+    amv, wtm = fixture_miners
+    assert len(amv) == 35
+    assert len(wtm) == 24  # Без неактивных и без нулевой доходности
+    assert amv[0].name == "Bitmain Antminer S21 XP Hyd (473Th)" and amv[0].power == 5676
+
+
+def test_merge_matches_extract_one_on_fixtures(fixture_miners):
+    amv, wtm = fixture_miners
+    merged = merge_asic_miners(amv + wtm)
+
+    assert as_rows(merged) == as_rows(reference_merge(amv + wtm))
+    assert len(merged) < len(amv) + len(wtm)
+    names = {m.name for m in merged}
+    assert "Antminer S21 200Th" in names and "Bitmain Antminer S21 (200Th)" not in names
+    assert "Antminer Z15 Pro 840ksol" in names
+    # Похожие названия разных устройств: глобальный extractOne сливал их
+    assert {"Antminer L9 16Gh", "Bitmain Antminer L9 (17Gh)"} <= names
+    assert {"Avalon Miner A1466 150Th", "Canaan Avalon A1566 (185Th)"} <= names
+    assert {"Antminer S19 Pro 110Th", "Antminer S19K Pro 120Th"} <= names
+    assert {"Antminer S21 XP Hydro 473Th", "Bitmain Antminer S21+ Hyd (319Th)"} <= names
+
+
+@pytest.mark.parametrize('name, key', [
+    ("Bitmain Antminer S21 XP Hyd (473Th)", ('bitmain', 's21', '4.73e+14h')),
+    ("Antminer S21 XP Hydro 473Th", ('bitmain', 's21', '4.73e+14h')),
+    ("MicroBT Whatsminer M66S (298 TH/s)", ('microbt', 'm66', '2.98e+14h')),
+    ("Bitmain Antminer L9 (16Gh)", ('bitmain', 'l9', '1.6e+10h')),
+    ("Antminer L9 16000Mh", ('bitmain', 'l9', '1.6e+10h')),
+    ("Goldshell KA-BOX Pro 1,6Th", ('goldshell', '', '1.6e+12h')),
+    ("Antminer Z15 Pro 840ksol", ('bitmain', 'z15', '8.4e+05sol')),
+    ("Volcminer D1", ('volcminer', 'd1', '')),
+    ("", ('', '', '')),
+])
+def test_block_key(name, key):
+    assert asic_block_key(name) == key
+
+
+def test_merge_does_not_modify_source_snapshots(fixture_miners):
+    amv, wtm = fixture_miners
+    before = as_rows(amv + wtm)
+    merge_asic_miners(amv + wtm)
+    assert as_rows(amv + wtm) == before
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_merge_matches_extract_one_on_random_names(seed):
+    miners = synthetic_miners(seed)
+    assert as_rows(merge_asic_miners(miners)) == as_rows(reference_merge(miners))
+
+
+def test_comparisons_grow_linearly():
+    """Пары кандидатов считаются только внутри блоков: вдвое больше майнеров - примерно вдвое больше сравнений."""
+    comparisons = {}
+    for count in (2000, 4000):
+        dedup = AsicDeduplicator()
+        for miner in sorted(synthetic_miners(seed=1, count=count), key=lambda m: m.name):
+            if dedup.find(miner.name) is None:
+                dedup.add(miner.name)
+        comparisons[count] = dedup.comparisons
+    assert comparisons[2000] <= 2 * 2000 and comparisons[4000] <= 2 * 4000
+    assert comparisons[4000] < 3 * comparisons[2000]  # При сравнении со всеми было бы около 4x
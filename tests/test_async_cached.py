@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from cachetools import TTLCache
+
+import mining_bot
+from mining_bot import async_cached
+
+
+class Upstream:
+    """Источник-заглушка: считает вызовы и отвечает с задержкой."""
+
+    def __init__(self, result=None, delay=0.05, error=None):
+        self.calls = 0
+        self.result = result
+        self.delay = delay
+        self.error = error
+
+    async def fetch(self, key='k'):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.result if self.result is not None else f"value:{key}:{self.calls}"
+
+
+async def test_concurrent_misses_make_one_upstream_call():
+    upstream = Upstream()
+    cached = async_cached(TTLCache(maxsize=10, ttl=60))(upstream.fetch)
+
+    results = await asyncio.gather(*(cached('btc') for _ in range(50)))
+
+    assert upstream.calls == 1
+    assert set(results) == {"value:btc:1"}
+    assert await cached('btc') == "value:btc:1"
+    assert upstream.calls == 1
+
+
+async def test_concurrent_misses_are_coalesced_per_key():
+    upstream = Upstream()
+    cached = async_cached(TTLCache(maxsize=10, ttl=60))(upstream.fetch)
+
+    await asyncio.gather(*(cached(key) for key in ['btc', 'eth', 'ltc'] * 20))
+
+    assert upstream.calls == 3
+
+
+async def test_error_reaches_every_waiter_and_is_not_cached():
+    upstream = Upstream(error=RuntimeError("upstream down"))
+    cached = async_cached(TTLCache(maxsize=10, ttl=60))(upstream.fetch)
+
+    results = await asyncio.gather(*(cached() for _ in range(20)), return_exceptions=True)
+
+    assert upstream.calls == 1
+    assert all(isinstance(r, RuntimeError) and str(r) == "upstream down" for r in results)
+
+    upstream.error = None
+    assert await cached() == "value:k:2"
+    assert upstream.calls == 2
+
+
+@pytest.mark.parametrize("failed", [None, [], {}])
+async def test_failed_result_is_not_cached(failed):
+    calls = 0
+
+    async def flaky():
+        nonlocal calls
+        calls += 1
+        return failed if calls == 1 else ["ok"]
+
+    cached = async_cached(TTLCache(maxsize=10, ttl=60))(flaky)
+
+    assert await cached() == failed
+    assert await cached() == ["ok"]
+    assert await cached() == ["ok"]
+    assert calls == 2
+
+
+async def test_cancelled_caller_does_not_cancel_shared_fetch():
+    upstream = Upstream(delay=0.1)
+    cached = async_cached(TTLCache(maxsize=10, ttl=60))(upstream.fetch)
+
+    first = asyncio.ensure_future(cached())
+    second = asyncio.ensure_future(cached())
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == "value:k:1"
+    assert upstream.calls == 1
+
+
+async def test_stale_entry_is_served_while_one_refresh_runs(monkeypatch):
+    upstream = Upstream(delay=0.05)
+    cached = async_cached(TTLCache(maxsize=10, ttl=60), refresh_after=10)(upstream.fetch)
+    assert await cached() == "value:k:1"
+
+    # Запись «постарела» на 20 с: отдается сразу, обновление идет одно на всех
+    now = mining_bot.time.time()
+    monkeypatch.setattr(mining_bot.time, "time", lambda: now + 20)
+    results = await asyncio.gather(*(cached() for _ in range(20)))
+    assert set(results) == {"value:k:1"}
+
+    await asyncio.sleep(0.1)
+    assert upstream.calls == 2
+    assert await cached() == "value:k:2"
+
+
+async def test_failed_refresh_keeps_last_good_value():
+    upstream = Upstream()
+    cached = async_cached(TTLCache(maxsize=10, ttl=60), refresh_after=10)(upstream.fetch)
+    assert await cached() == "value:k:1"
+
+    upstream.error = RuntimeError("down")
+    with pytest.raises(RuntimeError):
+        await cached.refresh()
+    upstream.error, upstream.result = None, []
+    assert await cached.refresh() == "value:k:1"
+    assert await cached() == "value:k:1"
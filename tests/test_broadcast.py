@@ -0,0 +1,99 @@
+"""Рассылка через заглушку Bot API: миграция групп, флуд-лимит, заблокировавшие бота чаты."""
+import pytest
+from aiogram.exceptions import TelegramForbiddenError, TelegramMigrateToChat, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+import mining_bot
+from mining_bot import Broadcaster, BroadcastStore
+
+METHOD = SendMessage(chat_id=0, text='')
+
+
+class FakeBot:
+    """send_message отвечает ошибками из script[chat_id] по очереди, затем успехом."""
+
+    def __init__(self, script=None):
+        self.script = script or {}
+        self.delivered = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        errors = self.script.get(chat_id)
+        if errors:
+            raise errors.pop(0)
+        self.delivered.append(chat_id)
+
+
+@pytest.fixture(autouse=True)
+def fast_limits(monkeypatch):
+    monkeypatch.setattr(mining_bot.Config, 'BROADCAST_GLOBAL_RATE', 10_000)
+    monkeypatch.setattr(mining_bot.Config, 'BROADCAST_GLOBAL_BURST', 10_000)
+    monkeypatch.setattr(mining_bot.Config, 'BROADCAST_GROUP_RATE', (10_000, 100))
+    monkeypatch.setattr(mining_bot.Config, 'BROADCAST_PRIVATE_RATE', (10_000, 100))
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = BroadcastStore(str(tmp_path / 'broadcast.sqlite3'))
+    store.open()
+    yield store
+    store.close()
+
+
+def subscribers(store):
+    return sorted(row[0] for row in store._db.execute("SELECT chat_id FROM subscribers"))
+
+
+async def test_migrated_group_is_recorded_under_its_new_id(store):
+    for chat_id in (-100, 1, 2):
+        store.add_subscriber(chat_id)
+    bot = FakeBot({-100: [TelegramMigrateToChat(METHOD, 'migrated', migrate_to_chat_id=-100500)]})
+    broadcaster = Broadcaster(bot, store)
+    broadcast_id = store.create_broadcast('новость')
+
+    stats = await broadcaster._run(broadcast_id, 'новость')
+
+    assert stats.sent == 3 and stats.failed == 0
+    assert sorted(bot.delivered) == [-100500, 1, 2]
+    assert subscribers(store) == [-100500, 1, 2]
+
+
+async def test_migration_mid_broadcast_is_checkpointed(store, monkeypatch):
+    monkeypatch.setattr(mining_bot.Config, 'BROADCAST_CHECKPOINT_EVERY', 1)
+    store.add_subscriber(-100)
+    bot = FakeBot({-100: [TelegramMigrateToChat(METHOD, 'migrated', migrate_to_chat_id=-100500)]})
+    broadcast_id = store.create_broadcast('новость')
+    marked = []
+    mark_delivered = store.mark_delivered
+    monkeypatch.setattr(store, 'mark_delivered', lambda b, chats: (marked.extend(chats), mark_delivered(b, chats)))
+
+    await Broadcaster(bot, store)._run(broadcast_id, 'новость')
+    assert marked == [-100500]
+
+
+async def test_retry_after_is_capped(store, monkeypatch):
+    monkeypatch.setattr(mining_bot.Config, 'BROADCAST_MAX_RETRY_AFTER', 3)
+    store.add_subscriber(1)
+    flood = [TelegramRetryAfter(METHOD, 'flood', retry_after=0) for _ in range(100)]
+    bot = FakeBot({1: flood})
+    broadcast_id = store.create_broadcast('новость')
+
+    stats = await Broadcaster(bot, store)._run(broadcast_id, 'новость')
+
+    assert stats.sent == 0 and stats.failed == 1 and stats.retries == 3
+    assert len(flood) == 100 - 4
+    assert subscribers(store) == [1]
+
+
+async def test_retry_after_then_success_and_blocked_chat_removed(store):
+    store.add_subscriber(1)
+    store.add_subscriber(2)
+    bot = FakeBot({1: [TelegramRetryAfter(METHOD, 'flood', retry_after=0)],
+                   2: [TelegramForbiddenError(METHOD, 'bot was blocked by the user')]})
+    broadcaster = Broadcaster(bot, store)
+
+    stats = await broadcaster._run(store.create_broadcast('новость'), 'новость')
+
+    assert bot.delivered == [1]
+    assert stats.sent == 1 and stats.removed == 1 and stats.retries == 1
+    assert subscribers(store) == [1]
+    assert await broadcaster.send(1, 'оповещение') is True
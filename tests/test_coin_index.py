@@ -0,0 +1,53 @@
+"""Строгое разрешение обычных сообщений чата: слова-монеты из полного списка не считаются запросом курса."""
+import pytest
+
+import mining_bot
+from mining_bot import CoinIndex
+
+COINS = [
+    {'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin'},
+    {'id': 'ethereum', 'symbol': 'eth', 'name': 'Ethereum'},
+    {'id': 'the-open-network', 'symbol': 'ton', 'name': 'Toncoin'},
+    {'id': 'okcash', 'symbol': 'ok', 'name': 'OKCash'},
+    {'id': 'hi-dollar', 'symbol': 'hi', 'name': 'hi Dollar'},
+    {'id': 'lol-token', 'symbol': 'lol', 'name': 'LOL'},
+    {'id': 'cat-token', 'symbol': 'cat', 'name': 'Cat'},
+    {'id': 'dog-go-to-the-moon-rune', 'symbol': 'dog', 'name': 'Dog (Runes)'},
+    {'id': 'moon', 'symbol': 'moon', 'name': 'Moon'},
+]
+RANKS = {'bitcoin': 1, 'ethereum': 2, 'the-open-network': 12, 'dog-go-to-the-moon-rune': 180}
+
+
+@pytest.fixture
+def index(monkeypatch):
+    index = CoinIndex(COINS, RANKS)
+
+    async def get_coin_index():
+        return index
+
+    async def make_request(*args, **kwargs):
+        raise AssertionError("строгий режим не должен обращаться к сети")
+
+    monkeypatch.setattr(mining_bot, 'get_coin_index', get_coin_index)
+    monkeypatch.setattr(mining_bot, 'make_request', make_request)
+    return index
+
+
+@pytest.mark.parametrize('text', ['ok', 'hi', 'lol', 'cat', 'dog', 'moon', 'Moon', 'привет', 'btcc'])
+async def test_chat_words_are_not_price_queries(index, text):
+    assert await mining_bot.resolve_coin_id(text, strict=True) is None
+
+
+@pytest.mark.parametrize('text, coin_id', [
+    ('btc', 'bitcoin'), ('BTC', 'bitcoin'), ('Bitcoin', 'bitcoin'), ('ton', 'the-open-network'),
+    ('биткоин', 'bitcoin'), ('эфир', 'ethereum'),
+    ('$ok', 'okcash'), ('$DOG', 'dog-go-to-the-moon-rune'), (' $moon ', 'moon'),
+])
+async def test_ranked_coins_aliases_and_dollar_prefix_resolve(index, text, coin_id):
+    assert await mining_bot.resolve_coin_id(text, strict=True) == coin_id
+
+
+async def test_explicit_lookup_still_finds_any_coin(index):
+    # Ответ на "Введите тикер" и inline-режим ищут по всему списку
+    assert await mining_bot.resolve_coin_id('ok') == 'okcash'
+    assert index.resolve('lol', exact_only=True) == 'lol-token'
@@ -0,0 +1,144 @@
+"""Inline-режим: кандидаты из индекса, ответ из кэша без сети, debounce набора и cache_time частичных ответов."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import mining_bot
+from mining_bot import CoinIndex, InlineDebouncer, PriceBatcher, inline_coin_ids
+
+COINS = [
+    {'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin'},
+    {'id': 'bitcoin-cash', 'symbol': 'bch', 'name': 'Bitcoin Cash'},
+    {'id': 'ethereum', 'symbol': 'eth', 'name': 'Ethereum'},
+    {'id': 'ethereum-classic', 'symbol': 'etc', 'name': 'Ethereum Classic'},
+    {'id': 'the-open-network', 'symbol': 'ton', 'name': 'Toncoin'},
+]
+RANKS = {'bitcoin': 1, 'ethereum': 2, 'the-open-network': 12, 'bitcoin-cash': 15, 'ethereum-classic': 30}
+
+
+@pytest.fixture
+def index():
+    return CoinIndex(COINS, RANKS)
+
+
+class Markets:
+    """Заглушка /coins/markets: считает запросы, может задерживать ответ и терять монеты."""
+
+    def __init__(self):
+        self.calls = []
+        self.delay = 0.0
+        self.missing = set()
+
+    async def fetch(self, coin_ids):
+        self.calls.append(sorted(coin_ids))
+        await asyncio.sleep(self.delay)
+        return {coin_id: {'id': coin_id, 'symbol': coin_id[:3], 'name': coin_id.title(), 'current_price': 100.0,
+                          'price_change_percentage_24h': 1.5}
+                for coin_id in coin_ids if coin_id not in self.missing}
+
+
+@pytest.fixture
+def markets(index, monkeypatch):
+    markets = Markets()
+
+    async def get_coin_list():
+        return {}
+
+    monkeypatch.setattr(mining_bot, 'get_coin_index', SimpleNamespace(peek=lambda: index))
+    monkeypatch.setattr(mining_bot, 'fetch_coin_markets', markets.fetch)
+    monkeypatch.setattr(mining_bot, 'get_coin_list', get_coin_list)
+    monkeypatch.setattr(mining_bot, 'price_batcher', PriceBatcher(window=0.01))
+    monkeypatch.setattr(mining_bot, 'inline_debouncer', InlineDebouncer(delay=0.05))
+    monkeypatch.setattr(mining_bot.Config, 'INLINE_FETCH_DEADLINE', 0.2)
+    mining_bot.price_cache.clear()
+    yield markets
+    mining_bot.price_cache.clear()
+
+
+class FakeInlineQuery:
+    def __init__(self, query, query_id='1', user_id=7):
+        self.id = query_id
+        self.query = query
+        self.from_user = SimpleNamespace(id=user_id)
+        self.answers = []
+
+    async def answer(self, results, cache_time=None, **kwargs):
+        self.answers.append(([r.id for r in results], cache_time))
+
+
+async def ask(query, **kwargs):
+    inline_query = FakeInlineQuery(query, **kwargs)
+    await mining_bot.handle_inline_query(inline_query)
+    return inline_query.answers
+
+
+def test_inline_coin_ids(index):
+    assert inline_coin_ids(index, "") == ['bitcoin', 'ethereum', 'the-open-network']  # POPULAR_TICKERS из индекса
+    assert inline_coin_ids(index, "bit") == ['bitcoin', 'bitcoin-cash']
+    assert inline_coin_ids(index, "etc")[0] == 'ethereum-classic'  # Точное совпадение тикера первым
+    assert inline_coin_ids(index, "dogecoin") == []
+
+
+async def test_debouncer_keeps_only_latest_query():
+    debouncer = InlineDebouncer(delay=0.01)
+    debouncer.push(7, 'a')
+    debouncer.push(7, 'b')
+    debouncer.push(8, 'c')
+    assert await asyncio.gather(debouncer.settle(7, 'a'), debouncer.settle(7, 'b'), debouncer.settle(8, 'c')) == \
+        [False, True, True]
+
+
+async def test_index_not_loaded_answers_empty(markets, monkeypatch):
+    monkeypatch.setattr(mining_bot, 'get_coin_index', SimpleNamespace(peek=lambda: None))
+    assert await ask("btc") == [([], mining_bot.Config.INLINE_PARTIAL_CACHE_TIME)]
+    assert markets.calls == []
+
+
+async def test_cached_prices_are_answered_without_waiting(markets):
+    await asyncio.gather(mining_bot.get_coin_market('bitcoin'), mining_bot.get_coin_market('bitcoin-cash'))
+    markets.calls.clear()
+
+    started = asyncio.get_running_loop().time()
+    assert await ask("bit") == [(['bitcoin', 'bitcoin-cash'], mining_bot.Config.INLINE_CACHE_TIME)]
+    assert asyncio.get_running_loop().time() - started < 0.05  # Без паузы debounce
+    assert markets.calls == []
+
+
+async def test_unknown_query_answers_empty(markets):
+    assert await ask("dogecoin") == [([], mining_bot.Config.INLINE_CACHE_TIME)]
+    assert markets.calls == []
+
+
+async def test_blank_query_offers_popular_coins(markets):
+    assert await ask("   ") == [(['bitcoin', 'ethereum', 'the-open-network'], mining_bot.Config.INLINE_CACHE_TIME)]
+
+
+async def test_typing_is_coalesced_into_one_fetch(markets):
+    queries = [FakeInlineQuery(text, query_id=str(i)) for i, text in enumerate(["b", "bi", "bit"])]
+    tasks = []
+    for inline_query in queries:
+        tasks.append(asyncio.ensure_future(mining_bot.handle_inline_query(inline_query)))
+        await asyncio.sleep(0.01)  # Быстрее паузы debounce
+    await asyncio.gather(*tasks)
+
+    assert [q.answers for q in queries[:2]] == [[], []]
+    assert queries[2].answers == [(['bitcoin', 'bitcoin-cash'], mining_bot.Config.INLINE_CACHE_TIME)]
+    assert markets.calls == [['bitcoin', 'bitcoin-cash']]
+
+
+async def test_partial_results_are_cached_briefly(markets):
+    markets.missing = {'bitcoin-cash'}
+    assert await ask("bit") == [(['bitcoin'], mining_bot.Config.INLINE_PARTIAL_CACHE_TIME)]
+
+
+async def test_slow_prices_do_not_hold_the_answer(markets):
+    markets.delay = 0.5
+    started = asyncio.get_running_loop().time()
+    assert await ask("eth") == [([], mining_bot.Config.INLINE_PARTIAL_CACHE_TIME)]
+    assert asyncio.get_running_loop().time() - started < 0.4
+
+    # Загрузка продолжилась, и следующий запрос отвечает из кэша
+    await asyncio.sleep(0.4)
+    assert await ask("eth") == [(['ethereum', 'ethereum-classic'], mining_bot.Config.INLINE_CACHE_TIME)]
+    assert len(markets.calls) == 1
@@ -0,0 +1,60 @@
+"""Отложенный импорт: LazyModule загружает модуль при первом обращении к атрибуту."""
+import builtins
+import logging
+import sys
+
+import pytest
+
+import mining_bot
+from mining_bot import LazyModule, preload_modules
+
+
+@pytest.fixture
+def heavy_module(tmp_path, monkeypatch):
+    """Модуль, которого еще нет в sys.modules; считает, сколько раз его импортировали."""
+    (tmp_path / 'lazy_heavy_module.py').write_text(
+        "import builtins\n"
+        "builtins.lazy_heavy_imports = getattr(builtins, 'lazy_heavy_imports', 0) + 1\n"
+        "VALUE = 42\n"
+        "def double(x):\n"
+        "    return 2 * x\n",
+        encoding='utf-8')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr('builtins.lazy_heavy_imports', 0, raising=False)
+    yield 'lazy_heavy_module'
+    sys.modules.pop('lazy_heavy_module', None)
+
+
+def test_module_is_imported_on_first_attribute_access(heavy_module):
+    module = LazyModule(heavy_module)
+    assert heavy_module not in sys.modules and builtins.lazy_heavy_imports == 0
+
+    assert module.double(module.VALUE) == 84
+    assert heavy_module in sys.modules and builtins.lazy_heavy_imports == 1
+    # После загрузки атрибуты лежат в самом объекте, __getattr__ больше не вызывается
+    assert 'double' in vars(module) and module.double is sys.modules[heavy_module].double
+
+    assert LazyModule(heavy_module).VALUE == 42
+    assert builtins.lazy_heavy_imports == 1
+
+
+def test_already_imported_module_is_reused():
+    assert LazyModule('json').dumps is sys.modules['json'].dumps
+
+
+def test_missing_module_fails_on_access_not_on_creation(caplog):
+    module = LazyModule('no_such_module_for_lazy_tests')
+    with pytest.raises(ImportError):
+        module.anything
+
+    with caplog.at_level(logging.WARNING):
+        preload_modules(module, LazyModule('json'))
+    assert 'no_such_module_for_lazy_tests' in caplog.text
+
+
+def test_profiler_records_lazy_loads(heavy_module, monkeypatch):
+    monkeypatch.setattr(mining_bot.import_profiler, 'enabled', True)
+    monkeypatch.setattr(mining_bot.import_profiler, 'times', {})
+    preload_modules(LazyModule(heavy_module))
+    assert list(mining_bot.import_profiler.times) == [heavy_module]
+    assert 'lazy_heavy_module' in mining_bot.import_profiler.report()
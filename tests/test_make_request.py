@@ -0,0 +1,173 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import mining_bot
+from mining_bot import CircuitBreaker, HostPolicy, HostState, make_request
+
+POLICY = HostPolicy(timeout=0.2, retries=2, backoff_base=0.01, backoff_max=0.5,
+                    breaker_threshold=2, breaker_reset=0.3)
+
+
+class FlakyUpstream:
+    """Локальный сервер-заглушка: отвечает по сценарию и считает обращения."""
+
+    def __init__(self):
+        self.script = []
+        self.hits = 0
+        self.server = None
+
+    def respond(self, *responses):
+        self.script.extend(responses)
+
+    async def handle(self, request):
+        self.hits += 1
+        status, headers = self.script.pop(0) if self.script else (200, {})
+        if status == 'hang':
+            await asyncio.sleep(5)
+        return web.json_response({'hit': self.hits}, status=status, headers=headers)
+
+    @property
+    def url(self):
+        return str(self.server.make_url('/data'))
+
+
+@pytest.fixture
+async def upstream():
+    flaky = FlakyUpstream()
+    app = web.Application()
+    app.router.add_get('/data', flaky.handle)
+    flaky.server = TestServer(app, host='127.0.0.1')
+    await flaky.server.start_server()
+    mining_bot.host_states['127.0.0.1'] = HostState(POLICY)
+    mining_bot.create_http_session()
+    yield flaky
+    await mining_bot.close_http_session()
+    mining_bot.host_states.pop('127.0.0.1', None)
+    await flaky.server.close()
+
+
+def breaker():
+    return mining_bot.host_states['127.0.0.1'].breaker
+
+
+async def test_retries_5xx_until_success(upstream):
+    upstream.respond((503, {}), (500, {}))
+    assert await make_request(upstream.url) == {'hit': 3}
+    assert upstream.hits == 3
+    assert breaker().state == CircuitBreaker.CLOSED
+
+
+async def test_client_error_is_not_retried_and_keeps_breaker_closed(upstream):
+    upstream.respond((404, {}), (404, {}), (404, {}))
+    for _ in range(3):
+        assert await make_request(upstream.url) is None
+    assert upstream.hits == 3
+    assert breaker().state == CircuitBreaker.CLOSED
+
+
+async def test_short_retry_after_is_honored(upstream):
+    upstream.respond((429, {'Retry-After': '0.3'}))
+    started = time.monotonic()
+    assert await make_request(upstream.url) == {'hit': 2}
+    assert time.monotonic() - started >= 0.3
+
+
+async def test_long_retry_after_fails_fast_without_new_requests(upstream):
+    upstream.respond((429, {'Retry-After': '30'}))
+    assert await make_request(upstream.url) is None
+    assert await make_request(upstream.url) is None
+    assert upstream.hits == 1
+
+
+async def test_timeouts_are_retried_then_counted_as_failure(upstream):
+    upstream.respond(('hang', {}), ('hang', {}), ('hang', {}))
+    assert await make_request(upstream.url) is None
+    assert upstream.hits == 3
+    assert breaker().failures == 1
+
+
+async def test_breaker_opens_fails_fast_and_recovers_after_probe(upstream):
+    upstream.respond(*[(503, {})] * 6)
+    assert await make_request(upstream.url) is None
+    assert await make_request(upstream.url) is None
+    assert breaker().state == CircuitBreaker.OPEN
+    assert upstream.hits == 6
+
+    assert await make_request(upstream.url) is None
+    assert upstream.hits == 6
+
+    await asyncio.sleep(POLICY.breaker_reset)
+    assert await make_request(upstream.url) == {'hit': 7}
+    assert breaker().state == CircuitBreaker.CLOSED
+
+
+async def test_failed_probe_reopens_breaker(upstream):
+    upstream.respond(*[(503, {})] * 9)
+    await make_request(upstream.url)
+    await make_request(upstream.url)
+    await asyncio.sleep(POLICY.breaker_reset)
+
+    assert await make_request(upstream.url) is None
+    assert breaker().state == CircuitBreaker.OPEN
+    assert upstream.hits == 9
+    assert await make_request(upstream.url) is None
+    assert upstream.hits == 9
+
+
+async def test_probe_rejected_by_long_retry_after_does_not_stick_breaker(upstream):
+    upstream.respond(*[(503, {})] * 6, (429, {'Retry-After': '30'}))
+    await make_request(upstream.url)
+    await make_request(upstream.url)
+    await asyncio.sleep(POLICY.breaker_reset)
+
+    assert await make_request(upstream.url) is None
+    assert upstream.hits == 7
+    assert breaker().state != CircuitBreaker.HALF_OPEN
+
+    # Хост разрешил запросы снова: следующая проба доходит до него
+    mining_bot.host_states['127.0.0.1'].blocked_until = 0.0
+    assert await make_request(upstream.url) == {'hit': 8}
+    assert breaker().state == CircuitBreaker.CLOSED
+
+
+async def test_cancelled_probe_does_not_stick_breaker(upstream):
+    upstream.respond(*[(503, {})] * 6, ('hang', {}))
+    await make_request(upstream.url)
+    await make_request(upstream.url)
+    await asyncio.sleep(POLICY.breaker_reset)
+
+    probe = asyncio.ensure_future(make_request(upstream.url))
+    await asyncio.sleep(0.05)
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+
+    assert await make_request(upstream.url) == {'hit': 8}
+    assert breaker().state == CircuitBreaker.CLOSED
+
+
+def test_half_open_breaker_reprobes_after_reset_timeout(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(mining_bot.time, 'monotonic', lambda: now)
+    cb = CircuitBreaker(threshold=1, reset_timeout=10)
+    cb.record_failure()
+    assert not cb.allow()
+
+    now += 10
+    assert cb.allow()
+    assert not cb.allow()  # Проба уже идет
+
+    now += 10  # Проба зависла: через reset_timeout пропускается новая
+    assert cb.allow()
+
+
+async def test_rate_limit_spaces_requests(upstream):
+    mining_bot.host_states['127.0.0.1'] = HostState(HostPolicy(rate=20, burst=1, timeout=1))
+    started = time.monotonic()
+    await asyncio.gather(*(make_request(upstream.url) for _ in range(5)))
+    assert time.monotonic() - started >= 4 / 20 * 0.9
+    assert upstream.hits == 5
@@ -0,0 +1,114 @@
+"""Поток mempool.space против локального WebSocket-сервера-заглушки."""
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import mining_bot
+from mining_bot import MempoolFeed
+
+FEES = {'fastestFee': 20, 'halfHourFee': 15, 'hourFee': 10}
+
+
+class FakeMempool:
+    """Каждое подключение получает следующий список сообщений, после чего сервер закрывает сокет."""
+
+    def __init__(self):
+        self.sessions = []
+        self.connections = 0
+        self.server = None
+
+    async def handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        await ws.receive()  # init
+        await ws.receive()  # want
+        for message in self.sessions.pop(0) if self.sessions else []:
+            await ws.send_json(message)
+        await asyncio.sleep(0.05)
+        await ws.close()
+        return ws
+
+    @property
+    def url(self):
+        return str(self.server.make_url('/ws'))
+
+
+@pytest.fixture
+async def mempool(monkeypatch):
+    monkeypatch.setattr(mining_bot.Config, 'MEMPOOL_WS_BACKOFF_BASE', 0.01)
+    monkeypatch.setattr(mining_bot.Config, 'MEMPOOL_WS_BACKOFF_MAX', 0.05)
+    fake = FakeMempool()
+    app = web.Application()
+    app.router.add_get('/ws', fake.handle)
+    fake.server = TestServer(app, host='127.0.0.1')
+    await fake.server.start_server()
+    mining_bot.create_http_session()
+    yield fake
+    await mining_bot.close_http_session()
+    await fake.server.close()
+
+
+async def wait_for(predicate, timeout=3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "условие не выполнилось"
+        await asyncio.sleep(0.01)
+
+
+async def test_null_height_does_not_stop_the_feed(mempool):
+    mempool.sessions = [
+        [{'blocks': [{'height': 850000}, {'height': None}]}],
+        [{'block': {'height': 850001, 'timestamp': 1}, 'fees': FEES}],
+    ]
+    feed = MempoolFeed(mempool.url)
+    feed.start()
+    try:
+        await wait_for(lambda: feed.state.height == 850001)
+        assert feed.state.fees == FEES
+    finally:
+        await feed.close()
+
+
+async def test_unexpected_error_reconnects_with_backoff(mempool, monkeypatch):
+    mempool.sessions = [[{'fees': FEES}], [{'blocks': [{'height': 850000}]}]]
+    feed = MempoolFeed(mempool.url)
+    handle_message = feed.handle_message
+    failures = []
+
+    def fail_once(data, notify=True):
+        if not failures:
+            failures.append(data)
+            raise TypeError("неожиданный формат")
+        handle_message(data, notify)
+
+    monkeypatch.setattr(feed, 'handle_message', fail_once)
+    feed.start()
+    try:
+        await wait_for(lambda: feed.state.height == 850000)
+        assert mempool.connections >= 2
+        assert feed.reconnects >= 1
+        assert not feed._task.done()
+    finally:
+        await feed.close()
+
+
+async def test_http_fallback_does_not_feed_fee_subscribers(monkeypatch):
+    feed = MempoolFeed('ws://127.0.0.1:1/ws')
+    fee_updates = []
+    feed.on_fees.append(lambda state: fee_updates.append(state.fees['fastestFee']))
+
+    async def fetch_network_state_http():
+        return {'blocks': [{'height': 850000}], 'fees': FEES, 'mempoolInfo': {'size': 1000}}
+
+    monkeypatch.setattr(mining_bot, 'mempool_feed', feed)
+    monkeypatch.setattr(mining_bot, 'fetch_network_state_http', fetch_network_state_http)
+    for _ in range(5):
+        state = await mining_bot.get_network_state()
+    assert state.height == 850000 and state.fees == FEES and state.mempool_count == 1000
+    assert fee_updates == []
+
+    feed.handle_message({'fees': {**FEES, 'fastestFee': 25}})
+    assert fee_updates == [25]
@@ -0,0 +1,69 @@
+import mining_bot
+from mining_bot import MeteredLRUCache, MeteredTTLCache, cache_evictions, render_metrics
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def evictions(name, reason):
+    return cache_evictions.values.get((name, reason), 0)
+
+
+def test_metered_ttl_cache_counts_ttl_and_size_evictions():
+    timer = FakeTimer()
+    cache = MeteredTTLCache('test_ttl', maxsize=2, ttl=10, timer=timer)
+
+    cache['a'] = 1
+    cache['b'] = 2
+    assert len(cache) == 2 and cache['a'] == 1
+
+    cache['c'] = 3
+    assert 'b' not in cache or 'a' not in cache
+    assert evictions('test_ttl', 'size') == 1
+
+    timer.now = 11
+    assert len(cache) == 0
+    assert evictions('test_ttl', 'ttl') == 2
+
+
+def test_metered_lru_cache_counts_size_evictions():
+    cache = MeteredLRUCache('test_lru', maxsize=1)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert list(cache) == ['b']
+    assert evictions('test_lru', 'size') == 1
+
+
+async def test_async_cached_writes_into_metered_cache():
+    cache = MeteredTTLCache('test_async_cached', maxsize=10, ttl=60)
+
+    @mining_bot.async_cached(cache)
+    async def load(key):
+        return {'key': key}
+
+    assert await load('btc') == {'key': 'btc'}
+    assert await load('btc') == {'key': 'btc'}
+    assert len(cache) == 1
+
+    text = render_metrics()
+    assert 'mining_bot_cache_entries{cache="test_async_cached"} 1' in text
+    assert 'mining_bot_cache_requests_total{cache="test_async_cached",result="miss"} 1.0' in text
+    assert 'mining_bot_cache_requests_total{cache="test_async_cached",result="hit"} 1.0' in text
+
+
+def test_module_caches_accept_writes():
+    for cache in mining_bot.metered_caches:
+        cache['probe'] = mining_bot.CacheEntry(1, mining_bot.time.time())
+        assert len(cache) >= 1
+        del cache['probe']
+
+
+def test_label_values_are_escaped():
+    counter = mining_bot.Counter('mining_bot_test_escape_total', 'test', ('name',))
+    counter.inc('a"b\\c\nd')
+    assert 'mining_bot_test_escape_total{name="a\\"b\\\\c\\nd"} 1.0' in render_metrics()
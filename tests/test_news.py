@@ -0,0 +1,111 @@
+"""Сюжеты новостей: почти одинаковые заголовки из разных лент объединяются."""
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import mining_bot
+from mining_bot import Config, NewsDeduplicator, NewsIngester, cluster_news, news_title_signatures
+
+FEEDS = Config.NEWS_RSS_FEEDS
+
+
+def news(item_id, title, published, source=FEEDS[0]):
+    return {'id': item_id, 'title': title, 'link': f'https://example.com/{item_id}',
+            'published': published, 'source': source}
+
+
+def cluster(items, dedup=None):
+    dedup = dedup or NewsDeduplicator()
+    return cluster_news(items, news_title_signatures([item['title'] for item in items]), dedup)
+
+
+def test_same_story_from_several_feeds_is_one_cluster():
+    items = [
+        news('rbc-1', 'Биткоин обновил исторический максимум выше $120 000', 300, FEEDS[1]),
+        news('forklog-1', 'Биткоин обновил исторический максимум выше $120 000!', 200, FEEDS[0]),
+        news('bits-1', 'Курс биткоина обновил исторический максимум выше $120 000', 250, FEEDS[2]),
+        news('forklog-2', 'Ethereum Foundation продала 1000 ETH', 100, FEEDS[0]),
+    ]
+    stories = cluster(items)
+    assert len(stories) == 2
+    bitcoin = stories['forklog-1']
+    assert [item['id'] for item in bitcoin] == ['forklog-1', 'bits-1', 'rbc-1']
+    assert {item['story'] for item in bitcoin} == {'forklog-1'}
+    assert [item['id'] for item in stories['forklog-2']] == ['forklog-2']
+
+
+def test_unrelated_headlines_stay_apart():
+    items = [news(str(i), title, i) for i, title in enumerate([
+        'Биткоин подорожал на 5%', 'Майнеры продали рекордный объем BTC',
+        'SEC одобрила спотовый ETF на Solana', 'Хешрейт сети Bitcoin достиг нового рекорда',
+    ])]
+    assert len(cluster(items)) == 4
+
+
+def test_later_items_join_stories_already_in_the_index():
+    dedup = NewsDeduplicator()
+    cluster([news('a', 'Tether выпустил еще 1 млрд USDT', 100)], dedup)
+    stories = cluster([news('b', 'Tether выпустила еще 1 млрд USDT', 150, FEEDS[1])], dedup)
+    assert list(stories) == ['a']
+
+
+async def test_ingester_keeps_one_main_item_per_story(tmp_path, monkeypatch):
+    ingester = NewsIngester(FEEDS[:2], str(tmp_path / 'news.json'))
+    batches = {
+        FEEDS[0]: [news('f-1', 'Биткоин обновил исторический максимум выше $120 000', 200, FEEDS[0])],
+        FEEDS[1]: [news('r-1', 'Биткоин обновил исторический максимум выше $120 000!', 150, FEEDS[1]),
+                   news('r-2', 'Ethereum Foundation продала 1000 ETH', 100, FEEDS[1])],
+    }
+
+    async def fetch_feed(url):
+        return batches.pop(url, [])
+
+    monkeypatch.setattr(ingester, '_fetch_feed', fetch_feed)
+    new_items = await ingester.ingest()
+    assert sorted(item['id'] for item in new_items) == ['r-1', 'r-2']
+    assert [item['id'] for item in ingester.latest()] == ['r-1', 'r-2']
+    assert await ingester.ingest() == []
+
+
+RSS = """<?xml version="1.0"?><rss version="2.0"><channel><title>t</title>
+<item><title>Биткоин обновил максимум</title><link>https://example.com/1</link><guid>1</guid></item>
+</channel></rss>"""
+
+
+@pytest.fixture
+async def feed_server():
+    """Лента с ETag: отвечает 304 на If-None-Match с текущим ETag, иначе следующим телом из responses."""
+    server = type('FeedServer', (), {'responses': [], 'requests': [], 'etag': None})()
+
+    async def handle(request):
+        server.requests.append(request.headers.get('If-None-Match'))
+        if server.etag and request.headers.get('If-None-Match') == server.etag:
+            return web.Response(status=304)
+        body, server.etag = server.responses.pop(0)
+        return web.Response(text=body, content_type='application/rss+xml', headers={'ETag': server.etag})
+
+    app = web.Application()
+    app.router.add_get('/rss', handle)
+    server.http = TestServer(app, host='127.0.0.1')
+    await server.http.start_server()
+    server.url = str(server.http.make_url('/rss'))
+    mining_bot.create_http_session()
+    yield server
+    await mining_bot.close_http_session()
+    await server.http.close()
+
+
+async def test_validators_are_saved_only_after_successful_parse(tmp_path, feed_server):
+    ingester = NewsIngester([feed_server.url], str(tmp_path / 'news.json'))
+    feed_server.responses = [('<html>502 Bad Gateway', '"broken"'), (RSS, '"v1"')]
+
+    assert await ingester.ingest() == []
+    assert feed_server.url not in ingester.validators
+
+    new_items = await ingester.ingest()
+    assert [item['title'] for item in new_items] == ['Биткоин обновил максимум']
+    assert feed_server.requests == [None, None]
+    assert ingester.validators[feed_server.url]['etag'] == '"v1"'
+
+    assert await ingester.ingest() == []
+    assert feed_server.requests[-1] == '"v1"'
@@ -0,0 +1,104 @@
+"""Постоянный кэш в SQLite: отложенная запись, восстановление после перезапуска и ошибки записи."""
+import sqlite3
+import time
+
+import pytest
+from cachetools import TTLCache
+
+import mining_bot
+from mining_bot import CacheEntry, PersistentCache, async_cached
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'cache.sqlite3')
+
+
+def open_cache(path):
+    cache = PersistentCache(path)
+    cache.open()
+    return cache
+
+
+async def test_entries_survive_restart(cache_path):
+    cache = open_cache(cache_path)
+    cache.schedule_write('get_price', ('bitcoin',), CacheEntry({'usd': 100}, 1000.0, ('bitcoin',)))
+    cache.schedule_write('get_price', ('bitcoin',), CacheEntry({'usd': 101}, time.time(), ('bitcoin',)))
+    cache.schedule_write('get_news', (), CacheEntry(['новость'], time.time()))
+    await cache.close()
+
+    restarted = open_cache(cache_path)
+    [(key, entry)] = restarted.load('get_price')
+    assert key == ('bitcoin',) and entry.value == {'usd': 101} and entry.args == ('bitcoin',)
+    assert [entry.value for _, entry in restarted.load('get_news')] == [['новость']]
+    assert restarted.load('get_coin_list') == []
+    await restarted.close()
+
+
+async def test_old_entries_are_dropped_on_open(cache_path):
+    cache = open_cache(cache_path)
+    cache.schedule_write('get_price', ('old',), CacheEntry(1, time.time() - mining_bot.Config.PERSISTENT_CACHE_RETENTION - 1))
+    cache.schedule_write('get_price', ('new',), CacheEntry(2, time.time()))
+    await cache.close()
+
+    restarted = open_cache(cache_path)
+    assert [key for key, _ in restarted.load('get_price')] == [('new',)]
+    await restarted.close()
+
+
+async def test_failed_write_keeps_batch_for_next_flush(cache_path, monkeypatch):
+    cache = open_cache(cache_path)
+    write = cache._write
+    failures = []
+
+    def failing_write(batch):
+        failures.append(len(batch))
+        # Пока пакет пишется, в очередь попадает более новая запись того же ключа
+        cache.schedule_write('get_price', ('bitcoin',), CacheEntry('новая', time.time()))
+        raise sqlite3.OperationalError('database is locked')
+
+    cache.schedule_write('get_price', ('bitcoin',), CacheEntry('старая', time.time()))
+    cache.schedule_write('get_price', ('ethereum',), CacheEntry('eth', time.time()))
+    monkeypatch.setattr(cache, '_write', failing_write)
+    with pytest.raises(sqlite3.OperationalError):
+        await cache.flush()
+    assert failures == [2]
+    assert {key[1]: entry.value for key, entry in cache._pending.items()} == {('bitcoin',): 'новая', ('ethereum',): 'eth'}
+
+    monkeypatch.setattr(cache, '_write', write)
+    await cache.flush()
+    assert cache._pending == {}
+    assert sorted((key, entry.value) for key, entry in cache.load('get_price')) == [
+        (('bitcoin',), 'новая'), (('ethereum',), 'eth')]
+    await cache.close()
+
+
+async def test_cached_function_restores_from_disk(cache_path, monkeypatch):
+    monkeypatch.setattr(mining_bot, 'persisted_functions', [])
+    calls = []
+
+    def make_function():
+        @async_cached(TTLCache(maxsize=10, ttl=3600), refresh_after=60, persist=True)
+        async def get_price(coin_id):
+            calls.append(coin_id)
+            return {'usd': 100}
+        return get_price
+
+    monkeypatch.setattr(mining_bot, 'persistent_cache', open_cache(cache_path))
+    assert await make_function()('bitcoin') == {'usd': 100}
+    await mining_bot.close_persistent_cache()
+
+    # Перезапуск: новый процесс с пустым кэшем в памяти
+    restarted = open_cache(cache_path)
+    monkeypatch.setattr(mining_bot, 'persistent_cache', restarted)
+    monkeypatch.setattr(mining_bot, 'persisted_functions', [])
+    get_price = make_function()
+    namespace = get_price.cache_namespace
+    restarted.schedule_write(namespace, ('expired',), CacheEntry({'usd': 1}, time.time() - 7200))
+    await restarted.flush()
+
+    assert mining_bot.restore_persistent_caches() == 1
+    assert await get_price('bitcoin') == {'usd': 100}
+    assert calls == ['bitcoin']
+    assert get_price.peek('expired') is None
+    await mining_bot.close_persistent_cache()
@@ -0,0 +1,164 @@
+"""Ценовые оповещения: направление фиксируется при создании по цене, которую видел пользователь."""
+import pytest
+
+import mining_bot
+from mining_bot import AlertIndex, CryptoCoin, PriceAlertManager
+
+
+@pytest.fixture
+def market(monkeypatch):
+    prices = {}
+
+    async def fetch_coin_markets(coin_ids):
+        return {coin_id: {'id': coin_id, 'current_price': prices[coin_id]} for coin_id in coin_ids if coin_id in prices}
+
+    monkeypatch.setattr(mining_bot, 'fetch_coin_markets', fetch_coin_markets)
+    return prices
+
+
+@pytest.fixture
+def alerts(tmp_path):
+    manager = PriceAlertManager(str(tmp_path / 'alerts.sqlite3'))
+    manager.open()
+    yield manager
+    manager.close()
+
+
+def btc(price):
+    return CryptoCoin('bitcoin', 'BTC', 'Bitcoin', price)
+
+
+def stored_ids(manager):
+    return [row[0] for row in manager._read()]
+
+
+async def test_alert_below_current_price_ignores_stale_tick_price(alerts, market):
+    market['bitcoin'] = 100_000
+    await alerts.create(1, btc(100_000), 120_000)
+    assert await alerts.tick() == []
+
+    # Цена выросла между тиками; пользователь ждет падения до 105k
+    alert = await alerts.create(2, btc(110_000), 105_000)
+    assert alert.direction == -1
+    market['bitcoin'] = 108_000
+    assert await alerts.tick() == []
+
+    market['bitcoin'] = 104_000
+    assert [(a.id, price) for a, price in await alerts.tick()] == [(alert.id, 104_000)]
+
+
+async def test_both_directions_fire_once(alerts, market):
+    up = await alerts.create(1, btc(100_000), 101_000)
+    down = await alerts.create(1, btc(100_000), 99_000)
+    far = await alerts.create(1, btc(100_000), 150_000)
+
+    market['bitcoin'] = 102_000
+    assert [a.id for a, _ in await alerts.tick()] == [up.id]
+    market['bitcoin'] = 98_000
+    assert [a.id for a, _ in await alerts.tick()] == [down.id]
+    market['bitcoin'] = 102_000
+    assert await alerts.tick() == []
+    assert [a.id for a in alerts.chat_alerts(1)] == [far.id]
+
+
+async def test_crossing_during_restart_fires_on_first_tick(tmp_path, market):
+    path = str(tmp_path / 'alerts.sqlite3')
+    before = PriceAlertManager(path)
+    before.open()
+    alert = await before.create(1, btc(100_000), 105_000)
+    before.close()
+
+    after = PriceAlertManager(path)
+    after.open()
+    market['bitcoin'] = 106_000
+    assert [a.id for a, _ in await after.tick()] == [alert.id]
+    after.close()
+
+
+def test_index_pops_reached_thresholds_only():
+    index = AlertIndex()
+    for alert_id, (threshold, direction) in enumerate([(10, 1), (20, 1), (30, 1), (5, -1), (15, -1), (25, -1)]):
+        index.add(threshold, alert_id, direction)
+    assert sorted(index.pop_reached(20)) == [0, 1, 5]
+    index.remove(15, 4, -1)
+    assert index.pop_reached(20) == []
+    assert len(index) == 2
+
+
+async def test_fired_alert_stays_in_database_until_delivered(tmp_path, market):
+    path = str(tmp_path / 'alerts.sqlite3')
+    manager = PriceAlertManager(path)
+    manager.open()
+    alert = await manager.create(1, btc(100_000), 105_000)
+    market['bitcoin'] = 106_000
+    [(fired, _)] = await manager.tick()
+    assert await manager.tick() == []  # Пока доставляется, повторно не срабатывает
+
+    # Процесс упал до отправки уведомления: после перезапуска оповещение сработает снова
+    restarted = PriceAlertManager(path)
+    restarted.open()
+    assert [a.id for a, _ in await restarted.tick()] == [alert.id]
+    restarted.close()
+
+    await manager.finish(fired, delivered=True)
+    assert manager.delivering == {} and stored_ids(manager) == []
+    manager.close()
+
+
+async def test_undelivered_alert_fires_again(alerts, market):
+    alert = await alerts.create(1, btc(100_000), 105_000)
+    market['bitcoin'] = 106_000
+    [(fired, _)] = await alerts.tick()
+    assert alerts.chat_alerts(1) == []
+
+    await alerts.finish(fired, delivered=False)
+    assert [a.id for a in alerts.chat_alerts(1)] == [alert.id]
+    assert [a.id for a, _ in await alerts.tick()] == [alert.id]
+
+
+async def test_sync_does_not_reload_alert_being_delivered(alerts, market, monkeypatch):
+    monkeypatch.setattr(mining_bot.Config, 'SHARED_DATA_DIR', True)
+    alert = await alerts.create(1, btc(100_000), 105_000)
+    market['bitcoin'] = 106_000
+    assert len(await alerts.tick()) == 1
+
+    # Другая реплика меняет базу, и она перечитывается
+    other = PriceAlertManager(alerts.path)
+    other.open()
+    await other.create(2, btc(106_000), 90_000)
+    other.close()
+    await alerts.sync()
+    assert alert.id not in alerts.alerts and len(alerts.alerts) == 1
+    assert await alerts.tick() == []
+
+
+class StubBroadcaster:
+    def __init__(self, result):
+        self.result = result
+        self.sent = []
+
+    async def send(self, chat_id, text):
+        self.sent.append((chat_id, text))
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+@pytest.mark.parametrize('result, kept', [(True, False), (False, True), (RuntimeError('сеть'), True)])
+async def test_deliver_removes_alert_only_after_successful_send(alerts, market, monkeypatch, result, kept):
+    monkeypatch.setattr(mining_bot, 'price_alerts', alerts)
+    monkeypatch.setattr(mining_bot, 'broadcaster', StubBroadcaster(result))
+    alert = await alerts.create(7, btc(100_000), 105_000)
+    market['bitcoin'] = 106_000
+    [(fired, price)] = await alerts.tick()
+
+    if isinstance(result, Exception):
+        with pytest.raises(RuntimeError):
+            await mining_bot.deliver_price_alert(fired, price)
+    else:
+        await mining_bot.deliver_price_alert(fired, price)
+    [(chat_id, text)] = mining_bot.broadcaster.sent
+    assert chat_id == 7 and 'BTC' in text and '$106,000.00' in text
+    assert alerts.delivering == {}
+    assert ([a.id for a in alerts.chat_alerts(7)] == [alert.id]) is kept
+    assert (alert.id in stored_ids(alerts)) is kept
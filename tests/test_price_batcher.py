@@ -0,0 +1,49 @@
+"""Пакетные запросы цен: одна выборка на окно и фоновые задачи под учетом spawn_background."""
+import asyncio
+
+import pytest
+
+import mining_bot
+from mining_bot import PriceBatcher
+
+
+@pytest.fixture
+def markets(monkeypatch):
+    calls = []
+    gate = asyncio.Event()
+    gate.set()
+
+    async def fetch_coin_markets(coin_ids):
+        calls.append(sorted(coin_ids))
+        await gate.wait()
+        return {coin_id: {'id': coin_id} for coin_id in coin_ids}
+
+    monkeypatch.setattr(mining_bot, 'fetch_coin_markets', fetch_coin_markets)
+    return calls, gate
+
+
+async def test_concurrent_requests_share_one_call(markets):
+    calls, _ = markets
+    batcher = PriceBatcher(window=0.01, max_ids=10)
+    results = await asyncio.gather(*(batcher.get(coin_id) for coin_id in ['a', 'b', 'a', 'c']))
+    assert [r['id'] for r in results] == ['a', 'b', 'a', 'c']
+    assert calls == [['a', 'b', 'c']]
+    assert batcher.stats()['calls_saved'] == 3
+
+
+async def test_fetch_runs_as_tracked_background_task(markets):
+    calls, gate = markets
+    gate.clear()
+    batcher = PriceBatcher(window=0.01, max_ids=2)
+    waiters = [asyncio.ensure_future(batcher.get(coin_id)) for coin_id in ['a', 'b']]
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert calls == [['a', 'b']]
+    assert len(mining_bot.background_tasks) == 1
+
+    # Если выборку отменили, ожидающие получают отмену, а не висят вечно
+    for task in list(mining_bot.background_tasks):
+        task.cancel()
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+    assert not mining_bot.background_tasks
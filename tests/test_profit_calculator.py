@@ -0,0 +1,85 @@
+"""Калькулятор доходности: разбор тарифа и векторные расчеты против посчитанных вручную значений."""
+import numpy as np
+import pytest
+
+from mining_bot import AsicMiner, ProfitCalculator, TariffError, parse_tariff_range
+
+
+@pytest.mark.parametrize('text, tariffs', [
+    ("4.5", [4.5]),
+    ("4,5", [4.5]),
+    (" 7 ", [7.0]),
+    ("3-6", [3.0, 3.6, 4.2, 4.8, 5.4, 6.0]),
+    ("3,5 – 6", [3.5, 4.0, 4.5, 5.0, 5.5, 6.0]),
+    ("2..2,5", [2.0, 2.1, 2.2, 2.3, 2.4, 2.5]),
+    ("5-5", [5.0]),
+])
+def test_parse_tariff_range(text, tariffs):
+    np.testing.assert_allclose(parse_tariff_range(text), tariffs)
+
+
+@pytest.mark.parametrize('text, error', [
+    ("-5", "больше нуля"),
+    ("0", "больше нуля"),
+    ("0-3", "больше нуля"),
+    ("3--6", "больше нуля"),
+    ("6-3", "Начало диапазона больше конца"),
+    ("", "Неверный формат"),
+    ("пять", "Неверный формат"),
+    ("nan", "Неверный формат"),
+    ("inf", "Неверный формат"),
+    ("3-6-9", "Неверный формат"),
+    ("4.5 руб", "Неверный формат"),
+])
+def test_invalid_tariff_is_rejected_with_message(text, error):
+    with pytest.raises(TariffError, match=error):
+        parse_tariff_range(text)
+
+
+@pytest.fixture
+def calculator():
+    return ProfitCalculator([
+        AsicMiner("A", 10.0, power=1000, price=1000.0),  # 24 кВтч/день
+        AsicMiner("B", 5.0, power=500),  # 12 кВтч/день, цена неизвестна
+        AsicMiner("C", 8.0, power=2000, price=4000.0),  # 48 кВтч/день
+        AsicMiner("Без мощности", 50.0),
+    ])
+
+
+def test_miners_without_power_are_skipped(calculator):
+    assert [m.name for m in calculator.miners] == ["A", "B", "C"]
+    np.testing.assert_allclose(calculator.daily_kwh, [24, 12, 48])
+    np.testing.assert_allclose(calculator.break_even, [10 / 24, 5 / 12, 8 / 48])
+
+
+def test_net_profit_matrix(calculator):
+    np.testing.assert_allclose(calculator.net_profit(np.array([0.1, 0.5])), [
+        [10 - 2.4, 5 - 1.2, 8 - 4.8],
+        [10 - 12, 5 - 6, 8 - 24],
+    ])
+
+
+def test_top_by_net_profit_with_roi(calculator):
+    top = calculator.top(0.1)
+    assert [m.name for m, *_ in top] == ["A", "B", "C"]
+    miner, profit, break_even, roi = top[0]
+    assert profit == pytest.approx(7.6) and break_even == pytest.approx(10 / 24)
+    assert roi == pytest.approx(7.6 * 365 / 1000 * 100)  # 277.4 %/год
+    assert np.isnan(top[1][3])
+    assert top[2][3] == pytest.approx(3.2 * 365 / 4000 * 100)  # 29.2 %/год
+    assert [m.name for m, *_ in calculator.top(0.1, limit=1)] == ["A"]
+
+
+def test_best_by_tariff(calculator):
+    rows = calculator.best_by_tariff(np.array([0.1, 0.4, 0.5]))
+    assert [(m.name, round(profit, 6), profitable) for m, profit, profitable in rows] == [
+        ("A", 7.6, 3),
+        ("A", 0.4, 2),  # C при 0.4 $/кВтч уже в минусе: 8 - 19.2
+        ("B", -1.0, 0),  # Все убыточны, лучший - с наименьшим убытком
+    ]
+
+
+def test_empty_calculator():
+    calculator = ProfitCalculator([AsicMiner("Без мощности", 1.0)])
+    assert len(calculator) == 0
+    assert calculator.top(0.1) == [] and calculator.best_by_tariff(np.array([0.1])) == []
@@ -0,0 +1,114 @@
+"""Пул вопросов викторины против локальной заглушки клиента OpenAI."""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import mining_bot
+from mining_bot import QuizPool
+
+
+def question(n, text=None):
+    return {'question': text or f'Вопрос номер {n} про майнинг?',
+            'options': [f'{n}-a', f'{n}-b', f'{n}-c', f'{n}-d'], 'correct_option_index': n % 4}
+
+
+class StubOpenAI:
+    """Повторяет интерфейс AsyncOpenAI: client.chat.completions.create(...).choices[0].message.content."""
+
+    def __init__(self, batches=None):
+        self.batches = list(batches or [])
+        self.requests = []
+        self.next_number = 0
+        self.delay = 0.0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        await asyncio.sleep(self.delay)
+        if self.batches:
+            batch = self.batches.pop(0)
+            if isinstance(batch, Exception):
+                raise batch
+        else:
+            count = int(kwargs['messages'][0]['content'].split()[1])
+            batch = [question(self.next_number + i) for i in range(count)]
+            self.next_number += count
+        content = json.dumps({'questions': batch}, ensure_ascii=False)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+@pytest.fixture(autouse=True)
+def small_pool(monkeypatch):
+    monkeypatch.setattr(mining_bot.Config, 'QUIZ_POOL_TARGET', 6)
+    monkeypatch.setattr(mining_bot.Config, 'QUIZ_POOL_LOW_WATER', 3)
+    monkeypatch.setattr(mining_bot.Config, 'QUIZ_BATCH_SIZE', 3)
+
+
+def make_pool(tmp_path, client):
+    return QuizPool(str(tmp_path / 'quiz_pool.json'), lambda: client)
+
+
+async def test_refill_requests_batches_up_to_target(tmp_path):
+    client = StubOpenAI()
+    pool = make_pool(tmp_path, client)
+    await pool.refill()
+    assert len(client.requests) == 2
+    assert [q['question'] for q in pool.questions] == [f'Вопрос номер {n} про майнинг?' for n in range(6)]
+
+
+async def test_duplicates_and_invalid_questions_are_dropped(tmp_path):
+    bad = {'question': 'Без вариантов?', 'options': ['да', 'нет'], 'correct_option_index': 0}
+    client = StubOpenAI([
+        [question(1), question(2, 'Что такое халвинг?'), bad],
+        [question(3, 'Что такое ХАЛВИНГ!'), question(4), question(5)],
+        [question(6)],
+    ])
+    pool = make_pool(tmp_path, client)
+    await pool.refill()
+    texts = [q['question'] for q in pool.questions]
+    assert texts == ['Вопрос номер 1 про майнинг?', 'Что такое халвинг?', 'Вопрос номер 4 про майнинг?',
+                     'Вопрос номер 5 про майнинг?', 'Вопрос номер 6 про майнинг?', 'Вопрос номер 0 про майнинг?']
+    assert len(client.requests) == 4  # Последний запрос - за одним недостающим вопросом
+    # В следующий запрос уходят уже известные вопросы, чтобы модель их не повторяла
+    assert 'Что такое халвинг?' in client.requests[1]['messages'][0]['content']
+
+
+async def test_take_is_served_from_pool_and_refills_in_background(tmp_path):
+    client = StubOpenAI()
+    pool = make_pool(tmp_path, client)
+    await pool.refill()
+    client.delay = 0.2
+    requests_before = len(client.requests)
+
+    started = asyncio.get_running_loop().time()
+    taken = [await pool.take() for _ in range(4)]
+    assert asyncio.get_running_loop().time() - started < 0.1
+    assert [q['question'] for q in taken] == [f'Вопрос номер {n} про майнинг?' for n in range(4)]
+
+    await asyncio.gather(*mining_bot.background_tasks)
+    assert len(client.requests) == requests_before + 2
+    assert len(pool.questions) == 6
+
+
+async def test_pool_survives_restart(tmp_path):
+    pool = make_pool(tmp_path, StubOpenAI())
+    await pool.refill()
+    await pool.take()
+    await asyncio.gather(*mining_bot.background_tasks)
+
+    restarted = make_pool(tmp_path, StubOpenAI())
+    restarted.load()
+    assert [q['question'] for q in restarted.questions] == [q['question'] for q in pool.questions]
+    # Уже выданный вопрос 0 помнится и после перезапуска
+    restarted._add([question(0), question(7)])
+    assert restarted.questions[-1]['question'] == 'Вопрос номер 7 про майнинг?'
+    assert len(restarted.questions) == len(pool.questions) + 1
+
+
+async def test_api_error_leaves_empty_pool_without_crashing(tmp_path):
+    client = StubOpenAI([RuntimeError('rate limited')])
+    pool = make_pool(tmp_path, client)
+    assert await pool.take() is None
+    assert len(client.requests) == 1
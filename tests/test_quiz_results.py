@@ -0,0 +1,147 @@
+"""Результаты викторины: рейтинги с равными очками, смена недели и отложенная запись в SQLite."""
+import calendar
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import pytest
+from aiogram.filters import CommandObject
+
+import mining_bot
+from mining_bot import Leaderboard, QuizResults, week_start
+
+MONDAY = calendar.timegm((2026, 10, 19, 0, 0, 0))
+
+
+class Clock:
+    """Подменяет time в mining_bot: time() управляется тестом, остальное - настоящее."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(MONDAY + 3 * 86400)
+    monkeypatch.setattr(mining_bot, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+async def results(tmp_path, clock):
+    manager = QuizResults(str(tmp_path / 'quiz.sqlite3'))
+    manager.open()
+    yield manager
+    await manager.close()
+
+
+async def answer(results, poll_id, user_id, correct, chat_id=-100):
+    if poll_id not in results.polls:
+        await results.register_poll(poll_id, chat_id, 0)
+    return await results.record_answer(poll_id, user_id, f"user{user_id}", [0 if correct else 1])
+
+
+def test_week_start_is_monday_utc():
+    assert week_start(MONDAY) == MONDAY
+    assert week_start(MONDAY + 7 * 86400 - 1) == MONDAY
+    assert week_start(MONDAY - 1) == MONDAY - 7 * 86400
+
+
+def test_tied_scores_share_a_place():
+    board = Leaderboard()
+    for user_id, points in [(30, 2), (10, 2), (20, 2), (40, 3), (50, 0)]:
+        board.add(user_id, points)
+    assert [user_id for user_id, _, _ in board.top(10)] == [40, 10, 20, 30, 50]
+    assert [board.rank(user_id) for user_id in (40, 10, 20, 30, 50)] == [1, 2, 2, 2, 5]
+    assert board.rank(99) is None
+
+    board.add(30, 1)  # 30 выходит из ничьей и догоняет лидера
+    assert [board.rank(user_id) for user_id in (30, 40, 10, 20)] == [1, 1, 3, 3]
+    assert board.top(2) == [(30, 3, 2), (40, 3, 1)]
+
+    board.add(50, 0)  # Неправильный ответ не меняет место, но считается
+    assert board.rank(50) == 5 and board.answers[50] == 2
+
+
+async def test_week_board_rolls_over_on_monday(results, clock):
+    clock.now = MONDAY + 7 * 86400 - 60  # Воскресенье, 23:59 UTC
+    assert await answer(results, 'p1', 1, True)
+    assert results.leaderboard('week').top(10) == [(1, 1, 1)]
+
+    clock.now = MONDAY + 7 * 86400
+    assert len(results.leaderboard('week')) == 0  # Новая неделя, ответов еще не было
+    assert await answer(results, 'p2', 2, True) is True
+    assert results.leaderboard('week').top(10) == [(2, 1, 1)]
+    assert results.leaderboard('global').top(10) == [(1, 1, 1), (2, 1, 1)]
+    assert results.leaderboard('chat', -100).rank(2) == 1
+
+    # После перезапуска недельный рейтинг строится только по ответам этой недели
+    await results.flush()
+    restarted = QuizResults(results.path)
+    restarted.open()
+    assert restarted.leaderboard('week').top(10) == [(2, 1, 1)]
+    assert restarted.leaderboard('global').top(10) == [(1, 1, 1), (2, 1, 1)]
+    await restarted.close()
+
+
+async def test_pending_answers_are_flushed_on_shutdown(tmp_path, clock):
+    path = str(tmp_path / 'quiz.sqlite3')
+    results = QuizResults(path)
+    results.open()
+    results.start()
+    await answer(results, 'p1', 1, True)
+    await answer(results, 'p1', 2, False)
+    assert await answer(results, 'p1', 1, False) is None  # Повторный ответ не учитывается
+    assert len(results._pending) == 2
+    await results.close()
+
+    restarted = QuizResults(path)
+    restarted.open()
+    assert restarted.leaderboard('global').top(10) == [(1, 1, 1), (2, 0, 1)]
+    assert restarted.names == {1: 'user1', 2: 'user2'}
+    await restarted.close()
+
+
+async def test_failed_write_keeps_answers_for_next_flush(results, monkeypatch):
+    write = results._write
+
+    def failing_write(answers, names):
+        raise sqlite3.OperationalError('database is locked')
+
+    await answer(results, 'p1', 1, True)
+    monkeypatch.setattr(results, '_write', failing_write)
+    with pytest.raises(sqlite3.OperationalError):
+        await results.flush()
+    await answer(results, 'p1', 2, True)
+    assert [(row[0], row[1]) for row in results._pending] == [('p1', 1), ('p1', 2)]
+    assert results._pending_names == {1: 'user1', 2: 'user2'}
+
+    monkeypatch.setattr(results, '_write', write)
+    await results.flush()
+    assert results._pending == [] and results._pending_names == {}
+    _, rows, _, names = results._read()
+    assert sorted(rows) == [(-100, 1, 1, 1), (-100, 2, 1, 1)] and names == {1: 'user1', 2: 'user2'}
+
+
+async def test_top_command_shows_shared_places(results, monkeypatch):
+    monkeypatch.setattr(mining_bot, 'quiz_results', results)
+    monkeypatch.setattr(mining_bot.Config, 'QUIZ_TOP_COUNT', 2)
+    for user_id, correct in [(1, True), (2, True), (3, True), (4, False)]:
+        await answer(results, 'p1', user_id, correct)
+
+    answers = []
+
+    async def reply(text, **kwargs):
+        answers.append(text)
+
+    message = SimpleNamespace(chat=SimpleNamespace(id=-100, type='group'), from_user=SimpleNamespace(id=4), answer=reply)
+    await mining_bot.handle_top_command(message, CommandObject(prefix='/', command='top'))
+    lines = answers[0].splitlines()
+    assert lines[2:4] == ["🥇 user1: 1 из 1", "🥇 user2: 1 из 1"]
+    assert lines[-1] == "Ваше место: 4"
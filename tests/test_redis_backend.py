@@ -0,0 +1,174 @@
+"""Общий кэш и выбор лидера через RedisCacheBackend на локальной заглушке Redis (fakeredis)."""
+import asyncio
+import json
+import pickle
+import time
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from cachetools import TTLCache
+
+import mining_bot
+from mining_bot import (
+    AsicMiner, CacheBackend, CacheBackendError, CacheEntry, CryptoCoin, LeaderElector, MemoryCacheBackend,
+    RedisCacheBackend, async_cached,
+)
+
+
+@pytest.fixture
+async def redis_backend(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(mining_bot, 'aioredis', SimpleNamespace(
+        from_url=lambda url, **kwargs: fakeredis.aioredis.FakeRedis(server=server)))
+    monkeypatch.setattr(mining_bot.Config, 'SHARED_LOCK_POLL', 0.01)
+    backend = RedisCacheBackend('redis://stand-in')
+    monkeypatch.setattr(mining_bot, 'cache_backend', backend)
+    yield backend
+    await backend.close()
+
+
+class Upstream:
+    """Источник данных: считает обращения и отвечает с небольшой задержкой."""
+
+    def __init__(self):
+        self.calls = []
+        self.failing = False
+
+    async def fetch(self, coin_id):
+        self.calls.append(coin_id)
+        await asyncio.sleep(0.05)
+        if self.failing:
+            raise RuntimeError("источник недоступен")
+        return {'id': coin_id, 'price': 100}
+
+
+def make_replica(upstream):
+    """Реплика: свой TTLCache и своя функция, но то же имя, что и у других реплик (общее пространство ключей)."""
+    @async_cached(TTLCache(maxsize=16, ttl=60), shared=True)
+    async def get_price(coin_id):
+        return await upstream.fetch(coin_id)
+    return get_price
+
+
+@pytest.mark.parametrize('replicas', [1, 2, 4, 8])
+async def test_upstream_calls_stay_flat_as_replicas_are_added(redis_backend, replicas):
+    upstream = Upstream()
+    fleet = [make_replica(upstream) for _ in range(replicas)]
+    coins = ['bitcoin', 'ethereum', 'toncoin']
+
+    results = await asyncio.gather(*(get_price(coin) for get_price in fleet for coin in coins for _ in range(3)))
+    assert all(r['price'] == 100 for r in results)
+    assert sorted(upstream.calls) == sorted(coins)
+
+    # Новая реплика (перезапуск, масштабирование) берет данные из общего кэша
+    await asyncio.gather(*(make_replica(upstream)(coin) for coin in coins))
+    assert len(upstream.calls) == len(coins)
+
+
+async def test_failed_fetch_releases_lock_and_is_not_shared(redis_backend):
+    upstream = Upstream()
+    first, second = make_replica(upstream), make_replica(upstream)
+    upstream.failing = True
+    with pytest.raises(RuntimeError):
+        await first('bitcoin')
+
+    upstream.failing = False
+    assert (await second('bitcoin'))['price'] == 100
+    assert upstream.calls == ['bitcoin', 'bitcoin']
+
+
+async def test_exactly_one_leader_and_handover_on_stop(redis_backend):
+    elected = []
+    replicas = [LeaderElector('scheduler', owner=f'replica-{i}') for i in range(3)]
+    for replica in replicas:
+        replica.on_elected.append(lambda replica=replica: elected.append(replica.owner))
+        await replica.start()
+    assert [r.is_leader for r in replicas] == [True, False, False]
+
+    await replicas[0].stop()
+    for replica in replicas[1:]:
+        await replica._renew()
+    assert [r.is_leader for r in replicas] == [False, True, False]
+    assert elected == ['replica-0', 'replica-1']
+    for replica in replicas:
+        await replica.stop()
+
+
+async def test_lease_of_crashed_leader_expires(redis_backend, monkeypatch):
+    monkeypatch.setattr(mining_bot.Config, 'LEADER_LEASE_TTL', 0.2)
+    crashed, survivor = LeaderElector('scheduler', owner='crashed'), LeaderElector('scheduler', owner='survivor')
+    await crashed._renew()
+    await survivor._renew()
+    assert crashed.is_leader and not survivor.is_leader
+
+    # Упавшая реплика не продлевает и не отдает аренду
+    await asyncio.sleep(0.3)
+    assert not crashed.is_leader
+    await survivor._renew()
+    assert survivor.is_leader
+
+
+def test_cache_backend_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+    class Incomplete(CacheBackend):
+        async def get(self, namespace, key):
+            return None
+
+    with pytest.raises(TypeError, match='acquire_lease'):
+        Incomplete()
+    assert isinstance(MemoryCacheBackend(), CacheBackend)
+
+
+@pytest.mark.parametrize('value', [
+    [AsicMiner("Antminer S21 (200Th)", 12.5, 'SHA-256', '200Th', 3500, 'AsicMinerValue', None)],
+    CryptoCoin('bitcoin', 'BTC', 'Bitcoin', 100_000.5, 'SHA-256', -1.2),
+    {'data': [{'value': '71', 'value_classification': 'Greed'}]},
+    [{'id': 'x', 'title': 'Новость', 'published': None}],
+    97.25,
+])
+async def test_entries_are_stored_as_json(redis_backend, value):
+    entry = CacheEntry(value, time.time(), ('bitcoin', ('nested', 1)), {'vs': 'usd'})
+    await redis_backend.set('get_coin_market', ('bitcoin',), entry, ttl=60)
+
+    blob = await redis_backend._redis.get(redis_backend._key('cache', 'get_coin_market', ('bitcoin',)))
+    assert isinstance(json.loads(blob), dict)
+    restored = await redis_backend.get('get_coin_market', ('bitcoin',))
+    assert restored == entry and type(restored.value) is type(value)
+
+
+async def test_pickled_entries_are_not_loaded(redis_backend):
+    executed = []
+
+    class Payload:
+        def __reduce__(self):
+            return executed.append, ('выполнено',)
+
+    key = redis_backend._key('cache', 'get_coin_market', ('bitcoin',))
+    await redis_backend._redis.set(key, pickle.dumps(CacheEntry(Payload(), time.time())))
+    assert await redis_backend.get('get_coin_market', ('bitcoin',)) is None
+    assert executed == []
+
+    await redis_backend._redis.set(key, json.dumps({'value': {'__type__': 'Popen', 'fields': {}}, 'fetched_at': 0,
+                                                    'args': [], 'kwargs': {}}))
+    assert await redis_backend.get('get_coin_market', ('bitcoin',)) is None
+
+
+async def test_value_without_json_form_is_served_but_not_shared(redis_backend):
+    with pytest.raises(CacheBackendError):
+        await redis_backend.set('ns', ('k',), CacheEntry(object(), time.time()), ttl=60)
+
+    calls = []
+
+    def make_set_replica():
+        @async_cached(TTLCache(maxsize=4, ttl=60), shared=True)
+        async def get_labels(key):
+            calls.append(key)
+            return {'hot', 'new'}
+        return get_labels
+
+    assert await make_set_replica()('a') == {'hot', 'new'}
+    assert await make_set_replica()('a') == {'hot', 'new'}
+    assert calls == ['a', 'a']  # Множество не попадает в общий кэш, вторая реплика считает сама
@@ -0,0 +1,126 @@
+"""Две реплики с общим DATA_DIR: каждая открывает свои соединения к тем же файлам SQLite."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+import mining_bot
+from mining_bot import CryptoCoin, PriceAlertManager, QuizResults
+
+
+@pytest.fixture(autouse=True)
+def shared_data_dir(monkeypatch):
+    monkeypatch.setattr(mining_bot.Config, 'SHARED_DATA_DIR', True)
+
+
+@pytest.fixture
+def market(monkeypatch):
+    prices = {}
+
+    async def fetch_coin_markets(coin_ids):
+        return {coin_id: {'id': coin_id, 'current_price': prices[coin_id]} for coin_id in coin_ids if coin_id in prices}
+
+    monkeypatch.setattr(mining_bot, 'fetch_coin_markets', fetch_coin_markets)
+    return prices
+
+
+def btc(price):
+    return CryptoCoin('bitcoin', 'BTC', 'Bitcoin', price)
+
+
+@pytest.fixture
+def alert_replicas(tmp_path):
+    replicas = [PriceAlertManager(str(tmp_path / 'alerts.sqlite3')) for _ in range(2)]
+    for replica in replicas:
+        replica.open()
+    yield replicas
+    for replica in replicas:
+        replica.close()
+
+
+@pytest.fixture
+async def quiz_replicas(tmp_path):
+    replicas = [QuizResults(str(tmp_path / 'quiz.sqlite3')) for _ in range(2)]
+    for replica in replicas:
+        replica.open()
+    yield replicas
+    for replica in replicas:
+        await replica.close()
+
+
+async def test_leader_fires_alert_created_on_other_replica(alert_replicas, market):
+    leader, follower = alert_replicas
+    market['bitcoin'] = 100_000
+    assert await leader.tick() == []
+
+    alert = await follower.create(42, btc(100_000), 105_000)
+    market['bitcoin'] = 106_000
+    fired = await leader.tick()
+
+    assert [(a.id, a.chat_id, price) for a, price in fired] == [(alert.id, 42, 106_000)]
+    await leader.finish(fired[0][0], delivered=True)
+    await follower.sync()
+    assert follower.chat_alerts(42) == []
+
+
+async def test_alert_deleted_on_other_replica_does_not_fire(alert_replicas, market):
+    leader, follower = alert_replicas
+    market['bitcoin'] = 100_000
+    alert = await leader.create(42, btc(100_000), 105_000)
+    await leader.tick()
+
+    assert await follower.delete(42, alert.id)
+    market['bitcoin'] = 106_000
+    assert await leader.tick() == []
+
+
+async def test_per_chat_limit_counts_alerts_from_all_replicas(alert_replicas, monkeypatch):
+    monkeypatch.setattr(mining_bot.Config, 'ALERTS_PER_CHAT', 2)
+    first, second = alert_replicas
+    await first.create(42, btc(100_000), 105_000)
+    await second.create(42, btc(100_000), 110_000)
+    with pytest.raises(ValueError):
+        await first.create(42, btc(100_000), 120_000)
+
+
+async def test_poll_answer_on_other_replica_is_counted(quiz_replicas):
+    sender, receiver = quiz_replicas
+    await sender.register_poll('poll-1', -100, correct_option=2)
+
+    assert await receiver.record_answer('poll-1', 7, 'Alice', [2]) is True
+    assert await receiver.record_answer('poll-1', 7, 'Alice', [2]) is None
+    assert await receiver.record_answer('unknown', 7, 'Alice', [2]) is None
+
+    await receiver.sync()
+    await sender.sync()
+    assert sender.leaderboard('chat', -100).top(10) == [(7, 1, 1)]
+    assert sender.names[7] == 'Alice'
+
+
+async def test_sync_keeps_answers_accepted_during_reload(quiz_replicas):
+    first, second = quiz_replicas
+    await first.register_poll('poll-1', -100, correct_option=0)
+    await second.record_answer('poll-1', 1, 'Bob', [0])
+    await second.flush()
+
+    read = first._read_if_changed
+
+    def read_while_answer_arrives():
+        state = read()
+        # Ответ, принятый, пока база читалась в потоке: в прочитанном его еще нет
+        first._pending.append(('poll-1', 2, -100, 1, mining_bot.time.time()))
+        return state
+
+    first._read_if_changed = read_while_answer_arrives
+    await first.sync()
+    assert sorted(first.leaderboard('global').top(10)) == [(1, 1, 1), (2, 1, 1)]
+
+
+def test_multi_replica_mode_requires_shared_data_dir():
+    env = dict(os.environ, REDIS_URL='redis://localhost:6379/0')
+    env.pop('SHARED_DATA_DIR', None)
+    result = subprocess.run([sys.executable, '-c', 'import mining_bot; print("started")'],
+                            cwd=os.path.dirname(mining_bot.__file__), env=env, capture_output=True, text=True, timeout=60)
+    assert 'started' not in result.stdout
+    assert 'SHARED_DATA_DIR=1' in result.stderr
@@ -0,0 +1,101 @@
+"""Вебхук: POST обновлений в формате Bot API во встроенный веб-сервер."""
+import asyncio
+import json
+import os
+
+import pytest
+from aiogram import Dispatcher, F
+from aiogram.types import CallbackQuery, Message
+from aiohttp.test_utils import TestClient, TestServer
+
+import mining_bot
+from mining_bot import WebhookServer
+
+SECRET = 'test-secret'
+HEADERS = {'X-Telegram-Bot-Api-Secret-Token': SECRET}
+
+with open(os.path.join(os.path.dirname(__file__), 'fixtures', 'telegram_updates.json'), encoding='utf-8') as f:
+    UPDATES = json.load(f)
+
+
+class Recorder:
+    """Обработчики-заглушки: запоминают, что пришло, и по желанию работают медленно."""
+
+    def __init__(self):
+        self.dispatcher = Dispatcher()
+        self.handled = []
+        self.delay = 0.0
+        self.dispatcher.message.register(self.on_message)
+        self.dispatcher.callback_query.register(self.on_callback, F.data)
+
+    async def on_message(self, message: Message):
+        await asyncio.sleep(self.delay)
+        self.handled.append(('message', message.chat.id, message.text))
+
+    async def on_callback(self, query: CallbackQuery):
+        await asyncio.sleep(self.delay)
+        self.handled.append(('callback', query.message.chat.id, query.data))
+
+
+@pytest.fixture
+async def webhook():
+    recorder = Recorder()
+    server = WebhookServer(mining_bot.bot, recorder.dispatcher, secret_token=SECRET)
+    client = TestClient(TestServer(server.create_app()))
+    await client.start_server()
+    yield client, server, recorder
+    await client.close()
+
+
+async def post(client, update, headers=HEADERS):
+    return await client.post(mining_bot.Config.WEBHOOK_PATH, json=update, headers=headers)
+
+
+async def test_recorded_updates_are_dispatched(webhook):
+    client, server, recorder = webhook
+    for update in UPDATES:
+        assert (await post(client, update)).status == 200
+    await server.drain()
+    assert sorted(recorder.handled, key=str) == sorted([
+        ('message', 5551001, '/start'),
+        ('message', 5551001, 'btc'),
+        ('callback', -1001987654321, 'menu_halving'),
+        ('message', -1001987654321, 'кто что думает по S21?'),
+    ], key=str)
+
+
+@pytest.mark.parametrize('headers', [{}, {'X-Telegram-Bot-Api-Secret-Token': 'wrong'}])
+async def test_wrong_secret_is_rejected(webhook, headers):
+    client, server, recorder = webhook
+    assert (await post(client, UPDATES[0], headers)).status == 401
+    await server.drain()
+    assert recorder.handled == []
+
+
+async def test_malformed_update_is_rejected(webhook):
+    client, _, _ = webhook
+    assert (await post(client, {'update_id': 'not-a-number'})).status == 400
+
+
+async def test_slow_handler_does_not_delay_response(webhook):
+    client, server, recorder = webhook
+    recorder.delay = 0.5
+    started = asyncio.get_running_loop().time()
+    assert (await post(client, UPDATES[1])).status == 200
+    assert asyncio.get_running_loop().time() - started < 0.25
+
+    health = await (await client.get('/health')).json()
+    assert health == {'status': 'ok', 'pending_updates': 1}
+
+
+async def test_drain_finishes_accepted_updates_and_refuses_new_ones(webhook):
+    client, server, recorder = webhook
+    recorder.delay = 0.2
+    assert (await post(client, UPDATES[1])).status == 200
+    drain = asyncio.ensure_future(server.drain())
+    await asyncio.sleep(0)
+
+    assert (await post(client, UPDATES[3])).status == 503
+    assert (await (await client.get('/health')).json())['status'] == 'stopping'
+    await drain
+    assert recorder.handled == [('message', 5551001, 'btc')]